@@ -0,0 +1,169 @@
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The final report is put together from the analysts' sections with a fixed template instead of having
+# the Editor model re-generate the whole document. Only sections that look broken (see flag_section)
+# are worth an LLM pass.
+
+DISCLAIMER = (
+    "This report is generated automatically from public market data and news by AI models and is provided "
+    "for informational purposes only. It does not constitute investment advice, an offer or a solicitation "
+    "to buy or sell any security. Figures may be incomplete, delayed or inaccurate, and the ratings and "
+    "target prices are model opinions, not guarantees of future performance. Do your own research and "
+    "consult a licensed financial advisor before making investment decisions."
+)
+
+# Sections are H2 under the report title, so their own headings start at H3
+SECTION_HEADING_LEVEL = 2
+
+MIN_SECTION_CHARS = 200
+
+_HEADING_RE = re.compile(r"^(#{1,6})(?:\s+|(?=[A-Za-z]))(.*?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+# Not a horizontal rule such as "* * *"
+_BULLET_RE = re.compile(r"^(\s*)[*+](?!(?:\s*\*)+\s*$)\s+")
+_WRAPPING_FENCE_RE = re.compile(r"^\s*```(?:markdown|md)?\s*\n(.*?)\n\s*```\s*$", re.DOTALL | re.IGNORECASE)
+_SCAFFOLDING_RE = re.compile(r"^\s*(Role|Objective|Instructions|Output|Inputs?):", re.MULTILINE)
+# Closing lines that are complete without end punctuation: "Sentiment Score: 7/10", list items, table rows
+_COMPLETE_LINE_RE = re.compile(r"^(?:[^:]{1,60}:\s*\S.*|\s*(?:[-*+]|\d+\.)\s+.*|\|.*)$")
+_REFUSAL_RE = re.compile(r"\b(I'm sorry|I am sorry|I cannot|I can't|as an AI)\b", re.IGNORECASE)
+
+
+def _lines_outside_fences(lines: list):
+    """Yields (index, line, in_fence) so that code blocks are left untouched."""
+    in_fence = False
+    for i, line in enumerate(lines):
+        if _FENCE_RE.match(line):
+            in_fence = not in_fence
+            yield i, line, True
+        else:
+            yield i, line, in_fence
+
+
+def _title_key(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", text.lower())
+
+
+def slugify(title: str) -> str:
+    """GitHub-style heading anchor ("Qualitative & Catalyst Analysis" -> "qualitative--catalyst-analysis")."""
+    slug = re.sub(r"[^\w\- ]", "", title.strip().lower())
+    return slug.replace(" ", "-")
+
+
+def normalize_section(title: str, text: str) -> str:
+    """
+    Prepares a section body for the template: unwraps a Markdown code fence around the whole answer,
+    drops a leading heading that repeats the section title and shifts the remaining headings so the
+    shallowest one sits right below the section heading.
+    """
+    text = (text or "").strip()
+    wrapped = _WRAPPING_FENCE_RE.match(text)
+    if wrapped:
+        text = wrapped.group(1).strip()
+    lines = text.split("\n")
+
+    first = next((i for i, line in enumerate(lines) if line.strip()), None)
+    if first is not None:
+        heading = _HEADING_RE.match(lines[first])
+        if heading and _title_key(heading.group(2).strip("*_ ")) == _title_key(title):
+            lines = lines[first + 1:]
+
+    levels = [len(m.group(1)) for _, line, fenced in _lines_outside_fences(lines)
+              if not fenced and (m := _HEADING_RE.match(line))]
+    shift = SECTION_HEADING_LEVEL + 1 - min(levels) if levels else 0
+    if shift:
+        for i, line, fenced in _lines_outside_fences(lines):
+            heading = None if fenced else _HEADING_RE.match(line)
+            if heading:
+                level = min(6, max(1, len(heading.group(1)) + shift))
+                lines[i] = f"{'#' * level} {heading.group(2)}"
+    return "\n".join(lines).strip()
+
+
+def lint_markdown(text: str) -> str:
+    """
+    Fixes the Markdown issues models commonly produce: headings without a space or surrounding blank
+    lines, mixed bullet markers, tables and lists glued to the preceding paragraph, trailing whitespace
+    and runs of blank lines. Code blocks are left as they are.
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    out = []
+    for _, line, fenced in _lines_outside_fences(lines):
+        if fenced:
+            out.append(line)
+            continue
+        line = line.rstrip()
+        heading = _HEADING_RE.match(line)
+        if heading:
+            line = f"{heading.group(1)} {heading.group(2)}"
+        line = _BULLET_RE.sub(r"\1- ", line)
+        previous = out[-1] if out else ""
+        starts_block = bool(heading) or (line.startswith("|") != previous.startswith("|") and line.strip()) or (
+            line.startswith("- ") and previous and not re.match(r"^\s*(-|\d+\.)\s", previous))
+        if starts_block and previous.strip():
+            out.append("")
+        if out and _HEADING_RE.match(out[-1]) and line.strip():
+            out.append("")
+        out.append(line)
+    text = re.sub(r"\n{3,}", "\n\n", "\n".join(out))
+    return text.strip() + "\n"
+
+
+def _table_is_ragged(lines: list) -> bool:
+    table = []
+    for _, line, fenced in _lines_outside_fences(lines + [""]):
+        if not fenced and line.strip().startswith("|"):
+            table.append(line.strip().strip("|").count("|"))
+            continue
+        if len(set(table)) > 1:
+            return True
+        table = []
+    return False
+
+
+def flag_section(text: str) -> list:
+    """
+    Returns the reasons a section needs an editing pass (empty if it can be used as-is): too short,
+    an unclosed code block, a table with uneven rows, leftover prompt scaffolding, a refusal, or an
+    answer cut off mid-sentence.
+    """
+    text = (text or "").strip()
+    if len(text) < MIN_SECTION_CHARS:
+        return ["too short"]
+    lines = text.split("\n")
+    reasons = []
+    if sum(1 for line in lines if _FENCE_RE.match(line)) % 2:
+        reasons.append("unclosed code block")
+    if _table_is_ragged(lines):
+        reasons.append("table rows have different column counts")
+    if _SCAFFOLDING_RE.search(text):
+        reasons.append("prompt scaffolding left in")
+    if _REFUSAL_RE.search(text):
+        reasons.append("refusal or disclaimer language")
+    last = lines[-1].strip()
+    if (re.match(r"^[A-Za-z(]", last) and re.search(r"[A-Za-z0-9,;:]$", last)
+            and not _COMPLETE_LINE_RE.match(last)):
+        reasons.append("ends mid-sentence")
+    return reasons
+
+
+def table_of_contents(titles: list) -> str:
+    return "\n".join(f"{i}. [{title}](#{slugify(title)})" for i, title in enumerate(titles, 1))
+
+
+def assemble_report(ticker: str, sections: dict, date_str: str = "N/A") -> str:
+    """Builds the final report from {section title: Markdown} with a header, table of contents and disclaimer."""
+    titles = list(sections) + ["Disclaimer"]
+    parts = [
+        f"# {ticker} Equity Research Report",
+        f"**Report Date:** {date_str}",
+        "## Contents",
+        table_of_contents(titles),
+    ]
+    for title, content in sections.items():
+        parts.append(f"## {title}")
+        parts.append(normalize_section(title, content) or "_No content was produced for this section._")
+    parts.extend(["---", "## Disclaimer", f"*{DISCLAIMER}*"])
+    return lint_markdown("\n\n".join(parts))
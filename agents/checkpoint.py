@@ -0,0 +1,60 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    Stores each stage's output on disk, keyed by a hash of the stage's inputs.
+    A checkpoint only matches when the inputs are byte-for-byte the same, so a resumed run
+    re-executes every stage whose upstream output changed.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(stage: str, inputs: dict, salt=None) -> str:
+        payload = json.dumps({"stage": stage, "inputs": inputs, "salt": salt}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _run_dir(self, run: str) -> Path:
+        return self.directory / re.sub(r'[^\w\-\.]', '_', run)
+
+    def _path(self, run: str, stage: str, key: str) -> Path:
+        return self._run_dir(run) / f"{stage}-{key[:16]}.json"
+
+    def load(self, run: str, stage: str, key: str):
+        """Returns (True, output) for a valid checkpoint, (False, None) if it is missing or unreadable."""
+        path = self._path(run, stage, key)
+        if not path.exists():
+            return False, None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring invalid checkpoint {path}: {e}")
+            return False, None
+        if record.get("key") != key or "output" not in record:
+            logger.warning(f"Ignoring mismatched checkpoint {path}")
+            return False, None
+        return True, record["output"]
+
+    def save(self, run: str, stage: str, key: str, output):
+        path = self._path(run, stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"stage": stage, "key": key, "created_at": time.time(), "output": output}, f, default=str)
+        os.replace(tmp_path, path)
+
+    def clear(self, run: str):
+        """Removes all checkpoints of a run, e.g. once its results are safely saved."""
+        shutil.rmtree(self._run_dir(run), ignore_errors=True)
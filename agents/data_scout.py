@@ -1,22 +1,76 @@
-import yfinance as yf
 import logging
-import re
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from agents.utils import query_llm
+from agents.peer_index import get_peer_index
+from agents.financials import compact_financials
+from agents.metrics import compute_metrics
+from agents.telemetry import record_fetch, submit_in_context, map_in_context
+from agents.ratelimit import get_limiter
+from agents.deadlines import check_deadline, sleep_within_deadline
+from agents.market_store import get_market_store
+from agents.symbols import extract_tickers, get_symbol_directory
+from prompts.templates import PEER_DISCOVERY_PROMPT, SYSTEM_PROMPT
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from yfinance.exceptions import YFRateLimitError
 from xai_sdk.tools import web_search
 
 logger = logging.getLogger(__name__)
 
+# Independent Yahoo requests issued at once per scout (statements, news, peer quotes)
+MAX_FETCH_WORKERS = 6
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, min=2, max=10),
+    retry=retry_if_exception_type((YFRateLimitError, ConnectionError, TimeoutError)),
+    sleep=sleep_within_deadline,
+    reraise=True
+)
+def yahoo_call(symbol: str, item: str, fetch):
+    """Runs one Yahoo request through the shared limiter, retrying only throttling and transport errors."""
+    what = f"Yahoo {item} for {symbol}"
+    check_deadline(what)
+    limiter = get_limiter("yahoo")
+    started = time.monotonic()
+    with limiter.slot(what=what):
+        try:
+            result = fetch()
+        except YFRateLimitError:
+            limiter.throttled()
+            raise
+        finally:
+            record_fetch("yahoo", symbol, item, time.monotonic() - started, cache="miss")
+    limiter.succeeded()
+    return result
+
 class DataScout:
     def __init__(self, ticker: str):
         self.ticker = ticker.upper()
-        self.stock = yf.Ticker(self.ticker)
+        self._peer_infos = {}
+        # The raw statement DataFrames from get_financials, reused by get_metrics
+        self._statements = {}
+
+    def _fetch(self, attr: str):
+        """
+        Reads a yfinance Ticker property through the shared market store, so it is fetched once per
+        process even when several scouts (or threads) need it at the same time.
+        """
+        return get_market_store().get(self.ticker, attr)
+
+    @property
+    def info(self) -> dict:
+        return self._fetch('info')
     
     def get_market_data(self) -> dict:
         """Fetches basic price and market cap data."""
         logger.info(f"Scouting market data for {self.ticker}...")
         try:
-            info = self.stock.info
+            info = self.info
+            directory = get_symbol_directory()
+            if directory is not None:
+                directory.record(self.ticker, info)
             # Fallback keys in case yfinance changes structure or data is missing
             price = info.get('currentPrice') or info.get('regularMarketPrice')
             
@@ -48,17 +102,18 @@ class DataScout:
         """Fetches income statement, balance sheet, and cash flow data."""
         logger.info(f"Scouting financials for {self.ticker}...")
         try:
-            # yfinance returns DataFrames. converting to string/dict for LLM consumption
-            # We limit to last 3 periods to save tokens
-            income_stmt = self.stock.income_stmt.iloc[:, :3].to_string() if not self.stock.income_stmt.empty else "N/A"
-            balance_sheet = self.stock.balance_sheet.iloc[:, :3].to_string() if not self.stock.balance_sheet.empty else "N/A"
-            cash_flow = self.stock.cashflow.iloc[:, :3].to_string() if not self.stock.cashflow.empty else "N/A"
-            
-            return {
-                "income_statement": income_stmt,
-                "balance_sheet": balance_sheet,
-                "cash_flow": cash_flow
-            }
+            # The three statements are separate requests, so fetch them concurrently
+            with ThreadPoolExecutor(max_workers=3) as pool:
+                statements = dict(zip(
+                    ("income_statement", "balance_sheet", "cash_flow"),
+                    map_in_context(pool, self._fetch, ("income_stmt", "balance_sheet", "cashflow"))
+                ))
+            self._statements = statements
+
+            # yfinance returns DataFrames. converting to compact tables for LLM consumption
+            # We limit to last 3 periods and the curated line items to save tokens
+            currency = self.info.get('financialCurrency') or self.info.get('currency')
+            return compact_financials(statements, currency=currency, periods=3)
         except Exception as e:
             logger.error(f"Error fetching financials: {e}")
             return {"error": str(e)}
@@ -67,7 +122,7 @@ class DataScout:
         """Fetches recent news."""
         logger.info(f"Scouting news for {self.ticker}...")
         try:
-            news = self.stock.news
+            news = self._fetch('news')
             # Clean up the news list
             formatted_news = []
             for item in news[:5]: # Top 5 news items
@@ -107,108 +162,241 @@ class DataScout:
     def identify_peers(self, sector: str = "N/A", industry: str = "N/A") -> list:
         """Identifies a pool of potential competitors using reasoning and web search."""
         logger.info(f"Identifying peers for {self.ticker}...")
-        company_name = self.stock.info.get('longName') or self.ticker
+        company_name = self.info.get('longName') or self.ticker
         try:
-            prompt = (
-                f"I need to find the top 5 direct public competitors for {company_name} ({self.ticker}). "
-                f"Sector: {sector}, Industry: {industry}. "
-                f"\n\nCRITICAL INSTRUCTIONS:\n"
-                f"1. Use web search to verify who the actual business competitors are. "
-                f"2. For each competitor, find their PRIMARY Yahoo Finance ticker symbol. "
-                f"3. Strictly use primary listings (e.g., 'BN.PA' for Danone, 'SPOT' for Spotify, 'OR.PA' for L'Oreal). "
-                f"4. Exclude {company_name} itself and all its ADRs or secondary listings. "
-                f"\nReturn ONLY a comma-separated list of the 5 ticker symbols. No extra text."
-            )
+            prompt = PEER_DISCOVERY_PROMPT.format(
+                company_name=company_name, ticker=self.ticker, sector=sector, industry=industry)
             response = query_llm(
-                system_prompt="You are a senior equity research analyst. Use web search to identify accurate primary-listing tickers for direct competitors.",
+                system_prompt=SYSTEM_PROMPT,
                 user_prompt=prompt,
                 model="grok-4-1-fast-reasoning",
-                tools=[web_search()]
+                tools=[web_search()],
+                stage="identify_peers"
             )
             
-            # Extract tickers using regex to handle any potential conversational filler
-            # Matches words that might have dots or hyphens (typical of tickers)
-            found = re.findall(r'([A-Z0-9^.-]+)', response)
-            peers = [t.strip().upper() for t in found if t.strip()]
-            
-            # Deduplicate while preserving order
-            seen = set()
-            unique_peers = [p for p in peers if not (p in seen or seen.add(p))]
-            
-            return unique_peers[:6] # Return up to 6 candidates for filtering
+            # Keep only well-formed symbols (deduplicated, in order), ignoring any conversational filler
+            return extract_tickers(response)[:6] # Return up to 6 candidates for filtering
         except Exception as e:
             logger.error(f"Error identifying peers: {e}")
             return []
 
-    def get_peer_data(self, sector: str = "N/A", industry: str = "N/A") -> dict:
-        """Fetches key metrics for competitors and filters for the best industry matches."""
-        candidates = self.identify_peers(sector, industry)
+    def _fetch_peer_infos(self, candidates: list) -> dict:
+        """Fetches the info of all candidates concurrently; popular peers usually come from the market store."""
+        if not candidates:
+            return {}
+        store = get_market_store()
+
+        directory = get_symbol_directory()
+
+        def _info(peer):
+            logger.info(f"Scouting peer data for {peer}...")
+            try:
+                info = store.get(peer, "info")
+            except Exception as e:
+                logger.warning(f"Failed to fetch data for peer {peer}: {e}")
+                return None
+            if directory is not None:
+                directory.record(peer, info)
+            return info
+
+        with ThreadPoolExecutor(max_workers=min(MAX_FETCH_WORKERS, len(candidates))) as pool:
+            return dict(zip(candidates, map_in_context(pool, _info, candidates)))
+
+    def _select_peers(self, candidates: list, sector: str = "N/A") -> dict:
+        """Fetches key metrics for the candidates and keeps the best industry matches."""
+        # Candidates the symbol directory already rules out never cost a Yahoo request
+        directory = get_symbol_directory()
+        if directory is not None:
+            candidates, dropped = directory.screen(candidates, target=self.ticker, sector=sector)
+            if dropped:
+                logger.info(f"Skipped peer candidates for {self.ticker}: "
+                            + ", ".join(f"{s} ({reason})" for s, reason in dropped.items()))
+        peer_infos = self._fetch_peer_infos(candidates)
+        target_name = self.info.get('longName')
         peer_data = {}
         
         for peer in candidates:
             if len(peer_data) >= 3:
                 break
-                
-            logger.info(f"Scouting peer data for {peer}...")
-            try:
-                p_stock = yf.Ticker(peer)
-                info = p_stock.info
-                
-                # 1. Basic Validity Check
-                price = info.get('currentPrice') or info.get('regularMarketPrice')
-                if not price:
-                    logger.warning(f"Peer {peer} has no price data, skipping.")
-                    continue
-
-                # 2. Industry/Sector Filtering
-                p_sector = info.get('sector', 'N/A')
-                p_industry = info.get('industry', 'N/A')
-                
-                # Check for same company (sometimes LLM fails to filter)
-                target_name = self.stock.info.get('longName')
-                peer_name = info.get('longName')
-                if peer_name and target_name and peer_name == target_name:
-                    logger.warning(f"Peer {peer} is actually the same company ({peer_name}). Skipping.")
-                    continue
-
-                # Be somewhat flexible but avoid completely unrelated sectors
-                # If we have a sector match, it's a strong candidate
-                if sector != "N/A" and p_sector != "N/A" and sector != p_sector:
-                    # Special handling for conglomerates or very close sectors might go here
-                    # For now, we skip to avoid outliers like UMG vs Sixt
-                    logger.warning(f"Peer {peer} sector '{p_sector}' mismatch with '{sector}'. Skipping.")
-                    continue
-
-                peer_data[peer] = {
-                    "price": price,
-                    "market_cap": info.get('marketCap', 'N/A'),
-                    "pe_ratio": info.get('trailingPE', 'N/A'),
-                    "fwd_pe": info.get('forwardPE', 'N/A'),
-                    "revenue_growth": info.get('revenueGrowth', 'N/A'),
-                    "profit_margins": info.get('profitMargins', 'N/A'),
-                    "company_name": info.get('longName') or peer
-                }
-            except Exception as e:
-                logger.warning(f"Failed to fetch data for peer {peer}: {e}")
+
+            info = peer_infos.get(peer)
+            if not info:
+                continue
+
+            # 1. Basic Validity Check
+            price = info.get('currentPrice') or info.get('regularMarketPrice')
+            if not price:
+                logger.warning(f"Peer {peer} has no price data, skipping.")
+                continue
+
+            # 2. Industry/Sector Filtering
+            p_sector = info.get('sector', 'N/A')
+            p_industry = info.get('industry', 'N/A')
+            
+            # Check for same company (sometimes LLM fails to filter)
+            peer_name = info.get('longName')
+            if peer_name and target_name and peer_name == target_name:
+                logger.warning(f"Peer {peer} is actually the same company ({peer_name}). Skipping.")
+                continue
+
+            # Be somewhat flexible but avoid completely unrelated sectors
+            # If we have a sector match, it's a strong candidate
+            if sector != "N/A" and p_sector != "N/A" and sector != p_sector:
+                # Special handling for conglomerates or very close sectors might go here
+                # For now, we skip to avoid outliers like UMG vs Sixt
+                logger.warning(f"Peer {peer} sector '{p_sector}' mismatch with '{sector}'. Skipping.")
+                continue
+
+            self._peer_infos[peer] = info
+            peer_data[peer] = {
+                "price": price,
+                "market_cap": info.get('marketCap', 'N/A'),
+                "pe_ratio": info.get('trailingPE', 'N/A'),
+                "fwd_pe": info.get('forwardPE', 'N/A'),
+                "revenue_growth": info.get('revenueGrowth', 'N/A'),
+                "profit_margins": info.get('profitMargins', 'N/A'),
+                "company_name": info.get('longName') or peer
+            }
         
         return peer_data
 
+    def _discover_peers(self, sector: str = "N/A", industry: str = "N/A") -> dict:
+        """Runs the web-search peer identification, validates the result and records it in the peer index."""
+        peer_data = self._select_peers(self.identify_peers(sector, industry), sector)
+        index = get_peer_index()
+        if index is not None and peer_data:
+            index.put(self.ticker, list(peer_data), sector, industry)
+        return peer_data
+
+    def get_peer_data(self, sector: str = "N/A", industry: str = "N/A") -> dict:
+        """
+        Fetches key metrics for competitors and filters for the best industry matches.
+        Known peer sets come from the peer index; only misses and stale entries go to the LLM.
+        """
+        index = get_peer_index()
+        if index is None:
+            return self._discover_peers(sector, industry)
+
+        entry = index.get(self.ticker)
+        if entry:
+            if index.is_stale(entry):
+                index.refresh_async(self.ticker, lambda: self._discover_peers(sector, industry))
+            logger.info(f"Using indexed peers for {self.ticker}: {', '.join(entry['peers'])}")
+            peer_data = self._select_peers(entry['peers'], sector)
+            if peer_data:
+                return peer_data
+            logger.warning(f"Indexed peers for {self.ticker} no longer validate, searching again.")
+            return self._discover_peers(sector, industry)
+
+        # Reuse relationships from related names already in the index before paying for a search
+        related = [t for t in index.related_candidates(self.ticker, industry) if t != self.ticker]
+        if len(related) >= 3:
+            logger.info(f"Using peers inferred from related names for {self.ticker}: {', '.join(related[:6])}")
+            peer_data = self._select_peers(related[:6], sector)
+            if len(peer_data) >= 3:
+                index.put(self.ticker, list(peer_data), sector, industry)
+                return peer_data
+
+        return self._discover_peers(sector, industry)
+
+    def get_metrics(self, peer_data: dict) -> dict:
+        """Computes ratios for the target and its peers locally, so the analysts don't have to."""
+        logger.info(f"Computing metrics for {self.ticker}...")
+        try:
+            # Fetched again (through the store) only if get_financials didn't run or failed
+            statements = self._statements or {
+                key: self._fetch(attr)
+                for key, attr in (("income_statement", "income_stmt"), ("balance_sheet", "balance_sheet"),
+                                  ("cash_flow", "cashflow"))
+            }
+            peer_infos = {peer: self._peer_infos[peer] for peer in peer_data if peer in self._peer_infos}
+            return compute_metrics(self.ticker, self.info, statements, peer_infos)
+        except Exception as e:
+            logger.error(f"Error computing metrics: {e}")
+            return {"error": str(e)}
+
     def gather_all(self) -> dict:
-        """Coordinates the data gathering."""
-        market_data = self.get_market_data()
-        
-        # If we can't get basic market data, don't bother with the rest
-        if "error" in market_data:
+        """Coordinates the data gathering, issuing independent requests concurrently."""
+        try:
+            return self._gather()
+        finally:
+            # Persist what was learned about the symbols seen by this scout
+            directory = get_symbol_directory()
+            if directory is not None:
+                directory.flush()
+
+    def _gather(self) -> dict:
+        pool = ThreadPoolExecutor(max_workers=3)
+        try:
+            # Statements and news don't depend on the market data, so start them right away
+            financials = submit_in_context(pool, self.get_financials)
+            news = submit_in_context(pool, self.get_news)
+            market_data = self.get_market_data()
+
+            # If we can't get basic market data, don't bother with the rest
+            if "error" in market_data:
+                return {
+                    "market_data": market_data,
+                    "financials": {},
+                    "news": [],
+                    "peer_data": {},
+                    "metrics": {}
+                }
+
+            # Peer discovery needs the sector/industry; it overlaps the statement and news fetches
+            peer_data = self.get_peer_data(market_data.get('sector'), market_data.get('industry'))
+
             return {
                 "market_data": market_data,
-                "financials": {},
-                "news": [],
-                "peer_data": {}
+                "financials": financials.result(),
+                "news": news.result(),
+                "peer_data": peer_data,
+                "metrics": self.get_metrics(peer_data)
             }
+        finally:
+            # On an early return or error, fetches already running finish in the background (their results
+            # still land in the market store) instead of holding up the scout
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+# What a scout reads from Yahoo: every item of the target, the quote of each peer
+TARGET_ITEMS = ("info", "income_stmt", "balance_sheet", "cashflow", "news")
+PEER_ITEMS = ("info",)
+
+
+def prewarm(tickers: list, workers: int = MAX_FETCH_WORKERS) -> dict:
+    """
+    Fills the market store (and its disk tier) with everything the scouts of a watchlist will read:
+    the targets' quotes, statements and news plus the quotes of their indexed peers. Symbols shared by
+    several tickers are fetched once, stale values are refetched, and requests go through the shared
+    Yahoo limiter. Returns a summary of what was fetched.
+    """
+    store = get_market_store()
+    index = get_peer_index()
+    wanted = {}
+    for ticker in (t.upper() for t in tickers):
+        wanted.setdefault(ticker, set()).update(TARGET_ITEMS)
+        entry = index.get(ticker) if index is not None else None
+        for peer in (entry or {}).get("peers", []):
+            wanted.setdefault(peer, set()).update(PEER_ITEMS)
+    requests = [(symbol, item) for symbol, items in wanted.items() for item in sorted(items)]
+    logger.info(f"Prewarming {len(requests)} Yahoo items for {len(wanted)} symbols...")
+
+    def _warm(request):
+        try:
+            store.get(*request, allow_stale=False)
+            return None
+        except Exception as e:
+            logger.warning(f"Prewarm of {request[1]} for {request[0]} failed: {e}")
+            return f"{request[0]}/{request[1]}"
 
-        return {
-            "market_data": market_data,
-            "financials": self.get_financials(),
-            "news": self.get_news(),
-            "peer_data": self.get_peer_data(market_data.get('sector'), market_data.get('industry'))
-        }
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        failed = [f for f in map_in_context(pool, _warm, requests) if f]
+    return {
+        "symbols": len(wanted),
+        "items": len(requests),
+        "failed": failed,
+        "seconds": round(time.monotonic() - started, 3),
+        "market_store": store.stats(),
+    }
@@ -0,0 +1,232 @@
+import time
+import queue
+import logging
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# Absolute deadline (time.monotonic()) and cancellation event of the code currently running.
+# Like the telemetry context they reach worker threads through submit_in_context.
+_current_deadline = contextvars.ContextVar("deadline", default=None)
+_current_cancel = contextvars.ContextVar("cancel_event", default=None)
+
+# How often blocked waits wake up to notice a cancellation
+POLL_SECONDS = 0.25
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a stage or run runs out of time.
+    Deliberately not a TimeoutError, which the retry policies treat as transient.
+    """
+
+
+class Cancelled(Exception):
+    """Raised in work that keeps running after its run was cancelled (e.g. another stage failed)."""
+
+
+@contextmanager
+def deadline_scope(seconds: float = None, cancel_event: threading.Event = None):
+    """
+    Bounds everything run from this context to `seconds` from now (never extending an outer deadline)
+    and, if given, makes `cancel_event` the cancellation signal.
+    """
+    tokens = []
+    if seconds is not None:
+        deadline = time.monotonic() + seconds
+        outer = _current_deadline.get()
+        tokens.append((_current_deadline, _current_deadline.set(deadline if outer is None else min(outer, deadline))))
+    if cancel_event is not None:
+        tokens.append((_current_cancel, _current_cancel.set(cancel_event)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def remaining() -> float:
+    """Seconds left until the current deadline, or None without one."""
+    deadline = _current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def cancelled() -> bool:
+    event = _current_cancel.get()
+    return event is not None and event.is_set()
+
+
+def check_deadline(what: str = "operation"):
+    """Raises Cancelled or DeadlineExceeded if the current context should stop working."""
+    if cancelled():
+        raise Cancelled(f"{what} cancelled")
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"{what} ran out of time")
+
+
+def wait_any(futures, timeout: float = None, what: str = "operation") -> set:
+    """
+    Waits until one of `futures` is done, `timeout` seconds pass or the current deadline/cancellation hits
+    (which raise). Returns the finished futures, empty on a plain timeout.
+    """
+    until = None if timeout is None else time.monotonic() + timeout
+    while True:
+        check_deadline(what)
+        step = POLL_SECONDS
+        left = remaining()
+        if left is not None:
+            step = min(step, max(left, 0))
+        if until is not None:
+            step = min(step, max(until - time.monotonic(), 0))
+        done, _ = wait(futures, timeout=step, return_when=FIRST_COMPLETED)
+        if done:
+            return done
+        if until is not None and time.monotonic() >= until:
+            return set()
+
+
+def sleep_within_deadline(seconds: float):
+    """
+    tenacity sleep function: backs off for `seconds`, but never past the current deadline,
+    and raises instead of retrying once the deadline is hit or the run is cancelled.
+    """
+    left = remaining()
+    if left is not None:
+        seconds = min(seconds, max(left, 0))
+    event = _current_cancel.get()
+    if event is not None:
+        event.wait(seconds)
+    else:
+        time.sleep(seconds)
+    check_deadline("retry")
+
+
+def run_detached(fn, *args, name: str = "detached") -> Future:
+    """
+    Runs fn(*args) in a daemon thread carrying the caller's context and returns a Future for the result.
+    Callers wait on it with wait_any(); a call abandoned at its deadline neither blocks the caller nor,
+    being a daemon, the interpreter's exit.
+    """
+    future = Future()
+    context = contextvars.copy_context()
+
+    def _target():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(context.run(fn, *args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_target, name=name, daemon=True).start()
+    return future
+
+
+def iterate_within_deadline(iterable, what: str = "stream"):
+    """
+    Yields the items of a blocking iterable (consumed in a daemon thread) while honouring the current
+    deadline and cancellation. The producer stops at its next item once the consumer is gone.
+    """
+    items = queue.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def _produce():
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                items.put((item, None))
+            items.put((end, None))
+        except BaseException as e:
+            items.put((end, e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(_produce,), name=f"{what}-reader", daemon=True).start()
+    try:
+        while True:
+            check_deadline(what)
+            left = remaining()
+            try:
+                item, error = items.get(timeout=POLL_SECONDS if left is None else min(POLL_SECONDS, max(left, 0)))
+            except queue.Empty:
+                continue
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+class LatencyTracker:
+    """Sliding window of successful call latencies per key (model and stage), for hedging delays."""
+
+    def __init__(self, window: int = 200):
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def add(self, key, seconds: float):
+        with self._lock:
+            self._samples[key].append(seconds)
+
+    def percentile(self, key, pct: float, min_samples: int = 1):
+        """The pct-th percentile latency of `key`, or None with fewer than min_samples observations."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+class HedgePolicy:
+    """
+    When to fire a duplicate of a slow LLM request: after the observed `percentile` latency of the same
+    model and stage, once `min_samples` calls have been seen. The first response wins.
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_samples: int = 20,
+                 min_delay: float = 1.0, max_hedges: int = 1):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_hedges = max_hedges
+        self.latencies = LatencyTracker()
+
+    def delay(self, model: str, stage: str = None):
+        """Seconds to wait before hedging a call, or None if it should not be hedged."""
+        if not self.enabled or self.max_hedges < 1:
+            return None
+        p = self.latencies.percentile((model, stage), self.percentile, self.min_samples)
+        return None if p is None else max(self.min_delay, p)
+
+    def observe(self, model: str, stage: str, seconds: float):
+        self.latencies.add((model, stage), seconds)
+
+
+_hedging = HedgePolicy()
+
+
+def configure_hedging(enabled: bool = True, **kwargs) -> HedgePolicy:
+    """Replaces the process-wide hedging policy (disabled by default)."""
+    global _hedging
+    _hedging = HedgePolicy(enabled=enabled, **kwargs)
+    if enabled:
+        logger.info(f"Hedged LLM requests enabled (after p{_hedging.percentile:g}, "
+                    f"min {_hedging.min_samples} samples).")
+    return _hedging
+
+
+def get_hedging() -> HedgePolicy:
+    return _hedging
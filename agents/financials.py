@@ -0,0 +1,104 @@
+import logging
+from agents.utils import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Line items the analysts actually use, in display order (yfinance row labels)
+INCOME_ITEMS = [
+    "Total Revenue", "Cost Of Revenue", "Gross Profit", "Research And Development",
+    "Selling General And Administration", "Operating Income", "EBITDA", "EBIT", "Interest Expense",
+    "Pretax Income", "Tax Provision", "Net Income", "Diluted EPS", "Diluted Average Shares",
+]
+BALANCE_ITEMS = [
+    "Total Assets", "Current Assets", "Cash And Cash Equivalents",
+    "Cash Cash Equivalents And Short Term Investments", "Inventory", "Accounts Receivable",
+    "Total Liabilities Net Minority Interest", "Current Liabilities", "Total Debt", "Long Term Debt",
+    "Net Debt", "Stockholders Equity", "Invested Capital", "Working Capital", "Ordinary Shares Number",
+]
+CASH_FLOW_ITEMS = [
+    "Operating Cash Flow", "Capital Expenditure", "Free Cash Flow", "Depreciation And Amortization",
+    "Stock Based Compensation", "Repurchase Of Capital Stock", "Cash Dividends Paid",
+]
+
+# Per-share values are never rescaled
+UNSCALED_ITEMS = {"Basic EPS", "Diluted EPS"}
+
+# Rows kept when none of the curated items exist (e.g. banks and insurers use other labels)
+FALLBACK_ROWS = 15
+
+SCALES = [(1e9, "B"), (1e6, "M"), (1e3, "K")]
+
+
+def _pick_scale(values: list):
+    magnitude = max((abs(v) for v in values), default=0)
+    for factor, suffix in SCALES:
+        # Aim for at most ~6 significant digits before the decimal point
+        if magnitude >= factor * 1000:
+            return factor, suffix
+    return 1, ""
+
+
+def _format_number(value: float) -> str:
+    if abs(value) >= 100:
+        return f"{value:.0f}"
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+
+def compact_statement(df, items: list = None, periods: int = 3, currency: str = None) -> str:
+    """
+    Serializes a yfinance statement DataFrame as a dense pipe-delimited table.
+    Keeps the curated items (in order), drops all-NaN rows and scales amounts to K/M/B.
+    """
+    if df is None or df.empty:
+        return "N/A"
+
+    df = df.iloc[:, :periods]
+    if items:
+        curated = df.loc[[i for i in items if i in df.index]]
+        df = curated if not curated.empty else df.head(FALLBACK_ROWS)
+    df = df.dropna(how="all")
+    if df.empty:
+        return "N/A"
+
+    scaled_values = [
+        float(v) for item, row in df.iterrows() if item not in UNSCALED_ITEMS
+        for v in row.tolist() if v == v
+    ]
+    factor, suffix = _pick_scale(scaled_values)
+
+    periods_header = [getattr(c, "year", None) or str(c)[:10] for c in df.columns]
+    unit = " ".join(u for u in (currency, suffix) if u)
+    header = f"Item ({unit})" if unit else "Item"
+    lines = [header + "|" + "|".join(str(p) for p in periods_header)]
+    for item, row in df.iterrows():
+        divisor = 1 if item in UNSCALED_ITEMS else factor
+        cells = ["" if v != v else _format_number(float(v) / divisor) for v in row.tolist()]
+        lines.append(f"{item}|" + "|".join(cells))
+    return "\n".join(lines)
+
+
+def compact_financials(statements: dict, currency: str = None, periods: int = 3) -> dict:
+    """
+    Serializes the income statement, balance sheet and cash flow DataFrames for prompts.
+    Also returns estimated prompt tokens of the previous `to_string()` layout vs. the compact one.
+    """
+    layouts = {
+        "income_statement": INCOME_ITEMS,
+        "balance_sheet": BALANCE_ITEMS,
+        "cash_flow": CASH_FLOW_ITEMS,
+    }
+    result = {}
+    before = after = 0
+    for key, items in layouts.items():
+        df = statements.get(key)
+        result[key] = compact_statement(df, items, periods=periods, currency=currency)
+        before += estimate_tokens(df.iloc[:, :periods].to_string() if df is not None and not df.empty else "N/A")
+        after += estimate_tokens(result[key])
+
+    result["token_stats"] = {
+        "estimated_tokens_before": before,
+        "estimated_tokens_after": after,
+        "reduction_pct": round(100 * (1 - after / before), 1) if before else 0.0
+    }
+    logger.info(f"Financial statements compacted: ~{before} -> ~{after} prompt tokens")
+    return result
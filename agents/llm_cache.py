@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Web-search answers go stale quickly, plain completions of identical prompts don't
+DEFAULT_TTL = 7 * DAY
+SEARCH_TTL = 6 * HOUR
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    stage TEXT,
+    content TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access);
+CREATE INDEX IF NOT EXISTS idx_responses_expires_at ON responses(expires_at);
+"""
+
+
+def _tool_fingerprint(tool) -> str:
+    """Stable representation of an xAI tool definition (protobuf messages serialize deterministically)."""
+    serialize = getattr(tool, "SerializeToString", None)
+    if serialize is not None:
+        return serialize(deterministic=True).hex()
+    return repr(tool)
+
+
+def make_key(model: str, system_prompt: str, user_prompt: str, tools: list = None) -> str:
+    """Content address of a request: identical prompt bytes, model and tool set give the same key."""
+    payload = json.dumps({
+        "model": model,
+        "system": system_prompt,
+        "user": user_prompt,
+        "tools": sorted(_tool_fingerprint(t) for t in tools or [])
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk LLM response cache backed by SQLite.
+    Entries expire after a TTL that depends on the stage, the model, and whether tools (web search) were used.
+    The least recently used entries are evicted once the total size exceeds max_bytes.
+    Every call opens its own connection and the database runs in WAL mode, so concurrent workers
+    (threads or processes) can share one file.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, default_ttl: float = DEFAULT_TTL,
+                 search_ttl: float = SEARCH_TTL, ttl_by_model: dict = None, ttl_by_stage: dict = None,
+                 bypass: bool = False):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.search_ttl = search_ttl
+        self.ttl_by_model = dict(ttl_by_model or {})
+        self.ttl_by_stage = dict(ttl_by_stage or {})
+        # Bypass skips lookups but still stores fresh responses
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def ttl_for(self, model: str, stage: str = None, tools: list = None) -> float:
+        if stage in self.ttl_by_stage:
+            return self.ttl_by_stage[stage]
+        if tools:
+            return self.search_ttl
+        return self.ttl_by_model.get(model, self.default_ttl)
+
+    def get(self, key: str):
+        """Returns the cached content, or None on a miss, an expired entry or bypass."""
+        content = None
+        if not self.bypass:
+            now = time.time()
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT content FROM responses WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+                if row:
+                    content = row[0]
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        with self._stats_lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, key: str, content: str, model: str, stage: str = None, tools: list = None, ttl: float = None):
+        now = time.time()
+        ttl = self.ttl_for(model, stage, tools) if ttl is None else ttl
+        size = len(content.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, stage, content, size, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, stage, content, size, now, now + ttl, now)
+            )
+        self.evict()
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the cache fits in max_bytes."""
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                freed = 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC"):
+                    if freed >= excess:
+                        break
+                    victims.append((key,))
+                    freed += size
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+                removed += len(victims)
+        if removed:
+            with self._stats_lock:
+                self.evictions += removed
+            logger.debug(f"LLM cache evicted {removed} entries.")
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._stats_lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": size
+            }
+
+
+# Opt-in: query_llm only consults the cache once it has been configured
+_cache = None
+
+
+def configure_llm_cache(path: str, **kwargs) -> LLMCache:
+    """Enables the process-wide LLM response cache."""
+    global _cache
+    _cache = LLMCache(path, **kwargs)
+    logger.info(f"LLM response cache enabled at {path}" + (" (bypass)" if _cache.bypass else ""))
+    return _cache
+
+
+def get_llm_cache():
+    """Returns the configured cache, or None when caching is disabled."""
+    return _cache
+
+
+def disable_llm_cache():
+    global _cache
+    _cache = None
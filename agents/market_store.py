@@ -0,0 +1,336 @@
+import os
+import sys
+import time
+import zlib
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from agents.deadlines import wait_any, DeadlineExceeded, Cancelled
+from agents.telemetry import record_fetch
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Items without a policy: long enough to cover a batch, short enough that a long-lived service doesn't
+# serve stale data
+DEFAULT_TTL = 15 * MINUTE
+
+# Item -> (seconds a value is fresh, further seconds it may still be served while it is refetched in the
+# background). Quotes move all day, news turns over within hours, statements change once a quarter.
+# Peer discovery (validating candidates) and symbol lookups (filling the symbol directory) read the
+# candidates' `info` too, so they share its policy. main.py's --cache-policy overrides entries.
+CACHE_POLICIES = {
+    "info": (5 * MINUTE, 10 * MINUTE),
+    "news": (30 * MINUTE, 2 * HOUR),
+    "income_stmt": (DAY, 6 * DAY),
+    "balance_sheet": (DAY, 6 * DAY),
+    "cashflow": (DAY, 6 * DAY),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    symbol TEXT NOT NULL,
+    item TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (symbol, item)
+);
+"""
+
+
+def estimate_size(value) -> int:
+    """Approximate in-memory size of a fetched value (DataFrames, dicts and lists of news items)."""
+    if hasattr(value, "memory_usage"):
+        try:
+            return int(value.memory_usage(deep=True).sum())
+        except (TypeError, ValueError):
+            pass
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _fetch_attribute(symbol: str, item: str):
+    import yfinance as yf
+    return getattr(yf.Ticker(symbol), item)
+
+
+class _LeaderGaveUp(Exception):
+    """Set on a shared fetch whose leader stopped at its own deadline or cancellation."""
+
+
+class DiskCache:
+    """
+    On-disk tier of the market store: one pickled, compressed value per symbol and item in SQLite.
+    Every call opens its own connection and the database runs in WAL mode, so concurrent writers
+    (threads, a batch and a prewarm in another process, ...) can share one file.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, symbol: str, item: str):
+        """Returns (value, fetched_at) or None. Unreadable entries count as missing."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT data, fetched_at FROM items WHERE symbol = ? AND item = ?",
+                                   (symbol, item)).fetchone()
+            if row is None:
+                return None
+            return pickle.loads(zlib.decompress(row[0])), row[1]
+        except (sqlite3.Error, zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logger.warning(f"Ignoring unreadable market cache entry {symbol}/{item}: {e}")
+            return None
+
+    def put(self, symbol: str, item: str, value, fetched_at: float):
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 6)
+        try:
+            with self._connect() as conn:
+                # A slower writer never replaces a newer value
+                conn.execute("INSERT INTO items (symbol, item, fetched_at, data) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (symbol, item) DO UPDATE SET fetched_at = excluded.fetched_at, "
+                             "data = excluded.data WHERE excluded.fetched_at > items.fetched_at",
+                             (symbol, item, fetched_at, data))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not persist {symbol}/{item} to the market cache: {e}")
+
+    def purge(self, older_than: float) -> int:
+        """Deletes entries fetched before the given epoch time. Returns how many were removed."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM items WHERE fetched_at < ?", (older_than,)).rowcount
+
+
+class MarketStore:
+    """
+    Process-wide memo of yfinance Ticker properties ('info', 'income_stmt', 'news', ...) keyed by symbol.
+    Concurrent requests for the same symbol and item share one in-flight fetch (single flight), and
+    results are kept, least recently used first out once `max_bytes` is exceeded, for as long as the
+    item's policy allows (see CACHE_POLICIES; other items use `ttl`). Past its fresh period a value is
+    still served during its stale period while one background fetch revalidates it.
+    With a `path`, values are also written to a DiskCache that outlives the process. Failed fetches are
+    not memoized.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL, policies: dict = None,
+                 path: str = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policies = {**CACHE_POLICIES, **(policies or {})}
+        self.disk = DiskCache(path) if path else None
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._revalidating = set()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidations = 0
+        self.evictions = 0
+        # Entries past every stale period can never be served again
+        horizons = [ttl] + [None if fresh is None else fresh + stale for fresh, stale in self.policies.values()]
+        if self.disk is not None and None not in horizons:
+            self.disk.purge(time.time() - max(horizons))
+
+    def policy(self, item: str) -> tuple:
+        """(fresh seconds or None for no expiry, stale seconds) of an item."""
+        return self.policies.get(item, (self.ttl, 0))
+
+    def _freshness(self, item: str, fetched_at: float, now: float):
+        fresh, stale = self.policy(item)
+        age = now - fetched_at
+        if fresh is None or age < fresh:
+            return "fresh"
+        if age < fresh + stale:
+            return "stale"
+        return None
+
+    def get(self, symbol: str, item: str, fetch=None, allow_stale: bool = True):
+        """
+        Returns the item of a symbol, fetching it through yahoo_call() on a miss.
+        fetch() overrides how the value is read (defaults to getattr(yf.Ticker(symbol), item)).
+        With allow_stale=False a stale value is refetched before returning (used by prewarm()).
+        """
+        key = (symbol.upper(), item)
+        with self._lock:
+            entry = self._entries.get(key)
+            state = self._freshness(item, entry["at"], time.time()) if entry is not None else None
+            if state == "stale" and not allow_stale:
+                state = None
+            if state is not None:
+                self._entries.move_to_end(key)
+                if state == "fresh":
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+            else:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+        if state is not None:
+            record_fetch("yahoo", key[0], item, 0.0, cache="hit" if state == "fresh" else "stale")
+            if state == "stale":
+                self._revalidate(key, fetch)
+            return entry["value"]
+
+        if not leader:
+            started = time.monotonic()
+            wait_any({future}, what=f"Yahoo {item} for {key[0]}")
+            if isinstance(future.exception(), _LeaderGaveUp):
+                # Not this caller's deadline: fetch again, possibly as the new leader
+                return self.get(symbol, item, fetch, allow_stale)
+            record_fetch("yahoo", key[0], item, time.monotonic() - started, cache="coalesced")
+            return future.result()
+
+        try:
+            value, fetched_at = self._load(key, fetch, allow_stale)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            # Only real fetch errors are shared; the leader's deadline, cancellation or interrupt is its own
+            shared = isinstance(e, Exception) and not isinstance(e, (DeadlineExceeded, Cancelled))
+            future.set_exception(e if shared else _LeaderGaveUp())
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            self._store(key, value, fetched_at)
+        future.set_result(value)
+        return value
+
+    def _load(self, key, fetch, allow_stale: bool):
+        """Reads a memory miss from the disk tier if it is still usable, otherwise from Yahoo."""
+        if self.disk is not None:
+            cached = self.disk.get(*key)
+            if cached is not None:
+                value, fetched_at = cached
+                state = self._freshness(key[1], fetched_at, time.time())
+                if state == "fresh" or (state == "stale" and allow_stale):
+                    with self._lock:
+                        self.disk_hits += 1
+                    record_fetch("yahoo", key[0], key[1], 0.0, cache="disk")
+                    if state == "stale":
+                        self._revalidate(key, fetch)
+                    return value, fetched_at
+        return self._fetch(key, fetch)
+
+    def _fetch(self, key, fetch):
+        from agents.data_scout import yahoo_call
+
+        value = yahoo_call(key[0], key[1], fetch or (lambda: _fetch_attribute(*key)))
+        fetched_at = time.time()
+        if self.disk is not None:
+            self.disk.put(key[0], key[1], value, fetched_at)
+        return value, fetched_at
+
+    def _revalidate(self, key, fetch):
+        """Refetches a stale value on a background thread, at most once at a time per key."""
+        with self._lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+            self.revalidations += 1
+
+        def _run():
+            try:
+                value, fetched_at = self._fetch(key, fetch)
+                with self._lock:
+                    self._store(key, value, fetched_at)
+            except Exception as e:
+                logger.warning(f"Background refresh of {key[1]} for {key[0]} failed: {e}")
+            finally:
+                with self._lock:
+                    self._revalidating.discard(key)
+
+        # A fresh thread carries no deadline or metrics context: nobody waits for this fetch
+        threading.Thread(target=_run, name=f"revalidate-{key[0]}-{key[1]}", daemon=True).start()
+
+    def _store(self, key, value, fetched_at: float):
+        # Called with the lock held
+        old = self._entries.get(key)
+        if old is not None and old["at"] > fetched_at:
+            return
+        size = estimate_size(value)
+        if old is not None:
+            del self._entries[key]
+            self._bytes -= old["size"]
+        if size > self.max_bytes:
+            return
+        self._entries[key] = {"value": value, "size": size, "at": fetched_at}
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted["size"]
+            self.evictions += 1
+
+    def peek(self, symbol: str, item: str):
+        """Returns a memoized item without fetching it (None if absent or past its stale period)."""
+        with self._lock:
+            entry = self._entries.get((symbol.upper(), item))
+        if entry is None or self._freshness(item, entry["at"], time.time()) is None:
+            return None
+        return entry["value"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure_market_store(max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL, policies: dict = None,
+                           path: str = None) -> MarketStore:
+    """Replaces the shared market data store (dropping everything memoized in memory so far)."""
+    global _store
+    with _store_lock:
+        _store = MarketStore(max_bytes=max_bytes, ttl=ttl, policies=policies, path=path)
+    return _store
+
+
+def get_market_store() -> MarketStore:
+    """Returns the process-wide market data store, creating it with the defaults on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MarketStore()
+    return _store
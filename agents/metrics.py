@@ -0,0 +1,201 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# yfinance info keys pulled into the comparison frame, for the target and every peer
+INFO_FIELDS = {
+    "marketCap": "market_cap",
+    "enterpriseValue": "enterprise_value",
+    "trailingPE": "pe_ratio",
+    "forwardPE": "fwd_pe",
+    "enterpriseToEbitda": "ev_ebitda",
+    "enterpriseToRevenue": "ev_sales",
+    "ebitda": "ebitda",
+    "totalRevenue": "revenue",
+    "freeCashflow": "free_cashflow",
+    "grossMargins": "gross_margin",
+    "operatingMargins": "operating_margin",
+    "profitMargins": "net_margin",
+    "returnOnEquity": "roe",
+    "returnOnAssets": "roa",
+    "revenueGrowth": "revenue_growth",
+    "earningsGrowth": "earnings_growth",
+    "debtToEquity": "debt_to_equity",
+}
+
+# Column -> (header, kind) for the Markdown peer table
+PEER_COLUMNS = {
+    "market_cap": ("Mkt Cap (B)", "billions"),
+    "pe_ratio": ("P/E", "multiple"),
+    "fwd_pe": ("Fwd P/E", "multiple"),
+    "ev_ebitda": ("EV/EBITDA", "multiple"),
+    "ev_sales": ("EV/Sales", "multiple"),
+    "p_fcf": ("P/FCF", "multiple"),
+    "fcf_yield": ("FCF Yield", "pct"),
+    "gross_margin": ("Gross M", "pct"),
+    "operating_margin": ("Op M", "pct"),
+    "net_margin": ("Net M", "pct"),
+    "roe": ("ROE", "pct"),
+    "revenue_growth": ("Rev Growth", "pct"),
+    "debt_to_equity": ("D/E (%)", "number"),
+}
+
+
+def _numeric(value):
+    """yfinance uses 'N/A', None, 'Infinity' and friends for missing values."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return np.nan
+    return value if np.isfinite(value) else np.nan
+
+
+def _safe_div(numerator, denominator):
+    """Element-wise division that yields NaN instead of inf or meaningless negative-denominator ratios."""
+    return numerator.div(denominator.where(denominator > 0))
+
+
+def info_frame(infos: dict) -> pd.DataFrame:
+    """Builds one row per ticker from yfinance info dicts, with missing values as NaN."""
+    rows = {
+        ticker: {col: _numeric(info.get(key)) for key, col in INFO_FIELDS.items()}
+        for ticker, info in infos.items() if info
+    }
+    return pd.DataFrame.from_dict(rows, orient="index", columns=list(INFO_FIELDS.values()), dtype=float)
+
+
+def compute_valuation(frame: pd.DataFrame) -> pd.DataFrame:
+    """Derives valuation ratios for all rows at once, filling gaps in Yahoo's own multiples."""
+    df = frame.copy()
+    df["ev_ebitda"] = df["ev_ebitda"].fillna(_safe_div(df["enterprise_value"], df["ebitda"]))
+    df["ev_sales"] = df["ev_sales"].fillna(_safe_div(df["enterprise_value"], df["revenue"]))
+    df["p_fcf"] = _safe_div(df["market_cap"], df["free_cashflow"])
+    df["fcf_yield"] = df["free_cashflow"].div(df["market_cap"].where(df["market_cap"] > 0))
+    return df
+
+
+def _row(df: pd.DataFrame, label: str) -> pd.Series:
+    if label in df.index:
+        return df.loc[label].astype(float)
+    return pd.Series(np.nan, index=df.columns, dtype=float)
+
+
+def statement_history(income: pd.DataFrame, balance: pd.DataFrame, cash_flow: pd.DataFrame,
+                      periods: int = 3) -> pd.DataFrame:
+    """
+    Computes margins, returns, growth and leverage per fiscal year from the target's statements.
+    Returns a frame indexed by metric with one column per fiscal year (most recent first).
+    """
+    if income is None or income.empty:
+        return pd.DataFrame()
+    balance = balance if balance is not None else pd.DataFrame()
+    cash_flow = cash_flow if cash_flow is not None else pd.DataFrame()
+    # Align everything on the income statement's fiscal years
+    columns = income.columns
+    balance = balance.reindex(columns=columns)
+    cash_flow = cash_flow.reindex(columns=columns)
+
+    revenue = _row(income, "Total Revenue")
+    gross = _row(income, "Gross Profit")
+    operating = _row(income, "Operating Income")
+    net = _row(income, "Net Income")
+    ebitda = _row(income, "EBITDA")
+    ebit = _row(income, "EBIT").fillna(operating)
+    pretax = _row(income, "Pretax Income")
+    tax = _row(income, "Tax Provision")
+    interest = _row(income, "Interest Expense")
+    equity = _row(balance, "Stockholders Equity")
+    invested = _row(balance, "Invested Capital")
+    total_debt = _row(balance, "Total Debt")
+    net_debt = _row(balance, "Net Debt")
+    fcf = _row(cash_flow, "Free Cash Flow")
+
+    # Columns run newest -> oldest, so the prior year is the next column
+    prior = lambda s: s.shift(-1)
+    average = lambda s: pd.concat([s, prior(s)], axis=1).mean(axis=1, skipna=False).fillna(s)
+    tax_rate = _safe_div(tax, pretax).clip(lower=0, upper=0.5).fillna(0.21)
+
+    history = pd.DataFrame({
+        "Revenue Growth": _safe_div(revenue, prior(revenue)) - 1,
+        "Gross Margin": _safe_div(gross, revenue),
+        "Operating Margin": _safe_div(operating, revenue),
+        "EBITDA Margin": _safe_div(ebitda, revenue),
+        "Net Margin": _safe_div(net, revenue),
+        "FCF Margin": _safe_div(fcf, revenue),
+        "ROE": _safe_div(net, average(equity)),
+        "ROIC": _safe_div(ebit * (1 - tax_rate), average(invested)),
+        "Net Debt / EBITDA": _safe_div(net_debt.fillna(total_debt), ebitda),
+        "Interest Coverage": _safe_div(ebit, interest.abs()),
+        "Net Income Growth": _safe_div(net, prior(net).where(prior(net) > 0)) - 1,
+    }).T
+    history.columns = [getattr(c, "year", None) or str(c)[:10] for c in columns]
+    return history.iloc[:, :periods].dropna(how="all")
+
+
+def _format(value, kind: str) -> str:
+    if value is None or pd.isna(value):
+        return "n/a"
+    if kind == "pct":
+        return f"{value * 100:.1f}%"
+    if kind == "billions":
+        return f"{value / 1e9:,.1f}"
+    if kind == "multiple":
+        return f"{value:.1f}x"
+    return f"{value:.1f}"
+
+
+def peer_comparison_table(valuation: pd.DataFrame, target: str) -> str:
+    """Markdown table with the target first, then peers, then the peer median and the target's premium to it."""
+    columns = [c for c in PEER_COLUMNS if valuation[c].notna().any()]
+    header = "| Ticker | " + " | ".join(PEER_COLUMNS[c][0] for c in columns) + " |"
+    lines = [header, "|" + "---|" * (len(columns) + 1)]
+
+    order = [target] + [t for t in valuation.index if t != target]
+    for ticker in order:
+        label = f"**{ticker}**" if ticker == target else ticker
+        cells = [_format(valuation.at[ticker, c], PEER_COLUMNS[c][1]) for c in columns]
+        lines.append(f"| {label} | " + " | ".join(cells) + " |")
+
+    peers = valuation.drop(index=target, errors="ignore")
+    if not peers.empty:
+        median = peers[columns].median()
+        lines.append("| Peer median | " + " | ".join(_format(median[c], PEER_COLUMNS[c][1]) for c in columns) + " |")
+        premium = valuation.loc[target, columns] / median.where(median > 0) - 1
+        cells = [
+            _format(premium[c], "pct") if PEER_COLUMNS[c][1] == "multiple" else "" for c in columns
+        ]
+        lines.append(f"| {target} vs median | " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+
+def history_table(history: pd.DataFrame) -> str:
+    if history.empty:
+        return "N/A"
+    lines = ["| Metric | " + " | ".join(str(c) for c in history.columns) + " |",
+             "|" + "---|" * (len(history.columns) + 1)]
+    for metric, row in history.iterrows():
+        kind = "multiple" if metric in ("Net Debt / EBITDA", "Interest Coverage") else "pct"
+        lines.append(f"| {metric} | " + " | ".join(_format(v, kind) for v in row) + " |")
+    return "\n".join(lines)
+
+
+def compute_metrics(target: str, target_info: dict, statements: dict, peer_infos: dict) -> dict:
+    """
+    Computes the target's ratio history and a peer valuation table in one vectorized pass.
+    statements holds the target's income_statement/balance_sheet/cash_flow DataFrames;
+    peer_infos maps peer ticker -> yfinance info dict.
+    """
+    valuation = compute_valuation(info_frame({target: target_info, **peer_infos}))
+    history = statement_history(statements.get("income_statement"), statements.get("balance_sheet"),
+                                statements.get("cash_flow"))
+    logger.info(f"Computed metrics for {target} and {len(valuation) - 1} peers.")
+    return {
+        "peer_comparison": peer_comparison_table(valuation, target) if target in valuation.index else "N/A",
+        "target_history": history_table(history),
+        "valuation": {
+            ticker: {k: (None if pd.isna(v) else float(v)) for k, v in row.items()}
+            for ticker, row in valuation.iterrows()
+        }
+    }
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+
+class PeerIndex:
+    """
+    Persistent index of validated peer sets, stored as a JSON file.
+    Lookups are plain dict reads; a reverse index (peer -> targets) lets related names share peer sets.
+    Stale entries are still served while a refresh runs in the background.
+    """
+
+    def __init__(self, path: str, max_age: float = DEFAULT_MAX_AGE):
+        self.path = str(path)
+        self.max_age = max_age
+        self._entries = {}
+        self._reverse = {}
+        self._lock = threading.Lock()
+        self._refreshing = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read peer index {self.path}, starting empty: {e}")
+            return
+        for ticker, entry in entries.items():
+            self._set(ticker, entry)
+
+    def _set(self, ticker: str, entry: dict):
+        old = self._entries.get(ticker)
+        if old:
+            for peer in old["peers"]:
+                self._reverse.get(peer, set()).discard(ticker)
+        self._entries[ticker] = entry
+        for peer in entry["peers"]:
+            self._reverse.setdefault(peer, set()).add(ticker)
+
+    def _save(self):
+        # Write to a temp file and swap it in, so a crash never leaves a truncated index
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    def get(self, ticker: str):
+        """Returns the entry for a ticker ({peers, sector, industry, updated_at}) or None."""
+        return self._entries.get(ticker)
+
+    def is_stale(self, entry: dict) -> bool:
+        return time.time() - entry["updated_at"] > self.max_age
+
+    def put(self, ticker: str, peers: list, sector: str = "N/A", industry: str = "N/A"):
+        """Stores a validated peer set and persists the index."""
+        entry = {
+            "peers": list(peers),
+            "sector": sector,
+            "industry": industry,
+            "updated_at": time.time()
+        }
+        with self._lock:
+            self._set(ticker, entry)
+            self._save()
+
+    def related(self, ticker: str) -> set:
+        """Tickers whose peer set contains the given ticker (reverse lookup)."""
+        return set(self._reverse.get(ticker, ()))
+
+    def related_candidates(self, ticker: str, industry: str = "N/A") -> list:
+        """
+        Peer candidates inferred from other indexed names in the same industry that list this ticker as a peer.
+        Candidates named most often come first.
+        """
+        if industry == "N/A":
+            return []
+        counts = Counter()
+        for target in self.related(ticker):
+            entry = self._entries.get(target)
+            if not entry or entry.get("industry") != industry:
+                continue
+            counts[target] += 1
+            counts.update(p for p in entry["peers"] if p != ticker)
+        return [t for t, _ in counts.most_common()]
+
+    def refresh_async(self, ticker: str, refresh) -> None:
+        """
+        Runs refresh() in a background thread unless one is already running for this ticker.
+        refresh() is responsible for storing the new entry through put().
+        """
+        with self._lock:
+            if ticker in self._refreshing:
+                return
+
+            def _run():
+                try:
+                    refresh()
+                except Exception as e:
+                    logger.warning(f"Background peer refresh for {ticker} failed: {e}")
+                finally:
+                    with self._lock:
+                        self._refreshing.pop(ticker, None)
+
+            thread = threading.Thread(target=_run, name=f"peer-refresh-{ticker}", daemon=True)
+            self._refreshing[ticker] = thread
+        logger.info(f"Peer set for {ticker} is stale, refreshing in the background...")
+        thread.start()
+
+    def wait_for_refreshes(self, timeout: float = None):
+        """Blocks until background refreshes finish, so a short-lived process doesn't drop them."""
+        with self._lock:
+            threads = list(self._refreshing.values())
+        for thread in threads:
+            thread.join(timeout)
+
+
+_index = None
+
+
+def configure_peer_index(path: str, **kwargs) -> PeerIndex:
+    """Enables the process-wide peer index."""
+    global _index
+    _index = PeerIndex(path, **kwargs)
+    return _index
+
+
+def get_peer_index():
+    """Returns the configured peer index, or None when it is disabled."""
+    return _index
@@ -0,0 +1,174 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from agents.deadlines import check_deadline, POLL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` units per second, bursts of up to `capacity`.
+    The level may go negative through charge(), which makes later callers wait off the debt.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        if rate <= 0:
+            raise ValueError(f"Token bucket rate must be > 0, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount: float = 1.0, check=None) -> float:
+        """
+        Blocks until `amount` units are available and takes them. Returns the seconds spent waiting.
+        While waiting, check() is called every POLL_SECONDS and may raise to give up.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            if check is not None:
+                check()
+            with self._lock:
+                self._refill()
+                if self._level >= amount:
+                    self._level -= amount
+                    return waited
+                delay = (amount - self._level) / self.rate
+            if check is not None:
+                delay = min(delay, POLL_SECONDS)
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, amount: float):
+        """Takes units without waiting (e.g. to settle actual usage after the fact)."""
+        with self._lock:
+            self._refill()
+            self._level -= amount
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by one slot per `limit` successes, halves on a throttling signal.
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 32):
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self, check=None):
+        """Waits for a free slot; check() is called every POLL_SECONDS and may raise to give up."""
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                if check is not None:
+                    check()
+                self._cond.wait(POLL_SECONDS if check is not None else None)
+            self._in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            previous = int(self._limit)
+            self._limit = min(self.maximum, self._limit + 1 / max(self._limit, 1))
+            if int(self._limit) > previous:
+                self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            self._limit = max(self.minimum, self._limit / 2)
+
+
+class UpstreamLimiter:
+    """
+    Shared limiter for one upstream: requests/sec, optional tokens/min and an adaptive concurrency limit.
+    Every agent and worker goes through the same instance (see get_limiter).
+    """
+
+    def __init__(self, name: str, requests_per_second: float, tokens_per_minute: float = None,
+                 initial_concurrency: int = 4, max_concurrency: int = 32):
+        self.name = name
+        self.requests = TokenBucket(requests_per_second)
+        self.tokens = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.throttle_events = 0
+
+    @contextmanager
+    def slot(self, tokens: float = 0, what: str = None):
+        """
+        Waits for a concurrency slot, a request token and `tokens` (estimated) LLM tokens. The wait honours
+        the current deadline and cancellation (see agents.deadlines), which raise instead of a slot.
+        """
+        def check():
+            check_deadline(what or f"{self.name} request")
+
+        self.concurrency.acquire(check)
+        try:
+            self.requests.acquire(check=check)
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens, check=check)
+            yield self
+        finally:
+            self.concurrency.release()
+
+    def settle_tokens(self, estimated: float, actual: float):
+        """Charges the difference between the estimated and actual token usage of a finished call."""
+        if self.tokens is not None and actual and actual > estimated:
+            self.tokens.charge(actual - estimated)
+
+    def succeeded(self):
+        self.concurrency.on_success()
+
+    def throttled(self):
+        self.throttle_events += 1
+        self.concurrency.on_throttle()
+        logger.warning(f"{self.name} throttled; concurrency limit lowered to {self.concurrency.limit}")
+
+
+# Conservative defaults; override with configure_limiter() at startup
+DEFAULT_LIMITS = {
+    "xai": {"requests_per_second": 4, "tokens_per_minute": 2_000_000, "initial_concurrency": 8, "max_concurrency": 32},
+    "yahoo": {"requests_per_second": 5, "initial_concurrency": 8, "max_concurrency": 16},
+}
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_limiter(name: str, **kwargs) -> UpstreamLimiter:
+    """Replaces the shared limiter of an upstream with one built from DEFAULT_LIMITS overridden by kwargs."""
+    settings = {**DEFAULT_LIMITS.get(name, {"requests_per_second": 5}), **kwargs}
+    limiter = UpstreamLimiter(name, **settings)
+    with _limiters_lock:
+        _limiters[name] = limiter
+    return limiter
+
+
+def get_limiter(name: str) -> UpstreamLimiter:
+    """Returns the process-wide limiter of an upstream, creating it with the defaults on first use."""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = UpstreamLimiter(name, **DEFAULT_LIMITS.get(name, {"requests_per_second": 5}))
+    return limiter
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# What counts as a material change since the inputs a stage's previous output was based on
+DEFAULT_THRESHOLDS = {
+    "price_pct": 3.0,
+    "multiple_pct": 5.0,
+    "new_headlines": 1,
+}
+
+MULTIPLE_FIELDS = ("pe_ratio", "fwd_pe", "peg_ratio")
+
+# Snapshot component -> the stages that consume it directly. A new filing (statements) also comes with
+# a new earnings call and guidance, so it re-runs the management tone research as well.
+COMPONENT_STAGES = {
+    "price": ("pm_verdict",),
+    "multiples": ("fundamental",),
+    "financials": ("fundamental", "management_tone"),
+    "peers": ("fundamental",),
+    "news": ("sentiment",),
+}
+
+# Stage -> upstream stages whose re-run forces it to run again
+UPSTREAM = {
+    "management_tone": (),
+    "fundamental": (),
+    "sentiment": ("management_tone",),
+    "pm_verdict": ("fundamental", "sentiment"),
+    "editor": ("fundamental", "sentiment", "pm_verdict"),
+}
+
+STAGES = tuple(UPSTREAM)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def snapshot_basis(snapshot: dict) -> dict:
+    """The parts of a DataScout snapshot the LLM stages depend on, reduced to comparable values."""
+    market = snapshot.get("market_data") or {}
+    financials = snapshot.get("financials") or {}
+    statements = "\n".join(str(financials.get(k)) for k in ("income_statement", "balance_sheet", "cash_flow"))
+    return {
+        "price": _number(market.get("current_price")),
+        "multiples": {field: _number(market.get(field)) for field in MULTIPLE_FIELDS},
+        "financials": hashlib.sha256(statements.encode("utf-8")).hexdigest()[:16],
+        "news": sorted({item.get("title") for item in snapshot.get("news") or [] if item.get("title")}),
+        "peers": sorted(snapshot.get("peer_data") or {}),
+    }
+
+
+def _pct_change(old, new):
+    if old is None or new is None:
+        return None if old == new else float("inf")
+    if old == 0:
+        return 0.0 if new == 0 else float("inf")
+    return abs(new / old - 1) * 100
+
+
+def diff_basis(previous: dict, current: dict, thresholds: dict = None) -> dict:
+    """Returns component -> description for every component that changed materially."""
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    changes = {}
+
+    move = _pct_change(previous.get("price"), current.get("price"))
+    if move is not None and move >= thresholds["price_pct"]:
+        changes["price"] = f"price {previous.get('price')} -> {current.get('price')} ({move:.1f}%)"
+
+    moved = []
+    for field in MULTIPLE_FIELDS:
+        old, new = (previous.get("multiples") or {}).get(field), (current.get("multiples") or {}).get(field)
+        move = _pct_change(old, new)
+        if move is not None and move >= thresholds["multiple_pct"]:
+            moved.append(f"{field} {old} -> {new}")
+    if moved:
+        changes["multiples"] = ", ".join(moved)
+
+    if previous.get("financials") != current.get("financials"):
+        changes["financials"] = "statements changed (new filing or restatement)"
+
+    new_headlines = sorted(set(current.get("news") or []) - set(previous.get("news") or []))
+    if len(new_headlines) >= thresholds["new_headlines"]:
+        changes["news"] = f"{len(new_headlines)} new headline(s)"
+
+    if previous.get("peers") != current.get("peers"):
+        changes["peers"] = f"peers {', '.join(previous.get('peers') or [])} -> {', '.join(current.get('peers') or [])}"
+    return changes
+
+
+def plan_refresh(previous_basis: dict, current_basis: dict, available: set, thresholds: dict = None) -> dict:
+    """
+    Decides which stages must run again: the consumers of changed components, stages without a previous
+    output to reuse, and everything downstream of them. Also returns the basis to record for the new run,
+    where each component keeps its old value unless the stage consuming it ran again.
+    """
+    changes = diff_basis(previous_basis, current_basis, thresholds)
+    rerun = {s for c in changes for s in COMPONENT_STAGES[c]} | {s for s in STAGES if s not in available}
+    for stage in STAGES:
+        if any(u in rerun for u in UPSTREAM[stage]):
+            rerun.add(stage)
+    basis = {
+        component: current_basis[component] if all(s in rerun for s in stages) else previous_basis.get(component)
+        for component, stages in COMPONENT_STAGES.items()
+    }
+    return {
+        "changes": changes,
+        "rerun": [s for s in STAGES if s in rerun],
+        "reuse": [s for s in STAGES if s not in rerun],
+        "basis": basis,
+    }
+
+
+NOTE_PREFIX = "> **Price update"
+
+
+def with_price_update(report: str, market_data: dict, basis_price, date: str, analysis_date: str) -> str:
+    """
+    Returns a reused report with a note on the current price under its title, replacing the note of an
+    earlier refresh.
+    """
+    lines = [line for line in report.split("\n") if not line.startswith(NOTE_PREFIX)]
+    price = market_data.get("current_price")
+    move = ""
+    if _number(price) is not None and _number(basis_price):
+        move = f" ({(float(price) / float(basis_price) - 1) * 100:+.1f}% since the analysis)"
+    note = (f"{NOTE_PREFIX} {date}:** {price} {market_data.get('currency', '')}{move}. "
+            f"The analysis is from {analysis_date}; inputs have not changed materially since.")
+    at = 1 if lines and lines[0].startswith("#") else 0
+    return "\n".join(lines[:at] + ["", note] + lines[at:]).replace("\n\n\n", "\n\n")
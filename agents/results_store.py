@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Every payload is stored once, zlib-compressed and addressed by the sha256 of its canonical JSON.
+# Runs only reference payloads, so the statements, peer data and news shared by many runs (same ticker
+# on the same day, retried batches, ...) cost their size once. The runs table carries the fields
+# queries need (ticker, time, rating, target price) so they never touch a payload.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ticker TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    company_name TEXT,
+    currency TEXT,
+    price REAL,
+    rating TEXT,
+    target_price REAL,
+    target_low REAL,
+    target_high REAL,
+    duration_seconds REAL,
+    report_path TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_ticker_created ON runs (ticker, created_at DESC);
+CREATE INDEX IF NOT EXISTS runs_rating ON runs (rating);
+CREATE TABLE IF NOT EXISTS run_payloads (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    hash TEXT NOT NULL REFERENCES blobs (hash),
+    PRIMARY KEY (run_id, name)
+);
+"""
+
+RUN_COLUMNS = ("id", "ticker", "timestamp", "created_at", "company_name", "currency", "price", "rating",
+               "target_price", "target_low", "target_high", "duration_seconds", "report_path")
+
+RATINGS = ("STRONG BUY", "STRONG SELL", "BUY", "HOLD", "SELL")
+
+_RATING_RE = re.compile(r"\b(" + "|".join(RATINGS) + r")\b", re.IGNORECASE)
+# A whole number that is not a percentage ("12% upside" is not a price)
+_NUMBER = r"(?<![\d.,])(\d[\d,]*(?:\.\d+)?)(?![\d.,]*\s*%)"
+# Between "target price" and the price: words, a parenthetical such as "(12-month)" and percentages
+_TARGET_GAP = r"(?:\([^)\n]{0,30}\)|\d[\d,]*(?:\.\d+)?\s*%|[^\d\n(]){0,40}?"
+_TARGET_RE = re.compile(
+    r"target(?:\s+price)?(?:\s+range)?" + _TARGET_GAP + _NUMBER +
+    r"(?:\s*(?:-|–|—|to)\s*[^\d\n]{0,4}" + _NUMBER + r")?",
+    re.IGNORECASE)
+
+
+def parse_verdict(text: str) -> dict:
+    """
+    Pulls the rating and target price (a range is kept as low/high with its midpoint as target) out of
+    the Portfolio Manager's verdict. Missing values are None.
+
+    >>> parse_verdict("**Rating: BUY** **Target Price (12-month):** $250")["target_price"]
+    250.0
+    >>> parse_verdict("Price target of 12% upside to $150")["target_price"]
+    150.0
+    >>> parse_verdict("**Target Price Range:** $140 - $160")["target_price"]
+    150.0
+    """
+    verdict = {"rating": None, "target_price": None, "target_low": None, "target_high": None}
+    if not text:
+        return verdict
+    # The prompt asks for the rating first, so the first mention after the word "rating" wins
+    anchor = re.search(r"rating", text, re.IGNORECASE)
+    rating = _RATING_RE.search(text, anchor.start() if anchor else 0) or _RATING_RE.search(text)
+    if rating:
+        verdict["rating"] = " ".join(rating.group(1).upper().split())
+    target = _TARGET_RE.search(text)
+    if target:
+        low = float(target.group(1).replace(",", ""))
+        high = float(target.group(2).replace(",", "")) if target.group(2) else low
+        low, high = min(low, high), max(low, high)
+        verdict.update(target_low=low, target_high=high, target_price=round((low + high) / 2, 4))
+    return verdict
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultsStore:
+    """
+    SQLite index of analysis runs with deduplicated, compressed payloads (reports, intermediate outputs,
+    raw data snapshots, performance). Safe to share between threads and processes.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    @staticmethod
+    def _encode(payload) -> bytes:
+        return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+    def _put_blob(self, conn, payload) -> str:
+        data = self._encode(payload)
+        digest = hashlib.sha256(data).hexdigest()
+        compressed = zlib.compress(data, 6)
+        conn.execute("INSERT OR IGNORE INTO blobs (hash, data, size, stored_size) VALUES (?, ?, ?, ?)",
+                     (digest, compressed, len(data), len(compressed)))
+        return digest
+
+    def save_run(self, ticker: str, timestamp: str, report: str, metadata: dict, report_path: str = None,
+                 created_at: float = None) -> int:
+        """
+        Stores one run: the report, every top-level metadata field and every part of the raw data
+        snapshot become separate (deduplicated) payloads. Returns the run id.
+        """
+        payloads = {"report": report} if report is not None else {}
+        for name, value in metadata.items():
+            if name == "raw_data_snapshot" and isinstance(value, dict):
+                payloads.update({f"raw_data_snapshot.{part}": v for part, v in value.items()})
+            elif name == "intermediate_outputs" and isinstance(value, dict):
+                payloads.update({f"intermediate_outputs.{part}": v for part, v in value.items()})
+            elif name not in ("ticker", "timestamp"):
+                payloads[name] = value
+
+        market = (metadata.get("raw_data_snapshot") or {}).get("market_data") or {}
+        verdict = parse_verdict((metadata.get("intermediate_outputs") or {}).get("pm_verdict"))
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO runs (ticker, timestamp, created_at, company_name, currency, price, rating, "
+                "target_price, target_low, target_high, duration_seconds, report_path) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (ticker, timestamp, created_at or time.time(), market.get("company_name"), market.get("currency"),
+                 _number(market.get("current_price")), verdict["rating"], verdict["target_price"],
+                 verdict["target_low"], verdict["target_high"], _number(metadata.get("duration_seconds")),
+                 report_path))
+            run_id = cursor.lastrowid
+            conn.executemany("INSERT INTO run_payloads (run_id, name, hash) VALUES (?, ?, ?)",
+                             [(run_id, name, self._put_blob(conn, value)) for name, value in payloads.items()])
+        logger.info(f"Stored run {run_id} of {ticker} (rating: {verdict['rating']}, target: {verdict['target_price']})")
+        return run_id
+
+    def import_file(self, meta_path: str) -> int:
+        """
+        Imports a run saved as TICKER-TIMESTAMP.json (+ .md report) by earlier versions and returns its id.
+        A run already in the store (same ticker and timestamp) is not imported again.
+        """
+        with open(meta_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        with self._connect() as conn:
+            existing = conn.execute("SELECT id FROM runs WHERE ticker = ? AND timestamp = ?",
+                                    (metadata["ticker"], metadata.get("timestamp", ""))).fetchone()
+        if existing:
+            return existing[0]
+        report_path = os.path.splitext(meta_path)[0] + ".md"
+        report = None
+        if os.path.exists(report_path):
+            with open(report_path, "r", encoding="utf-8") as f:
+                report = f.read()
+        try:
+            created_at = time.mktime(time.strptime(metadata["timestamp"], "%Y-%m-%d_%H-%M-%S"))
+        except (KeyError, ValueError):
+            created_at = os.path.getmtime(meta_path)
+        return self.save_run(metadata["ticker"], metadata.get("timestamp", ""), report, metadata,
+                             report_path=report_path if report is not None else None, created_at=created_at)
+
+    def _rows(self, sql: str, params: tuple = ()) -> list:
+        with self._connect() as conn:
+            return [dict(zip(RUN_COLUMNS, row)) for row in conn.execute(sql, params)]
+
+    def latest(self, tickers: list = None) -> list:
+        """The most recent run of every ticker (or of the given tickers), newest first. No payloads are read."""
+        columns = ", ".join(RUN_COLUMNS)
+        sql = (f"SELECT {columns} FROM runs r WHERE id = "
+               f"(SELECT id FROM runs WHERE ticker = r.ticker ORDER BY created_at DESC, id DESC LIMIT 1)")
+        params = ()
+        if tickers:
+            sql += f" AND ticker IN ({', '.join('?' * len(tickers))})"
+            params = tuple(tickers)
+        return self._rows(sql + " ORDER BY created_at DESC", params)
+
+    def runs(self, ticker: str = None, rating: str = None, since: float = None, limit: int = 100) -> list:
+        """Run index rows filtered by ticker, rating and creation time (epoch seconds), newest first."""
+        clauses, params = [], []
+        for column, op, value in (("ticker", "=", ticker), ("rating", "=", rating), ("created_at", ">=", since)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._rows(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs{where} ORDER BY created_at DESC, id DESC "
+                          f"LIMIT ?", (*params, limit))
+
+    def load(self, run_id: int, names: list = None) -> dict:
+        """
+        Reassembles a run's payloads into {"report": ..., <metadata fields>...}, with the raw data snapshot
+        and intermediate outputs nested again. names restricts which payloads are read (e.g. ["report"]).
+        """
+        sql = ("SELECT p.name, b.data FROM run_payloads p JOIN blobs b ON b.hash = p.hash WHERE p.run_id = ?")
+        params = [run_id]
+        if names:
+            sql += f" AND p.name IN ({', '.join('?' * len(names))})"
+            params.extend(names)
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        result = {}
+        for name, data in rows:
+            value = json.loads(zlib.decompress(data))
+            group, _, part = name.partition(".")
+            if part:
+                result.setdefault(group, {})[part] = value
+            else:
+                result[name] = value
+        return result
+
+    def stats(self) -> dict:
+        with self._connect() as conn:
+            runs = conn.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            blobs, size, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored_size), 0) FROM blobs").fetchone()
+            referenced = conn.execute(
+                "SELECT COALESCE(SUM(b.size), 0) FROM run_payloads p JOIN blobs b ON b.hash = p.hash").fetchone()[0]
+        return {"runs": runs, "blobs": blobs, "payload_bytes": referenced, "unique_bytes": size,
+                "stored_bytes": stored}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure_results_store(path) -> ResultsStore:
+    global _store
+    with _store_lock:
+        _store = ResultsStore(path)
+    return _store
+
+
+def get_results_store():
+    """Returns the configured results store, or None if results are only written as files."""
+    return _store
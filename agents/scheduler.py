@@ -0,0 +1,160 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from agents.telemetry import submit_in_context, stage_context
+from agents.deadlines import deadline_scope, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Extra time a stage gets past its deadline to stop on its own before the graph gives up on it
+DEADLINE_GRACE_SECONDS = 1.0
+
+
+class StageError(Exception):
+    """Raised when a stage of a StageGraph fails. The original error is chained."""
+
+    def __init__(self, stage: str, error: Exception):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+
+class StageGraph:
+    """
+    Minimal thread-based DAG executor.
+    Each stage declares the stages it depends on and is started as soon as all of them have finished.
+    A stage function receives its inputs as keyword arguments named after the input stages.
+    With a CheckpointStore every stage output is saved under a hash of its inputs (plus the stage's salt),
+    and with resume=True a matching checkpoint is loaded instead of running the stage again.
+    Stages and whole runs can have deadlines. When a stage fails or runs out of time, the stages still
+    running are cancelled: their LLM and Yahoo calls stop waiting and raise (see agents.deadlines).
+    """
+
+    def __init__(self, name: str = "pipeline", checkpoints=None, resume: bool = False):
+        self.name = name
+        self.checkpoints = checkpoints
+        self.resume = resume
+        self._stages = {}
+        self.timings = {}
+
+    def add(self, name: str, func, inputs: tuple = (), salt=None, deadline: float = None):
+        """
+        Registers a stage. Inputs must already be registered, which also rules out cycles.
+        salt is mixed into the checkpoint key for anything else the output depends on (e.g. the date).
+        deadline is the number of seconds the stage may run once started.
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already registered.")
+        missing = [i for i in inputs if i not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {', '.join(missing)}")
+        self._stages[name] = {"func": func, "inputs": tuple(inputs), "salt": salt, "deadline": deadline}
+        return self
+
+    def run(self, max_workers: int = None, deadline: float = None) -> dict:
+        """
+        Executes the graph and returns a dict of stage name -> output.
+        deadline bounds the whole run in seconds; running out raises StageError with a DeadlineExceeded.
+        """
+        outputs = {}
+        pending = dict(self._stages)
+        running = {}
+        started = {}
+        self.timings = {}
+        origin = time.monotonic()
+        run_deadline = None if deadline is None else origin + deadline
+        cancel = threading.Event()
+
+        def _execute(name, func, kwargs):
+            start = time.monotonic()
+            resumed = False
+            try:
+                with deadline_scope(self._stages[name]["deadline"]):
+                    if self.checkpoints is None:
+                        with stage_context(name):
+                            return func(**kwargs)
+                    key = self.checkpoints.key(name, kwargs, self._stages[name]["salt"])
+                    if self.resume:
+                        resumed, output = self.checkpoints.load(self.name, name, key)
+                        if resumed:
+                            logger.info(f"[{self.name}] Resumed stage '{name}' from checkpoint")
+                            return output
+                    with stage_context(name):
+                        output = func(**kwargs)
+                    self.checkpoints.save(self.name, name, key, output)
+                    return output
+            finally:
+                end = time.monotonic()
+                self.timings[name] = {
+                    "start": round(start - origin, 3),
+                    "end": round(end - origin, 3),
+                    "duration": round(end - start, 3),
+                    "inputs": list(self._stages[name]["inputs"]),
+                    "resumed": resumed
+                }
+
+        def _expiries() -> dict:
+            # Stage name -> the moment the graph stops waiting for it
+            expiries = {}
+            for name in running.values():
+                limit = self._stages[name]["deadline"]
+                if limit is not None:
+                    expiries[name] = started[name] + limit + DEADLINE_GRACE_SECONDS
+                if run_deadline is not None:
+                    expiries[name] = min(expiries.get(name, run_deadline), run_deadline)
+            return expiries
+
+        pool = ThreadPoolExecutor(max_workers=max_workers or len(self._stages) or 1,
+                                  thread_name_prefix=f"{self.name}-stage")
+        failed = True
+        try:
+            # Stages inherit the run deadline and the cancellation signal through the context
+            with deadline_scope(deadline, cancel_event=cancel):
+                while pending or running:
+                    ready = [n for n, s in pending.items() if all(i in outputs for i in s["inputs"])]
+                    for name in ready:
+                        stage = pending.pop(name)
+                        kwargs = {i: outputs[i] for i in stage["inputs"]}
+                        logger.debug(f"[{self.name}] Starting stage '{name}'")
+                        # By default the pool has a thread per stage, so a submitted stage starts right away
+                        started[name] = time.monotonic()
+                        running[submit_in_context(pool, _execute, name, stage["func"], kwargs)] = name
+
+                    expiries = _expiries()
+                    timeout = max(0.0, min(expiries.values()) - time.monotonic()) if expiries else None
+                    done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            outputs[name] = future.result()
+                        except Exception as e:
+                            raise StageError(name, e) from e
+                    if not done:
+                        name, expiry = min(_expiries().items(), key=lambda item: item[1])
+                        if expiry <= time.monotonic():
+                            scope = "run" if expiry == run_deadline else "stage"
+                            limit = deadline if scope == "run" else self._stages[name]["deadline"]
+                            raise StageError(name, DeadlineExceeded(f"{scope} deadline of {limit:g}s exceeded"))
+            failed = False
+        finally:
+            if failed:
+                # Stop the stages still running instead of paying for work nobody will use
+                cancel.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        return outputs
+
+    def critical_path(self) -> list:
+        """Returns the chain of stages that determined the total run time, in execution order."""
+        if not self.timings:
+            return []
+        current = max(self.timings, key=lambda n: (self.timings[n]["end"], self.timings[n]["start"]))
+        path = [current]
+        while True:
+            inputs = [i for i in self.timings[current]["inputs"] if i in self.timings]
+            if not inputs:
+                break
+            current = max(inputs, key=lambda n: self.timings[n]["end"])
+            path.append(current)
+        return list(reversed(path))
@@ -0,0 +1,492 @@
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from agents.telemetry import map_in_context
+from agents.market_store import get_market_store
+from agents.symbols import get_symbol_directory
+
+logger = logging.getLogger(__name__)
+
+# The universe is a columnar store of daily closes and a few quote fields for thousands of symbols,
+# kept as raw NumPy arrays that are memory-mapped from disk. A screen reads only the trailing window of
+# the close matrix, so ranking the whole universe is a handful of vectorized passes and the expensive
+# pipeline only runs for the names that make the shortlist.
+#
+#   meta.json         symbols, sectors, number of stored days and the current array files (swapped in
+#                     last, so it defines what is valid)
+#   dates.i4          day numbers (days since 1970-01-01), one per row
+#   close.N.f4        float32 closes, one row per day and one column per symbol; new days are appended
+#   fundamentals.N.f8 float64, one row per symbol and one column per FUNDAMENTALS entry
+#
+# Days are appended past the valid length, which an interrupted update leaves harmless. Whenever an array
+# changes shape it is written to a new generation N instead; meta.json switches to it atomically and the
+# files it no longer names are removed.
+
+# Kind of array -> (file name without generation, extension, dtype)
+ARRAYS = {
+    "close": ("close", "f4", np.float32),
+    "fundamentals": ("fundamentals", "f8", np.float64),
+}
+
+# Column -> yfinance info key
+INFO_FIELDS = {
+    "pe_ratio": "trailingPE",
+    "fwd_pe": "forwardPE",
+    "beta": "beta",
+    "market_cap": "marketCap",
+}
+FUNDAMENTALS = tuple(INFO_FIELDS) + ("updated_at",)
+
+# Calendar days of history loaded for a new symbol (a trading year plus some slack)
+DEFAULT_HISTORY_DAYS = 400
+# Quote fields barely matter day to day for a screen; refetch them weekly
+INFO_MAX_AGE = 7 * 24 * 3600
+# Symbols per bulk history request. A request fetches its symbols one after another in one Yahoo limiter
+# slot and is charged one request token per symbol.
+DOWNLOAD_CHUNK = 50
+
+# Trading days of the 52-week window and of the momentum lookback
+YEAR_DAYS = 252
+MOMENTUM_DAYS = 126
+
+DEFAULT_CRITERIA = {
+    "min_history_days": MOMENTUM_DAYS + 1,
+    "max_pe_vs_sector": None,
+    "min_momentum": None,
+    "max_beta": None,
+    "min_range_position": None,
+    "max_range_position": None,
+    "min_market_cap": None,
+}
+
+# Factor -> weight in the composite score; a negative weight ranks low values first (cheap vs sector)
+DEFAULT_WEIGHTS = {
+    "pe_vs_sector": -1.0,
+    "momentum": 1.0,
+}
+
+# Criterion -> (factor, comparison)
+_BOUNDS = {
+    "max_pe_vs_sector": ("pe_vs_sector", np.less_equal),
+    "min_momentum": ("momentum", np.greater_equal),
+    "max_beta": ("beta", np.less_equal),
+    "min_range_position": ("range_position", np.greater_equal),
+    "max_range_position": ("range_position", np.less_equal),
+    "min_market_cap": ("market_cap", np.greater_equal),
+}
+
+
+def day_number(day) -> int:
+    return int(np.datetime64(day, "D").astype(np.int64))
+
+
+def _percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """Cross-sectional rank of each value in [0, 1]; NaNs get the neutral 0.5."""
+    ranks = np.full(values.shape, 0.5)
+    valid = ~np.isnan(values)
+    count = int(valid.sum())
+    if count > 1:
+        ranks[valid] = values[valid].argsort().argsort() / (count - 1)
+    return ranks
+
+
+class UniverseStore:
+    """
+    Memory-mapped daily closes and quote fields of a screening universe (see the layout above).
+    update() bulk-loads new symbols and appends the latest days for all of them; factors() and screen()
+    work on whole columns at once. One process writes at a time; readers map the files on demand.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._load()
+
+    def _file(self, name: str) -> Path:
+        return self.path / name
+
+    def _load(self):
+        self.symbols = []
+        self.sectors = []
+        self.days = 0
+        self._index = {}
+        self._files = {kind: f"{name}.0.{ext}" for kind, (name, ext, _) in ARRAYS.items()}
+        self._generation = 0
+        meta_path = self._file("meta.json")
+        if not meta_path.exists():
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read universe metadata {meta_path}, starting empty: {e}")
+            return
+        self.symbols = meta["symbols"]
+        self.sectors = meta["sectors"]
+        self.days = meta["days"]
+        self._files = meta["files"]
+        self._generation = meta["generation"]
+        self._index = {s: i for i, s in enumerate(self.symbols)}
+
+    def _save_meta(self):
+        meta = {"symbols": self.symbols, "sectors": self.sectors, "days": self.days, "files": self._files,
+                "generation": self._generation, "updated_at": time.time()}
+        self._replace("meta.json", json.dumps(meta).encode("utf-8"))
+        # Earlier generations, and the ones an interrupted update never got to swap in
+        for name, ext, _ in ARRAYS.values():
+            for stale in self.path.glob(f"{name}.*.{ext}"):
+                if stale.name not in self._files.values():
+                    stale.unlink(missing_ok=True)
+
+    def _rewrite(self, kind: str, array: np.ndarray):
+        """Writes an array as a new generation; it becomes current once meta.json is saved."""
+        name, ext, dtype = ARRAYS[kind]
+        self._generation += 1
+        self._files[kind] = f"{name}.{self._generation}.{ext}"
+        self._replace(self._files[kind], np.ascontiguousarray(array, dtype=dtype).tobytes())
+
+    def _replace(self, name: str, data: bytes):
+        # Temp file and swap, so readers never map a half-written file
+        tmp_path = self._file(f"{name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self._file(name))
+
+    def _map(self, name: str, dtype, shape: tuple, mode: str = "r"):
+        if not all(shape):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode=mode, shape=shape)
+
+    def _append(self, name: str, array: np.ndarray, valid_bytes: int):
+        # Bytes past the valid length are left over from an interrupted update
+        with open(self._file(name), "ab") as f:
+            f.truncate(valid_bytes)
+            f.write(np.ascontiguousarray(array).tobytes())
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self._map("dates.i4", np.int32, (self.days,))
+
+    def closes(self, window: int = None) -> np.ndarray:
+        """The last `window` rows of the close matrix (days x symbols), still memory-mapped."""
+        closes = self._map(self._files["close"], np.float32, (self.days, len(self.symbols)))
+        return closes[-window:] if window else closes
+
+    def fundamentals(self) -> np.ndarray:
+        return self._map(self._files["fundamentals"], np.float64, (len(self.symbols), len(FUNDAMENTALS)))
+
+    # --- Loading ---
+
+    def update(self, symbols: list = (), history_days: int = DEFAULT_HISTORY_DAYS,
+               info_max_age: float = INFO_MAX_AGE, workers: int = 8) -> dict:
+        """
+        Adds symbols to the universe and brings it up to date: new symbols get `history_days` of daily
+        closes, known ones the days since the last stored one (which is reloaded, as it may have been
+        taken intraday), and quote fields older than `info_max_age` are refetched. Returns a summary.
+        The closes are saved before the quote fields are fetched; if the update is interrupted, the store
+        stays as it was at the last save.
+        """
+        started = time.monotonic()
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            added = list(dict.fromkeys(s.upper() for s in symbols if s.upper() not in self._index))
+            if self.days:
+                known, backfill = list(self.symbols), added
+                backfill_start = int(self.dates[0])
+                known_start = int(self.dates[-1])
+            else:
+                known, backfill = [], list(self.symbols) + added
+                backfill_start = day_number(date.today()) - history_days
+                known_start = None
+
+            try:
+                frames = []
+                if known:
+                    frames.append(self._download(known, known_start, workers))
+                if backfill:
+                    frames.append(self._download(backfill, backfill_start, workers))
+                self._add_symbols(added)
+                rows = self._write_closes(frames)
+                self._save_meta()
+                refreshed = self._refresh_fundamentals(info_max_age, workers)
+                self._save_meta()
+            except BaseException:
+                # Drop the unsaved changes; new-generation files are removed by the next save
+                self._load()
+                raise
+
+        summary = {
+            "symbols": len(self.symbols),
+            "added": len(added),
+            "days": self.days,
+            "rows_written": rows,
+            "fundamentals_refreshed": refreshed,
+            "seconds": round(time.monotonic() - started, 3),
+        }
+        logger.info(f"Universe updated: {summary}")
+        return summary
+
+    def _download(self, symbols: list, start_day: int, workers: int = 8):
+        """Daily closes from start_day on as a DataFrame (dates x symbols), in bulk requests."""
+        import pandas as pd
+        import yfinance as yf
+        from agents.data_scout import yahoo_call
+        from agents.ratelimit import get_limiter
+
+        start = str(np.datetime64(start_day, "D"))
+
+        def _chunk(chunk):
+            logger.info(f"Loading daily closes of {len(chunk)} symbols since {start}...")
+            try:
+                # No yfinance threads: the limiter slot covers one request at a time
+                frame = yahoo_call(f"{len(chunk)} symbols", "history", lambda: yf.download(
+                    chunk, start=start, interval="1d", auto_adjust=True, threads=False, progress=False))
+            except Exception as e:
+                logger.warning(f"Could not load closes of {chunk[0]}..{chunk[-1]}: {e}")
+                return None
+            finally:
+                get_limiter("yahoo").requests.charge(len(chunk) - 1)
+            if frame is None or frame.empty:
+                return None
+            closes = frame["Close"]
+            if isinstance(closes, pd.Series):
+                closes = closes.to_frame(chunk[0])
+            return closes
+
+        chunks = [symbols[i:i + DOWNLOAD_CHUNK] for i in range(0, len(symbols), DOWNLOAD_CHUNK)]
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+            frames = [f for f in map_in_context(pool, _chunk, chunks) if f is not None]
+        return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+    def _add_symbols(self, added: list):
+        if not added:
+            return
+        old = len(self.symbols)
+        new = old + len(added)
+        if self.days:
+            closes = np.full((self.days, new), np.nan, dtype=np.float32)
+            closes[:, :old] = self.closes()
+            self._rewrite("close", closes)
+        fundamentals = np.full((new, len(FUNDAMENTALS)), np.nan)
+        fundamentals[:old] = self.fundamentals()
+        self._rewrite("fundamentals", fundamentals)
+        self.symbols.extend(added)
+        self.sectors.extend([""] * len(added))
+        self._index = {s: i for i, s in enumerate(self.symbols)}
+
+    def _write_closes(self, frames: list) -> int:
+        """Overwrites stored days and appends later ones; days inside the stored range that are missing are skipped."""
+        import pandas as pd
+
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return 0
+        closes = pd.concat(frames, axis=1).sort_index()
+        closes = closes.loc[:, [c for c in closes.columns if c in self._index]]
+        index = pd.DatetimeIndex(closes.index)
+        if index.tz is not None:
+            index = index.tz_localize(None)
+        days = index.values.astype("datetime64[D]").astype(np.int32)
+        columns = np.array([self._index[c] for c in closes.columns])
+        values = closes.to_numpy(dtype=np.float32)
+
+        stored = np.array(self.dates)
+        existing = np.isin(days, stored)
+        later = days > stored[-1] if self.days else np.ones(len(days), dtype=bool)
+        if existing.any():
+            matrix = self._map(self._files["close"], np.float32, (self.days, len(self.symbols)), mode="r+")
+            rows = np.searchsorted(stored, days[existing])[:, None]
+            current = matrix[rows, columns]
+            fresh = values[existing]
+            matrix[rows, columns] = np.where(np.isnan(fresh), current, fresh)
+            matrix.flush()
+            del matrix
+        if later.any():
+            appended = np.full((int(later.sum()), len(self.symbols)), np.nan, dtype=np.float32)
+            appended[:, columns] = values[later]
+            row_bytes = len(self.symbols) * np.dtype(np.float32).itemsize
+            self._append(self._files["close"], appended, self.days * row_bytes)
+            self._append("dates.i4", days[later], self.days * np.dtype(np.int32).itemsize)
+            self.days += len(appended)
+        return int(existing.sum() + later.sum())
+
+    def _refresh_fundamentals(self, max_age: float, workers: int) -> int:
+        fundamentals = np.array(self.fundamentals())
+        now = time.time()
+        age = now - fundamentals[:, FUNDAMENTALS.index("updated_at")]
+        due = [self.symbols[i] for i in np.flatnonzero(~(age <= max_age))]
+        if not due:
+            return 0
+        logger.info(f"Refreshing quote fields of {len(due)} symbols...")
+        store = get_market_store()
+        directory = get_symbol_directory()
+
+        def _info(symbol):
+            try:
+                info = store.get(symbol, "info")
+            except Exception as e:
+                logger.warning(f"Could not load info for {symbol}: {e}")
+                return None
+            if directory is not None:
+                directory.record(symbol, info)
+            return info
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            infos = list(map_in_context(pool, _info, due))
+        for symbol, info in zip(due, infos):
+            if info is None:
+                continue
+            i = self._index[symbol]
+            for j, field in enumerate(INFO_FIELDS.values()):
+                value = info.get(field)
+                fundamentals[i, j] = value if isinstance(value, (int, float)) else np.nan
+            fundamentals[i, -1] = now
+            self.sectors[i] = info.get("sector") or ""
+        self._rewrite("fundamentals", fundamentals)
+        if directory is not None:
+            directory.flush()
+        return sum(info is not None for info in infos)
+
+    # --- Screening ---
+
+    def factors(self, momentum_days: int = MOMENTUM_DAYS) -> dict:
+        """
+        Per-symbol screening factors as arrays aligned with self.symbols: last close, position in the
+        52-week range (0 = low, 1 = high), momentum over `momentum_days`, P/E relative to the sector
+        median, beta and market cap.
+        """
+        n = len(self.symbols)
+        closes = np.asarray(self.closes(YEAR_DAYS), dtype=np.float64)
+        valid = ~np.isnan(closes)
+        history = valid.sum(axis=0)
+        if len(closes):
+            last_row = len(closes) - 1 - valid[::-1].argmax(axis=0)
+            last = closes[last_row, np.arange(n)]
+        else:
+            last = np.full(n, np.nan)
+        high = np.fmax.reduce(closes, axis=0) if len(closes) else np.full(n, np.nan)
+        low = np.fmin.reduce(closes, axis=0) if len(closes) else np.full(n, np.nan)
+        span = high - low
+        range_position = np.divide(last - low, span, out=np.full(n, np.nan), where=span > 0)
+
+        past = closes[-momentum_days - 1] if len(closes) > momentum_days else np.full(n, np.nan)
+        momentum = np.divide(last, past, out=np.full(n, np.nan), where=past > 0) - 1
+
+        fundamentals = np.asarray(self.fundamentals())
+        pe = fundamentals[:, FUNDAMENTALS.index("pe_ratio")]
+        sectors, codes = np.unique(np.array(self.sectors, dtype=str), return_inverse=True)
+        earning = pe > 0
+        medians = np.full(len(sectors), np.nan)
+        for code, sector in enumerate(sectors):
+            members = earning & (codes == code)
+            if sector and members.any():
+                medians[code] = np.median(pe[members])
+        sector_pe = medians[codes] if n else np.full(n, np.nan)
+        pe_vs_sector = np.divide(pe, sector_pe, out=np.full(n, np.nan), where=earning & (sector_pe > 0))
+
+        return {
+            "history_days": history,
+            "price": last,
+            "range_position": range_position,
+            "momentum": momentum,
+            "pe_ratio": pe,
+            "pe_vs_sector": pe_vs_sector,
+            "beta": fundamentals[:, FUNDAMENTALS.index("beta")],
+            "market_cap": fundamentals[:, FUNDAMENTALS.index("market_cap")],
+        }
+
+    def screen(self, criteria: dict = None, weights: dict = None, top: int = 10, symbols: list = None) -> list:
+        """
+        Filters the universe (or the given symbols of it) on `criteria` (see DEFAULT_CRITERIA; a NaN factor
+        fails any bound set on it) and ranks the survivors by a weighted average of their factor
+        percentiles. Returns the `top` names as dicts, best first.
+        """
+        criteria = {**DEFAULT_CRITERIA, **(criteria or {})}
+        weights = weights or DEFAULT_WEIGHTS
+        with self._lock:
+            factors = self.factors()
+            names = np.array(self.symbols, dtype=object)
+            sectors = list(self.sectors)
+
+        mask = factors["history_days"] >= (criteria["min_history_days"] or 0)
+        if symbols is not None:
+            mask &= np.isin(names, [s.upper() for s in symbols])
+        for criterion, (factor, compare) in _BOUNDS.items():
+            if criteria.get(criterion) is not None:
+                with np.errstate(invalid="ignore"):
+                    mask &= compare(factors[factor], criteria[criterion])
+
+        selected = np.flatnonzero(mask)
+        score = np.zeros(len(selected))
+        total = sum(abs(w) for w in weights.values()) or 1.0
+        for factor, weight in weights.items():
+            values = factors[factor][selected]
+            score += abs(weight) * _percentile_ranks(values if weight > 0 else -values)
+        score /= total
+        order = selected[np.argsort(-score, kind="stable")][:top]
+        scores = dict(zip(selected, score))
+
+        def _value(x, digits):
+            return None if np.isnan(x) else round(float(x), digits)
+
+        return [{
+            "symbol": names[i],
+            "sector": sectors[i] or "N/A",
+            "score": round(float(scores[i]), 3),
+            "price": _value(factors["price"][i], 2),
+            "range_position": _value(factors["range_position"][i], 3),
+            "momentum_pct": _value(factors["momentum"][i] * 100, 1),
+            "pe_ratio": _value(factors["pe_ratio"][i], 2),
+            "pe_vs_sector": _value(factors["pe_vs_sector"][i], 2),
+            "beta": _value(factors["beta"][i], 2),
+        } for i in order]
+
+    def stats(self) -> dict:
+        size = sum(f.stat().st_size for f in self.path.glob("*") if f.is_file()) if self.path.exists() else 0
+        first, last = (self.dates[0], self.dates[-1]) if self.days else (None, None)
+        return {
+            "symbols": len(self.symbols),
+            "days": self.days,
+            "first_day": str(np.datetime64(int(first), "D")) if first is not None else None,
+            "last_day": str(np.datetime64(int(last), "D")) if last is not None else None,
+            "disk_mb": round(size / 1024 / 1024, 2),
+        }
+
+
+def format_shortlist(shortlist: list) -> str:
+    """Plain-text table of a screen's shortlist."""
+    def _cell(value):
+        return "-" if value is None else str(value)
+
+    header = f"{'#':>3} {'Symbol':<10} {'Score':>6} {'Price':>9} {'52w pos':>8} {'Mom %':>7} {'P/E':>7} {'vs sect':>8} {'Beta':>5}  Sector"
+    lines = [header, "-" * len(header)]
+    for rank, r in enumerate(shortlist, 1):
+        lines.append(f"{rank:>3} {r['symbol']:<10} {r['score']:>6} {_cell(r['price']):>9} "
+                     f"{_cell(r['range_position']):>8} {_cell(r['momentum_pct']):>7} {_cell(r['pe_ratio']):>7} "
+                     f"{_cell(r['pe_vs_sector']):>8} {_cell(r['beta']):>5}  {r['sector']}")
+    return "\n".join(lines)
+
+
+_universe = None
+
+
+def configure_universe(path: str) -> UniverseStore:
+    global _universe
+    _universe = UniverseStore(path)
+    return _universe
+
+
+def get_universe():
+    """Returns the configured universe store, or None when none is configured."""
+    return _universe
@@ -0,0 +1,70 @@
+import sys
+import time
+import logging
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class StreamAborted(Exception):
+    """Raised from a token callback to stop a generation that is still streaming."""
+
+
+class StageStream:
+    """on_token callback for one stage: appends chunks to a file (and optionally stdout) as they arrive."""
+
+    def __init__(self, streamer, stage: str, path: Path, echo: bool = False):
+        self.streamer = streamer
+        self.stage = stage
+        self.path = path
+        self.echo = echo
+        self.started = time.monotonic()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def __call__(self, chunk: str):
+        if self.streamer.abort.is_set():
+            self.close()
+            raise StreamAborted(f"Streaming of '{self.stage}' aborted.")
+        self.streamer.record_first_token(self.stage, time.monotonic() - self.started)
+        self._file.write(chunk)
+        self._file.flush()
+        if self.echo:
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SectionStreamer:
+    """
+    Writes each stage's LLM output to disk as tokens arrive and records time-to-first-token per stage.
+    Setting `abort` (e.g. on Ctrl-C) makes every open stream stop at its next chunk.
+    """
+
+    def __init__(self, directory: Path, echo_stages: tuple = ()):
+        self.directory = Path(directory)
+        self.echo_stages = set(echo_stages)
+        self.abort = threading.Event()
+        self.ttft = {}
+        self._lock = threading.Lock()
+
+    def record_first_token(self, stage: str, elapsed: float):
+        with self._lock:
+            if stage not in self.ttft:
+                self.ttft[stage] = round(elapsed, 3)
+                logger.debug(f"Time to first token for '{stage}': {elapsed:.1f}s")
+
+    def open(self, stage: str, path: Path = None) -> StageStream:
+        """Opens the stream for a stage (default: <directory>/<stage>.md); time-to-first-token is measured from now."""
+        return StageStream(self, stage, Path(path) if path else self.directory / f"{stage}.md",
+                           echo=stage in self.echo_stages)
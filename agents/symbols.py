@@ -0,0 +1,263 @@
+import os
+import re
+import csv
+import time
+import bisect
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Yahoo symbols: a root of letters/digits with an optional class or exchange suffix
+# (SPOT, BRK-B, BN.PA, 7203.T, 0700.HK). Indices (^GSPC) and plain numbers are not peers.
+TICKER_RE = re.compile(r"[A-Z0-9]{1,6}(?:[.-][A-Z0-9]{1,4})?")
+
+# A symbol Yahoo had no usable quote for is skipped for this long before it is tried again
+INVALID_TTL = 30 * 24 * 3600
+
+FIELDS = ("symbol", "name", "exchange", "country", "sector", "industry", "primary", "status", "updated_at")
+
+# Yahoo suffix of the home exchange by country, used to pick the primary listing among a company's listings
+HOME_SUFFIX = {
+    "United States": "", "Canada": ".TO", "United Kingdom": ".L", "Germany": ".DE", "France": ".PA",
+    "Netherlands": ".AS", "Belgium": ".BR", "Switzerland": ".SW", "Italy": ".MI", "Spain": ".MC",
+    "Sweden": ".ST", "Denmark": ".CO", "Norway": ".OL", "Finland": ".HE", "Ireland": ".IR",
+    "Japan": ".T", "Hong Kong": ".HK", "China": ".SS", "Taiwan": ".TW", "South Korea": ".KS",
+    "India": ".NS", "Australia": ".AX", "Brazil": ".SA", "Mexico": ".MX",
+}
+
+_LEGAL_SUFFIXES = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "plc", "sa", "se", "ag",
+    "nv", "bv", "spa", "ab", "asa", "oyj", "as", "kk", "holdings", "holding", "group", "the", "adr", "ads",
+    "sponsored", "class", "a", "b", "ordinary", "shares",
+}
+
+
+def is_ticker(symbol: str) -> bool:
+    """Whether a token looks like a Yahoo equity symbol (at least one letter, no index prefix)."""
+    return bool(TICKER_RE.fullmatch(symbol)) and any(c.isalpha() for c in symbol)
+
+
+def extract_tickers(text: str) -> list:
+    """Ticker symbols in a comma/space separated answer, in order and without duplicates."""
+    symbols = []
+    for token in re.split(r"[\s,;|/]+", text or ""):
+        token = token.strip("()[]{}\"'`*:.")
+        if is_ticker(token) and token not in symbols:
+            symbols.append(token)
+    return symbols
+
+
+def company_key(name: str) -> str:
+    """Normalized company name shared by all listings of a company ("SAP SE", "Sap Se ADR" -> "sap")."""
+    words = re.sub(r"[^a-z0-9 ]+", " ", (name or "").lower().replace("&", " and ")).split()
+    while words and words[-1] in _LEGAL_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+class SymbolDirectory:
+    """
+    Local directory of Yahoo symbols (name, exchange, country, sector, industry, primary listing), stored
+    as a TSV file. It is seeded from exchange listings (import_csv) and learns from every quote the
+    scouts fetch, including symbols Yahoo has no quote for. Exact lookups are dict reads; prefix lookups
+    bisect a sorted symbol list. Peer candidates are screened against it before any Yahoo request.
+    """
+
+    def __init__(self, path: str, invalid_ttl: float = INVALID_TTL):
+        self.path = str(path)
+        self.invalid_ttl = invalid_ttl
+        self._entries = {}
+        self._sorted = []
+        self._by_company = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8", newline="") as f:
+                for row in csv.DictReader(f, delimiter="\t"):
+                    row["updated_at"] = float(row.get("updated_at") or 0)
+                    self._set(row, keep_sorted=False)
+        except (OSError, ValueError, csv.Error) as e:
+            logger.warning(f"Could not read symbol directory {self.path}, starting empty: {e}")
+        self._sorted = sorted(self._entries)
+
+    def _set(self, entry: dict, keep_sorted: bool = True):
+        # Called with the lock held (or during _load). Bulk loads pass keep_sorted=False and sort once.
+        symbol = entry["symbol"]
+        old = self._entries.get(symbol)
+        if old is not None:
+            self._by_company.get(company_key(old["name"]), set()).discard(symbol)
+        elif keep_sorted:
+            bisect.insort(self._sorted, symbol)
+        self._entries[symbol] = {field: entry.get(field) or "" for field in FIELDS}
+        self._entries[symbol]["updated_at"] = entry.get("updated_at") or time.time()
+        if entry.get("status", "ok") == "ok" and company_key(entry.get("name")):
+            self._by_company.setdefault(company_key(entry["name"]), set()).add(symbol)
+
+    def flush(self):
+        """Writes the directory if anything was learned since the last write."""
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [self._entries[s] for s in self._sorted]
+            self._dirty = False
+        # Write to a temp file and swap it in, so a crash never leaves a truncated directory
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS, delimiter="\t")
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, symbol: str):
+        """The entry of a symbol, or None if it is unknown (or a failed lookup that has expired)."""
+        entry = self._entries.get(symbol.upper())
+        if entry and entry["status"] == "invalid" and time.time() - entry["updated_at"] > self.invalid_ttl:
+            return None
+        return entry
+
+    def prefix(self, prefix: str, limit: int = 20) -> list:
+        """Known symbols starting with the prefix, in sorted order."""
+        prefix = prefix.upper()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted, prefix)
+            end = bisect.bisect_left(self._sorted, prefix + "\uffff", lo=start)
+            return self._sorted[start:min(end, start + limit)]
+
+    def listings(self, symbol: str) -> list:
+        """All known listings of the company behind a symbol (itself included)."""
+        entry = self.lookup(symbol)
+        if not entry or entry["status"] != "ok":
+            return [symbol.upper()]
+        with self._lock:
+            return sorted(self._by_company.get(company_key(entry["name"]), {symbol.upper()}))
+
+    def primary_listing(self, symbol: str) -> str:
+        """
+        The primary listing of a company: the recorded one, else the listing on the home exchange of the
+        company's country (so ADRs and secondary lines collapse onto it), else the symbol itself.
+        """
+        symbol = symbol.upper()
+        entry = self.lookup(symbol)
+        if not entry:
+            return symbol
+        if entry["primary"]:
+            return entry["primary"]
+        listings = self.listings(symbol)
+        suffix = HOME_SUFFIX.get(entry["country"])
+        if len(listings) > 1 and suffix is not None:
+            home = [s for s in listings if (s.endswith(suffix) if suffix else "." not in s)]
+            if home:
+                return home[0]
+        return symbol
+
+    def record(self, symbol: str, info: dict):
+        """Learns a symbol from its Yahoo info (no usable quote marks it invalid)."""
+        info = info or {}
+        valid = bool(info.get("currentPrice") or info.get("regularMarketPrice"))
+        entry = {
+            "symbol": symbol.upper(),
+            "name": info.get("longName") or info.get("shortName") or "",
+            "exchange": info.get("exchange") or "",
+            "country": info.get("country") or "",
+            "sector": info.get("sector") or "",
+            "industry": info.get("industry") or "",
+            "status": "ok" if valid else "invalid",
+            "updated_at": time.time(),
+        }
+        with self._lock:
+            old = self._entries.get(entry["symbol"])
+            # An imported primary listing survives re-learning the symbol
+            entry["primary"] = old["primary"] if old else ""
+            if old and all(old[f] == entry[f] for f in FIELDS if f != "updated_at"):
+                return
+            self._set(entry)
+            self._dirty = True
+
+    def import_csv(self, path: str) -> int:
+        """
+        Loads exchange listings from a CSV file with a header naming at least `symbol` and `name`
+        (optional: exchange, country, sector, industry, primary). Returns the number of rows imported.
+        """
+        count = 0
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            reader = csv.DictReader(f)
+            with self._lock:
+                for row in reader:
+                    row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+                    symbol = row.get("symbol", "").upper()
+                    if not is_ticker(symbol):
+                        continue
+                    self._set({**row, "symbol": symbol, "primary": row.get("primary", "").upper(),
+                               "status": "ok", "updated_at": time.time()}, keep_sorted=False)
+                    count += 1
+                self._sorted = sorted(self._entries)
+                self._dirty = True
+        return count
+
+    def screen(self, candidates: list, target: str = None, sector: str = None) -> tuple:
+        """
+        Filters peer candidates without touching the network. Drops malformed symbols, symbols known to
+        have no quote, known sector mismatches and other listings of the target or of a candidate already
+        kept; ADRs and secondary listings are replaced by the primary listing. Unknown symbols pass.
+        Returns (kept, {dropped symbol: reason}).
+        """
+        kept, dropped = [], {}
+        companies = {}
+        target_entry = self.lookup(target) if target else None
+        if target_entry and target_entry["status"] == "ok":
+            companies[company_key(target_entry["name"])] = target.upper()
+
+        for symbol in candidates:
+            symbol = symbol.upper()
+            if not is_ticker(symbol):
+                dropped[symbol] = "not a ticker symbol"
+                continue
+            if symbol == (target or "").upper() or symbol in kept:
+                dropped.setdefault(symbol, "duplicate")
+                continue
+            entry = self.lookup(symbol)
+            if entry is None:
+                kept.append(symbol)
+                continue
+            if entry["status"] == "invalid":
+                dropped[symbol] = "no quote on Yahoo"
+                continue
+            if sector and sector != "N/A" and entry["sector"] and entry["sector"] != sector:
+                dropped[symbol] = f"sector '{entry['sector']}'"
+                continue
+            company = company_key(entry["name"])
+            if company and company in companies:
+                dropped[symbol] = f"another listing of {companies[company]}"
+                continue
+            primary = self.primary_listing(symbol)
+            if primary != symbol:
+                logger.info(f"Using primary listing {primary} instead of {symbol}")
+            if company:
+                companies[company] = primary
+            if primary not in kept:
+                kept.append(primary)
+        return kept, dropped
+
+
+_directory = None
+
+
+def configure_symbol_directory(path: str, invalid_ttl: float = INVALID_TTL) -> SymbolDirectory:
+    global _directory
+    _directory = SymbolDirectory(path, invalid_ttl=invalid_ttl)
+    return _directory
+
+
+def get_symbol_directory():
+    """Returns the configured symbol directory, or None when it is disabled."""
+    return _directory
@@ -0,0 +1,216 @@
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# The metrics collector and stage of the code currently running. Worker threads only see them
+# when started through submit_in_context (thread pools don't copy context variables on their own).
+_current_metrics = contextvars.ContextVar("run_metrics", default=None)
+_current_stage = contextvars.ContextVar("run_stage", default=None)
+_current_call = contextvars.ContextVar("llm_call", default=None)
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "reasoning_tokens", "cached_prompt_text_tokens")
+
+
+class RunMetrics:
+    """Collects per-call performance records (LLM calls, Yahoo fetches) for one run."""
+
+    def __init__(self, run: str):
+        self.run = run
+        self.llm_calls = []
+        self.fetches = []
+        self._lock = threading.Lock()
+
+    def add_llm_call(self, record: dict):
+        with self._lock:
+            self.llm_calls.append(record)
+
+    def add_fetch(self, record: dict):
+        with self._lock:
+            self.fetches.append(record)
+
+    def summary(self) -> dict:
+        """Totals per stage and per model, plus overall LLM and fetch totals."""
+        with self._lock:
+            llm_calls = list(self.llm_calls)
+            fetches = list(self.fetches)
+
+        def _totals(records):
+            totals = defaultdict(float)
+            for r in records:
+                totals["calls"] += 1
+                totals["wall_seconds"] += r.get("wall_seconds") or 0
+                totals["retry_wait_seconds"] += r.get("retry_wait_seconds") or 0
+                # Hedges count as attempts but are not retries
+                totals["retries"] += max(0, (r.get("attempts") or 1) - 1 - (r.get("hedges") or 0))
+                totals["hedges"] += r.get("hedges") or 0
+                totals["cache_hits"] += r.get("cache") == "hit"
+                totals["cache_misses"] += r.get("cache") == "miss"
+                for field in USAGE_FIELDS:
+                    totals[field] += r.get(field) or 0
+            # Share of the prompt tokens served from the provider's prompt cache
+            if totals["prompt_tokens"]:
+                totals["cached_prompt_share"] = totals["cached_prompt_text_tokens"] / totals["prompt_tokens"]
+            return {k: round(v, 3) if isinstance(v, float) and not v.is_integer() else int(v)
+                    for k, v in totals.items()}
+
+        by_stage = defaultdict(list)
+        by_model = defaultdict(list)
+        for r in llm_calls:
+            by_stage[r.get("stage") or "unknown"].append(r)
+            by_model[r.get("model")].append(r)
+
+        fetch_totals = defaultdict(lambda: defaultdict(float))
+        for f in fetches:
+            t = fetch_totals[f.get("source", "unknown")]
+            t["calls"] += 1
+            t["wall_seconds"] += f.get("wall_seconds") or 0
+            t["cache_hits"] += f.get("cache") == "hit"
+            t["cache_misses"] += f.get("cache") == "miss"
+            t["coalesced"] += f.get("cache") == "coalesced"
+            t["disk_hits"] += f.get("cache") == "disk"
+            t["stale_hits"] += f.get("cache") == "stale"
+
+        return {
+            "llm": _totals(llm_calls),
+            "llm_by_stage": {stage: _totals(rs) for stage, rs in by_stage.items()},
+            "llm_by_model": {model: _totals(rs) for model, rs in by_model.items()},
+            "fetches": {source: {k: round(v, 3) for k, v in t.items()} for source, t in fetch_totals.items()}
+        }
+
+    def to_dict(self) -> dict:
+        summary = self.summary()
+        with self._lock:
+            return {
+                "summary": summary,
+                "llm_calls": list(self.llm_calls),
+                "fetches": list(self.fetches)
+            }
+
+
+def current_metrics():
+    return _current_metrics.get()
+
+
+def current_stage():
+    return _current_stage.get()
+
+
+@contextmanager
+def collect_metrics(metrics: RunMetrics):
+    """Makes `metrics` the collector for everything run from this context."""
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def stage_context(stage: str):
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def submit_in_context(pool, fn, *args, **kwargs):
+    """pool.submit() that carries the caller's metrics collector and stage into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def map_in_context(pool, fn, items) -> list:
+    """Like list(pool.map(fn, items)), carrying the caller's context into every call."""
+    return [f.result() for f in [submit_in_context(pool, fn, item) for item in items]]
+
+
+@contextmanager
+def track_llm_call(model: str, stage: str = None, streamed: bool = False, bind: bool = True):
+    """
+    Times one query_llm/stream_llm call and records it with the current collector.
+    Yields the mutable record so the caller can add usage, cache status and time-to-first-token.
+    With bind=True the record also becomes the target of note_attempt/note_retry_sleep/note_usage;
+    generators pass bind=False, since they may be closed from another context.
+    """
+    record = {
+        "stage": stage or current_stage(),
+        "model": model,
+        "streamed": streamed,
+        "attempts": 0,
+        "hedges": 0,
+        "retry_wait_seconds": 0.0,
+        "cache": None,
+    }
+    token = _current_call.set(record) if bind else None
+    started = time.monotonic()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        if token is not None:
+            _current_call.reset(token)
+        record["wall_seconds"] = round(time.monotonic() - started, 3)
+        metrics = current_metrics()
+        if metrics is not None:
+            metrics.add_llm_call(record)
+
+
+def note_attempt(record: dict = None):
+    record = record if record is not None else _current_call.get()
+    if record is not None:
+        record["attempts"] += 1
+
+
+def note_hedge(record: dict = None):
+    record = record if record is not None else _current_call.get()
+    if record is not None:
+        record["hedges"] += 1
+
+
+def note_retry_sleep(retry_state, record: dict = None):
+    """tenacity before_sleep hook: adds the upcoming backoff to the current call's retry wait."""
+    record = record if record is not None else _current_call.get()
+    if record is not None and retry_state.next_action is not None:
+        record["retry_wait_seconds"] = round(record["retry_wait_seconds"] + retry_state.next_action.sleep, 3)
+
+
+def note_usage(response, record: dict = None):
+    """Copies token usage from an xAI response onto the current call record."""
+    record = record if record is not None else _current_call.get()
+    usage = getattr(response, "usage", None)
+    if record is None or usage is None:
+        return
+    for field in USAGE_FIELDS:
+        record[field] = getattr(usage, field, None)
+
+
+def record_fetch(source: str, symbol: str, item: str, wall_seconds: float, cache: str = None):
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add_fetch({
+            "source": source,
+            "symbol": symbol,
+            "item": item,
+            "stage": current_stage(),
+            "wall_seconds": round(wall_seconds, 3),
+            "cache": cache
+        })
+
+
+_export_lock = threading.Lock()
+
+
+def append_jsonl(path, record: dict):
+    """Appends one JSON line to an aggregate metrics file (shared by all workers of a process)."""
+    line = json.dumps(record, default=str, separators=(",", ":"))
+    with _export_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
@@ -1,36 +1,296 @@
 import os
+import math
+import hashlib
 import logging
-from tenacity import retry, stop_after_attempt, wait_exponential
-from xai_sdk import Client
-from xai_sdk.chat import user, system
+import time
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+from tenacity import retry, Retrying, retry_if_exception, stop_after_attempt, wait_exponential
+from agents.llm_cache import get_llm_cache, make_key
+from agents.telemetry import track_llm_call, note_attempt, note_hedge, note_retry_sleep, note_usage
+from agents.ratelimit import get_limiter
+from agents.deadlines import (check_deadline, wait_any, run_detached, iterate_within_deadline,
+                              sleep_within_deadline, get_hedging, deadline_scope)
+from prompts.templates import static_prefix
+
+# grpc and xai_sdk take a good part of a second to import, so they are only loaded once an LLM call
+# (or an LLM error) actually happens; the CLI can parse arguments and fail fast without them.
+if TYPE_CHECKING:
+    from xai_sdk import Client
 
 logger = logging.getLogger(__name__)
 
-def get_client():
+# One client (and gRPC channel) is shared by every agent and worker thread in the process
+_client = None
+_client_lock = threading.Lock()
+
+# Per-request gRPC timeout. It only caps calls nobody waits for any more (abandoned at a deadline or
+# beaten by a hedge); how long a stage or run may take is set with deadlines (see agents.deadlines).
+DEFAULT_CLIENT_TIMEOUT = 900
+_client_timeout = DEFAULT_CLIENT_TIMEOUT
+
+# gRPC status codes worth retrying; anything else (bad key, invalid request, ...) fails immediately
+RETRYABLE_STATUS = {"UNAVAILABLE", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED", "ABORTED", "INTERNAL"}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token for English/numeric text)."""
+    return math.ceil(len(text) / 4) if text else 0
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Transient transport/server errors are retried; configuration and request errors are not."""
+    import grpc
+    if isinstance(error, grpc.RpcError):
+        return error.code().name in RETRYABLE_STATUS
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+def is_throttling_error(error: BaseException) -> bool:
+    import grpc
+    return isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+
+def create_client() -> "Client":
+    """Builds a new xAI client from the environment."""
+    from xai_sdk import Client
     api_key = os.getenv("XAI_API_KEY")
     if not api_key:
         raise ValueError("XAI_API_KEY not found in environment variables.")
-    return Client(api_key=api_key, timeout=3600) # Long timeout for reasoning
+    return Client(api_key=api_key, timeout=_client_timeout)
+
+def configure_client(timeout: float = DEFAULT_CLIENT_TIMEOUT) -> None:
+    """Sets the per-request timeout of the shared client; the next query_llm call creates it with that timeout."""
+    global _client_timeout
+    _client_timeout = timeout
+    close_client()
+
+def get_client() -> "Client":
+    """Returns the process-wide xAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+                logger.debug("Created shared xAI client.")
+    return _client
+
+def set_client(client) -> None:
+    """Injects the client used by query_llm (e.g. a fake in tests). Pass None to reset."""
+    global _client
+    with _client_lock:
+        _client = client
+
+def close_client() -> None:
+    """Closes the shared client, if any. The next query_llm call creates a fresh one."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None and hasattr(client, "close"):
+        client.close()
+        logger.debug("Closed shared xAI client.")
+
+@contextmanager
+def _xai_slot(estimated_tokens: int, what: str = None):
+    """Holds a slot of the shared xAI limiter and feeds throttling signals back into it."""
+    limiter = get_limiter("xai")
+    with limiter.slot(tokens=estimated_tokens, what=what):
+        try:
+            yield limiter
+        except Exception as e:
+            if is_throttling_error(e):
+                limiter.throttled()
+            raise
+        else:
+            limiter.succeeded()
+
+def conversation_id(system_prompt: str, user_prompt: str, model: str) -> str:
+    """
+    Stable id for every request sharing a model, system prompt and template prefix (the text before the
+    template's Data block). xAI routes requests with the same conversation id to the same server, where
+    the prefix is likely still in the prompt cache.
+    """
+    prefix = f"{model}\0{system_prompt}\0{static_prefix(user_prompt)}"
+    return hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:32]
+
+def _log_usage(response, model: str, stage: str = None):
+    usage = getattr(response, "usage", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    if prompt_tokens:
+        cached = getattr(usage, "cached_prompt_text_tokens", 0) or 0
+        logger.info(f"{model}{' (' + stage + ')' if stage else ''}: {prompt_tokens} prompt tokens, "
+                    f"{cached} cached ({cached / prompt_tokens:.0%})")
+
+def _create_chat(system_prompt: str, user_prompt: str, model: str, tools: list = None):
+    from xai_sdk.chat import user, system
+    chat = get_client().chat.create(
+        model=model,
+        tools=tools,
+        conversation_id=conversation_id(system_prompt, user_prompt, model)
+    )
+    # System prompt first, then the template's static instructions, then the data: the longest
+    # byte-stable prefix across tickers
+    chat.append(system(system_prompt))
+    chat.append(user(user_prompt))
+    return chat
+
+def _sample_once(system_prompt: str, user_prompt: str, model: str, tools: list = None, stage: str = None):
+    """Sends one chat request to xAI. Returns the full response (content and usage)."""
+    what = f"LLM call ({model}{', ' + stage if stage else ''})"
+    note_attempt()
+    estimated = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    with _xai_slot(estimated, what) as limiter:
+        # Waiting for the slot may have outlived the caller; don't send a request nobody waits for
+        check_deadline(what)
+        started = time.monotonic()
+        request = run_detached(lambda: _create_chat(system_prompt, user_prompt, model, tools).sample(),
+                               name="llm-rpc")
+        # A call given up on returns its slot at once; the RPC itself runs out in the background
+        response = next(iter(wait_any({request}, what=what))).result()
+        get_hedging().observe(model, stage, time.monotonic() - started)
+    limiter.settle_tokens(estimated, getattr(response.usage, "total_tokens", 0))
+    return response
 
 @retry(
     stop=stop_after_attempt(3), 
     wait=wait_exponential(multiplier=1, min=4, max=10),
+    retry=retry_if_exception(is_retryable_error),
+    before_sleep=note_retry_sleep,
+    sleep=sleep_within_deadline,
     reraise=True
 )
-def query_llm(system_prompt: str, user_prompt: str, model: str = "grok-4-1-fast-reasoning", tools: list = None) -> str:
+def _sample_llm(system_prompt: str, user_prompt: str, model: str, tools: list = None, stage: str = None):
+    """
+    Sends one chat request to xAI, with retry logic. Returns the full response (content and usage).
+    The request runs in the background so waiting for it honours the current deadline and cancellation.
+    With hedging enabled (see agents.deadlines.configure_hedging) a duplicate is sent once the request
+    is slower than the usual p95 of its model and stage; the first response wins.
+    """
+    what = f"LLM call ({model}{', ' + stage if stage else ''})"
+    check_deadline(what)
+    hedging = get_hedging()
+    delay = hedging.delay(model, stage)
+    started = time.monotonic()
+    args = (system_prompt, user_prompt, model, tools, stage)
+    # Set once this call stops waiting (a response won, or a deadline, cancellation or error hit): hedge
+    # losers and abandoned requests stop waiting for a limiter slot and give back the one they hold
+    abandoned = threading.Event()
+
+    def _attempt():
+        # The caller still sees its own cancellation through wait_any and then sets `abandoned`
+        with deadline_scope(cancel_event=abandoned):
+            return _sample_once(*args)
+
+    try:
+        pending = {run_detached(_attempt, name="llm-call")}
+        hedges = 0
+        error = None
+        while pending:
+            timeout = None
+            if delay is not None and hedges < hedging.max_hedges:
+                timeout = max(0.0, started + delay * (hedges + 1) - time.monotonic())
+            done = wait_any(pending, timeout=timeout, what=what)
+            if not done:
+                hedges += 1
+                note_hedge()
+                logger.info(f"{what} slower than {delay:.1f}s, sending a hedged request")
+                pending.add(run_detached(_attempt, name="llm-hedge"))
+                continue
+            for future in done:
+                pending.discard(future)
+                if future.exception() is None:
+                    return future.result()
+                error = error or future.exception()
+        raise error
+    finally:
+        abandoned.set()
+
+def stream_llm(system_prompt: str, user_prompt: str, model: str = "grok-4-1-fast-reasoning", tools: list = None,
+               stage: str = None, use_cache: bool = True):
+    """
+    Streaming variant of query_llm: yields the response text chunk by chunk.
+    Failures are retried like query_llm only until the first chunk has been yielded.
+    A cached response is yielded as a single chunk. Streams honour deadlines but are never hedged.
+    """
+    with track_llm_call(model, stage, streamed=True, bind=False) as record:
+        cache = get_llm_cache() if use_cache else None
+        key = None
+        if cache is not None:
+            key = make_key(model, system_prompt, user_prompt, tools)
+            cached = cache.get(key)
+            record["cache"] = "miss" if cached is None else "hit"
+            if cached is not None:
+                logger.info(f"LLM cache hit ({model}{', ' + stage if stage else ''}).")
+                yield cached
+                return
+
+        logger.info(f"Streaming LLM ({model})...")
+        what = f"LLM stream ({model}{', ' + stage if stage else ''})"
+        parts = []
+        started = time.monotonic()
+        retrying = Retrying(
+            stop=stop_after_attempt(3),
+            wait=wait_exponential(multiplier=1, min=4, max=10),
+            # Once text has been handed out a retry would duplicate it
+            retry=retry_if_exception(lambda e: not parts and is_retryable_error(e)),
+            before_sleep=lambda retry_state: note_retry_sleep(retry_state, record),
+            sleep=sleep_within_deadline,
+            reraise=True
+        )
+        estimated = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+        for attempt in retrying:
+            with attempt:
+                note_attempt(record)
+                response = None
+                check_deadline(what)
+                with _xai_slot(estimated, what) as limiter:
+                    # Chunks are read in the background so a stalled stream can't outlive the deadline
+                    chunks = iterate_within_deadline(_create_chat(system_prompt, user_prompt, model, tools).stream(),
+                                                     what=what)
+                    for response, chunk in chunks:
+                        if not chunk.content:
+                            continue
+                        if not parts:
+                            record["ttft_seconds"] = round(time.monotonic() - started, 3)
+                            logger.info(f"First token from {model}{' (' + stage + ')' if stage else ''} "
+                                        f"after {record['ttft_seconds']:.1f}s")
+                        parts.append(chunk.content)
+                        yield chunk.content
+                note_usage(response, record)
+                _log_usage(response, model, stage)
+                limiter.settle_tokens(estimated, getattr(getattr(response, "usage", None), "total_tokens", 0))
+
+        if cache is not None:
+            cache.put(key, "".join(parts), model=model, stage=stage, tools=tools)
+
+def query_llm(system_prompt: str, user_prompt: str, model: str = "grok-4-1-fast-reasoning", tools: list = None,
+              stage: str = None, use_cache: bool = True, on_token=None) -> str:
     """
     Generic function to query the LLM with retry logic.
+    Responses are served from the LLM cache when one is configured (see agents.llm_cache).
+    If on_token is given, the response is streamed and on_token is called with each chunk as it arrives.
+    Every call is recorded with the current run metrics (see agents.telemetry).
     """
-    logger.info(f"Querying LLM ({model})...")
-    client = get_client()
-    
-    chat = client.chat.create(
-        model=model,
-        tools=tools
-    )
-    
-    chat.append(system(system_prompt))
-    chat.append(user(user_prompt))
-    
-    response = chat.sample()
-    return response.content
+    if on_token is not None:
+        parts = []
+        for chunk in stream_llm(system_prompt, user_prompt, model, tools, stage=stage, use_cache=use_cache):
+            on_token(chunk)
+            parts.append(chunk)
+        return "".join(parts)
+
+    with track_llm_call(model, stage) as record:
+        cache = get_llm_cache() if use_cache else None
+        key = None
+        if cache is not None:
+            key = make_key(model, system_prompt, user_prompt, tools)
+            cached = cache.get(key)
+            record["cache"] = "miss" if cached is None else "hit"
+            if cached is not None:
+                logger.info(f"LLM cache hit ({model}{', ' + stage if stage else ''}).")
+                return cached
+
+        logger.info(f"Querying LLM ({model})...")
+        response = _sample_llm(system_prompt, user_prompt, model, tools, stage=record["stage"])
+        note_usage(response)
+        _log_usage(response, model, stage)
+
+        if cache is not None:
+            cache.put(key, response.content, model=model, stage=stage, tools=tools)
+        return response.content
@@ -1,19 +1,33 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
 from agents.utils import query_llm
+from agents.assembler import assemble_report, flag_section
+from agents.telemetry import map_in_context
 from xai_sdk.tools import web_search
 from prompts.templates import (
     FUNDAMENTAL_ANALYST_PROMPT,
     SENTIMENT_ANALYST_PROMPT,
     PORTFOLIO_MANAGER_PROMPT,
-    EDITOR_PROMPT
+    EDITOR_PROMPT,
+    SECTION_EDIT_PROMPT,
+    MANAGEMENT_TONE_PROMPT,
+    SYSTEM_PROMPT
 )
 
+logger = logging.getLogger(__name__)
+
 class FundamentalAnalyst:
     def __init__(self, ticker):
         self.ticker = ticker
 
-    def run(self, financial_data: dict, market_data: dict, peer_data: dict) -> str:
+    def run(self, financial_data: dict, market_data: dict, peer_data: dict, metrics: dict = None,
+            on_token=None) -> str:
         # Format the data into a readable string for the prompt
+        # Statements arrive as compact pipe-delimited tables (see agents.financials)
         formatted_financials = f"""
+        Tables are pipe-delimited: line item, then one column per fiscal year; units are in each header.
+
         Income Statement (Recent):
         {financial_data.get('income_statement', 'N/A')}
         
@@ -35,32 +49,50 @@ class FundamentalAnalyst:
         for ticker, data in peer_data.items():
             formatted_peers += f"- {ticker}: P/E={data.get('pe_ratio')}, Fwd P/E={data.get('fwd_pe')}, Margins={data.get('profit_margins')}, Rev Growth={data.get('revenue_growth')}\n"
         
+        metrics = metrics or {}
+        formatted_metrics = f"""
+        Ratio History ({self.ticker}):
+        {metrics.get('target_history', 'N/A')}
+
+        Peer Comparison:
+        {metrics.get('peer_comparison', 'N/A')}
+        """
+
         prompt = FUNDAMENTAL_ANALYST_PROMPT.format(
             ticker=self.ticker,
             market_data=formatted_market,
             financial_data=formatted_financials,
-            peer_data=formatted_peers
+            peer_data=formatted_peers,
+            metrics_data=formatted_metrics
         )
         
         return query_llm(
-            system_prompt="You are an expert Fundamental Equity Analyst.",
-            user_prompt=prompt
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=prompt,
+            stage="fundamental",
+            on_token=on_token
         )
 
 class SentimentAnalyst:
     def __init__(self, ticker):
         self.ticker = ticker
 
-    def run(self, news_data: list, market_context: dict) -> str:
-        # Step 1: Specific search for Management Tone/Guidance
-        tone_search_prompt = f"Search for the latest earnings call transcripts, management quotes, and future guidance for {self.ticker}. Summarize the management's tone (Confident/Cautious/Bearish) and key quotes."
-        management_context = query_llm(
-            system_prompt="You are a researcher. Use the web search tool to find information.",
-            user_prompt=tone_search_prompt,
+    def research_management_tone(self, on_token=None) -> str:
+        """Web search for Management Tone/Guidance. Only depends on the ticker, so it can run alongside the scout."""
+        return query_llm(
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=MANAGEMENT_TONE_PROMPT.format(ticker=self.ticker),
             model="grok-4-1-fast-reasoning", # Use reasoning model to effectively search and synthesize
-            tools=[web_search()]
+            tools=[web_search()],
+            stage="management_tone",
+            on_token=on_token
         )
 
+    def run(self, news_data: list, market_context: dict, management_context: str = None, on_token=None) -> str:
+        # Step 1: Specific search for Management Tone/Guidance (unless the orchestrator already ran it)
+        if management_context is None:
+            management_context = self.research_management_tone()
+
         # Format news
         news_str = ""
         for item in news_data:
@@ -90,16 +122,19 @@ class SentimentAnalyst:
         )
         
         return query_llm(
-            system_prompt="You are a Senior Market Sentiment Analyst.",
+            system_prompt=SYSTEM_PROMPT,
             user_prompt=prompt,
-            model="grok-4-1-fast-non-reasoning" 
+            model="grok-4-1-fast-non-reasoning",
+            stage="sentiment",
+            on_token=on_token
         )
 
 class PortfolioManager:
     def __init__(self, ticker):
         self.ticker = ticker
 
-    def run(self, fundamental_analysis: str, sentiment_analysis: str, market_data: dict) -> str:
+    def run(self, fundamental_analysis: str, sentiment_analysis: str, market_data: dict, metrics: dict = None,
+            on_token=None) -> str:
         formatted_market = f"""
         Current Price: {market_data.get('current_price')} {market_data.get('currency')}
         Market Cap: {market_data.get('market_cap')}
@@ -109,20 +144,23 @@ class PortfolioManager:
         prompt = PORTFOLIO_MANAGER_PROMPT.format(
             ticker=self.ticker,
             market_data=formatted_market,
+            peer_comparison=(metrics or {}).get('peer_comparison', 'N/A'),
             fundamental_analysis=fundamental_analysis,
             sentiment_analysis=sentiment_analysis
         )
         
         return query_llm(
-            system_prompt="You are a Hedge Fund Portfolio Manager.",
-            user_prompt=prompt
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=prompt,
+            stage="pm_verdict",
+            on_token=on_token
         )
 
 class Editor:
     def __init__(self, ticker):
         self.ticker = ticker
 
-    def run(self, sections: dict, date_str: str = "N/A") -> str:
+    def run(self, sections: dict, date_str: str = "N/A", on_token=None) -> str:
         # Combine all sections
         full_content = ""
         for title, content in sections.items():
@@ -135,7 +173,46 @@ class Editor:
         )
         
         return query_llm(
-            system_prompt="You are the Chief Editor of an Equity Research Firm.",
+            system_prompt=SYSTEM_PROMPT,
             user_prompt=prompt,
-            model="grok-4-1-fast-non-reasoning" # Fast model for formatting
+            model="grok-4-1-fast-non-reasoning", # Fast model for formatting
+            stage="editor",
+            on_token=on_token
         )
+
+    def edit_section(self, title: str, content: str, problems: list) -> str:
+        """Light LLM pass over a single section that the assembler flagged."""
+        prompt = SECTION_EDIT_PROMPT.format(
+            ticker=self.ticker,
+            title=title,
+            problems="; ".join(problems),
+            content=content
+        )
+
+        return query_llm(
+            system_prompt=SYSTEM_PROMPT,
+            user_prompt=prompt,
+            model="grok-4-1-fast-non-reasoning",
+            stage="editor"
+        )
+
+    def assemble(self, sections: dict, date_str: str = "N/A", edit_flagged: bool = False, on_token=None) -> str:
+        """
+        Builds the report from the sections with a fixed template instead of re-generating it.
+        With edit_flagged, sections that look broken first get an edit_section() pass (concurrently).
+        """
+        if edit_flagged:
+            flagged = {title: flag_section(content) for title, content in sections.items()}
+            flagged = {title: problems for title, problems in flagged.items() if problems}
+            if flagged:
+                logger.info(f"[{self.ticker}] Editing flagged sections: "
+                            + "; ".join(f"{t} ({', '.join(p)})" for t, p in flagged.items()))
+                with ThreadPoolExecutor(max_workers=len(flagged)) as pool:
+                    edited = map_in_context(pool, lambda t: self.edit_section(t, sections[t], flagged[t]),
+                                            list(flagged))
+                sections = {**sections, **dict(zip(flagged, edited))}
+
+        report = assemble_report(self.ticker, sections, date_str=date_str)
+        if on_token:
+            on_token(report)
+        return report
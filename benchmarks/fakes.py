@@ -0,0 +1,312 @@
+"""
+Local stand-ins for yfinance and the xAI chat client, with configurable latency, jitter and failure rate.
+They mimic the parts of both APIs the pipeline uses, so orchestration and caching can be benchmarked offline.
+"""
+import os
+import re
+import time
+import random
+import hashlib
+import threading
+from contextlib import contextmanager
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+
+class FakeBackendError(ConnectionError):
+    """Injected transient failure."""
+
+
+class LatencyModel:
+    """
+    Sleeps for mean ± jitter seconds per call and fails with the given probability.
+    A `tail_rate` fraction of calls is `tail_factor` times slower (stragglers, for tail-latency benchmarks).
+    """
+
+    def __init__(self, mean: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0,
+                 tail_rate: float = 0.0, tail_factor: float = 10.0):
+        self.mean = mean
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.tail_rate = tail_rate
+        self.tail_factor = tail_factor
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def wait(self, what: str = "call"):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.mean + self._random.uniform(-self.jitter, self.jitter))
+            if self._random.random() < self.tail_rate:
+                delay *= self.tail_factor
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        time.sleep(delay)
+        if fail:
+            raise FakeBackendError(f"Injected failure in {what}")
+
+
+def _seed(symbol: str) -> int:
+    return int(hashlib.sha256(symbol.encode()).hexdigest()[:8], 16)
+
+
+# --- yfinance ---
+
+# Peer discovery answers draw from this pool. Like real answers, some candidates are in another
+# sector or have no quote on Yahoo, and only cost a wasted fetch until the symbol directory knows them.
+PEER_POOL = [f"PEER{i}" for i in range(20)]
+OFF_SECTOR = {"PEER15", "PEER16", "PEER17"}
+UNQUOTED = {"PEER18", "PEER19"}
+
+
+class FakeTicker:
+    """Deterministic synthetic data for one symbol; every property access costs one simulated round trip."""
+
+    SECTOR = "Technology"
+    INDUSTRY = "Software—Infrastructure"
+
+    def __init__(self, symbol: str, latency: LatencyModel):
+        self.ticker = symbol.upper()
+        self._latency = latency
+        self._rng = random.Random(_seed(self.ticker))
+        self._scale = self._rng.uniform(1e9, 1e11)
+
+    def _statement(self, items: dict) -> pd.DataFrame:
+        periods = pd.to_datetime(["2025-12-31", "2024-12-31", "2023-12-31", "2022-12-31"])
+        rows = {
+            item: [self._scale * share * (1 - 0.07 * i) for i in range(len(periods))]
+            for item, share in items.items()
+        }
+        return pd.DataFrame.from_dict(rows, orient="index", columns=periods)
+
+    @property
+    def info(self) -> dict:
+        self._latency.wait(f"{self.ticker}.info")
+        if self.ticker in UNQUOTED:
+            return {"symbol": self.ticker, "quoteType": "NONE"}
+        price = round(self._rng.uniform(10, 500), 2)
+        return {
+            "symbol": self.ticker,
+            "longName": f"{self.ticker} Holdings Inc.",
+            "exchange": "NMS",
+            "country": "United States",
+            "currentPrice": price,
+            "currency": "USD",
+            "financialCurrency": "USD",
+            "marketCap": self._scale * 8,
+            "enterpriseValue": self._scale * 8.5,
+            "trailingPE": round(self._rng.uniform(8, 60), 2),
+            "forwardPE": round(self._rng.uniform(8, 50), 2),
+            "pegRatio": round(self._rng.uniform(0.5, 3), 2),
+            "beta": round(self._rng.uniform(0.5, 2), 2),
+            "fiftyTwoWeekHigh": price * 1.2,
+            "fiftyTwoWeekLow": price * 0.7,
+            "sector": "Consumer Cyclical" if self.ticker in OFF_SECTOR else self.SECTOR,
+            "industry": self.INDUSTRY,
+            "ebitda": self._scale * 0.35,
+            "totalRevenue": self._scale,
+            "freeCashflow": self._scale * 0.2,
+            "grossMargins": 0.6,
+            "operatingMargins": 0.3,
+            "profitMargins": 0.2,
+            "returnOnEquity": 0.25,
+            "revenueGrowth": 0.08,
+            "earningsGrowth": 0.1,
+            "debtToEquity": 80.0,
+            "website": f"https://{self.ticker.lower()}.example.com",
+            "longBusinessSummary": f"{self.ticker} makes software. " * 20,
+        }
+
+    @property
+    def income_stmt(self) -> pd.DataFrame:
+        self._latency.wait(f"{self.ticker}.income_stmt")
+        return self._statement({
+            "Total Revenue": 1.0, "Cost Of Revenue": 0.4, "Gross Profit": 0.6, "Operating Income": 0.3,
+            "EBITDA": 0.35, "EBIT": 0.3, "Pretax Income": 0.28, "Tax Provision": 0.06, "Net Income": 0.22,
+        })
+
+    @property
+    def balance_sheet(self) -> pd.DataFrame:
+        self._latency.wait(f"{self.ticker}.balance_sheet")
+        return self._statement({
+            "Total Assets": 2.0, "Current Assets": 0.8, "Current Liabilities": 0.5, "Total Debt": 0.6,
+            "Net Debt": 0.3, "Stockholders Equity": 0.9, "Invested Capital": 1.5,
+        })
+
+    @property
+    def cashflow(self) -> pd.DataFrame:
+        self._latency.wait(f"{self.ticker}.cashflow")
+        return self._statement({
+            "Operating Cash Flow": 0.3, "Capital Expenditure": -0.1, "Free Cash Flow": 0.2,
+        })
+
+    @property
+    def news(self) -> list:
+        self._latency.wait(f"{self.ticker}.news")
+        return [
+            {"content": {
+                "title": f"{self.ticker} headline {i}",
+                "provider": {"displayName": "Fake Wire"},
+                "clickThroughUrl": {"url": f"https://news.example.com/{self.ticker}/{i}"},
+                "pubDate": f"2026-10-{10 + i:02d}T08:00:00Z",
+            }}
+            for i in range(8)
+        ]
+
+
+class FakeYahoo:
+    """Factory for FakeTicker / Tickers objects sharing one latency model."""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+
+    def Ticker(self, symbol: str) -> FakeTicker:
+        return FakeTicker(symbol, self.latency)
+
+    def download(self, tickers, start=None, end=None, **kwargs) -> pd.DataFrame:
+        """Bulk daily closes like yf.download: one simulated round trip per call, columns (field, symbol)."""
+        symbols = [s.upper() for s in (re.split(r"[\s,]+", tickers) if isinstance(tickers, str) else tickers) if s]
+        self.latency.wait(f"download({len(symbols)} symbols)")
+        last = pd.Timestamp(end) if end else pd.Timestamp.today().normalize()
+        index = pd.bdate_range(pd.Timestamp(start) if start else last - pd.Timedelta(days=365), last)
+        # A deterministic path per symbol, so incremental downloads agree with earlier ones
+        t = (index - pd.Timestamp("2020-01-01")).days.to_numpy() / 365.0
+        closes = {}
+        for symbol in symbols:
+            rng = random.Random(_seed(symbol))
+            if symbol in UNQUOTED:
+                closes[symbol] = [float("nan")] * len(index)
+                continue
+            base, drift, amplitude, period, phase = (rng.uniform(10, 500), rng.uniform(-0.2, 0.3),
+                                                     rng.uniform(0.05, 0.3), rng.uniform(0.3, 2), rng.uniform(0, 6))
+            closes[symbol] = base * (1 + drift) ** t * (1 + amplitude * np.sin(t / period * 2 * np.pi + phase))
+        frame = pd.DataFrame(closes, index=index)
+        return pd.concat({"Close": frame}, axis=1)
+
+    def Tickers(self, symbols: str):
+        yahoo = self
+
+        class _Tickers:
+            def __init__(self):
+                self.symbols = [s.upper() for s in re.split(r"[\s,]+", symbols) if s]
+                self.tickers = {s: yahoo.Ticker(s) for s in self.symbols}
+
+        return _Tickers()
+
+
+# --- xAI ---
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.reasoning_tokens = 0
+        self.cached_prompt_text_tokens = cached_tokens
+
+
+class _Response:
+    def __init__(self, content: str, prompt_tokens: int, cached_tokens: int = 0):
+        self.content = content
+        self.usage = _Usage(prompt_tokens, len(content) // 4, cached_tokens)
+
+
+class _Chunk:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FakeChat:
+    def __init__(self, client, model: str, tools, conversation_id: str = None):
+        self._client = client
+        self.model = model
+        self.tools = tools
+        self.conversation_id = conversation_id
+        self._messages = []
+
+    def append(self, message):
+        self._messages.append(message)
+
+    def _prompt_text(self) -> str:
+        return " ".join(str(m) for m in self._messages)
+
+    def _answer(self) -> str:
+        prompt = self._prompt_text()
+        if "comma-separated list" in prompt:
+            # Peer discovery: like real sectors, many targets share a small pool of large competitors
+            target = re.search(r"\(([A-Z0-9.^-]+)\)", prompt)
+            rng = random.Random(_seed(target.group(1) if target else "PEER"))
+            return ", ".join(rng.sample(PEER_POOL, 5))
+        return f"## Section\n\nSynthetic analysis from {self.model}.\n\n" + ("Lorem ipsum dolor sit amet. " * 40)
+
+    def sample(self) -> _Response:
+        self._client.latency_for(self.model).wait(f"chat.sample({self.model})")
+        prompt = self._prompt_text()
+        return _Response(self._answer(), len(prompt) // 4, self._client.cached_tokens(self, prompt))
+
+    def stream(self):
+        latency = self._client.latency_for(self.model)
+        latency.wait(f"chat.stream({self.model})")
+        answer = self._answer()
+        prompt = self._prompt_text()
+        response = _Response("", len(prompt) // 4)
+        for i in range(0, len(answer), 40):
+            response.content += answer[i:i + 40]
+            yield response, _Chunk(answer[i:i + 40])
+        response.usage = _Usage(response.usage.prompt_tokens, len(answer) // 4,
+                                self._client.cached_tokens(self, prompt))
+
+
+class FakeXaiClient:
+    """Stands in for xai_sdk.Client: client.chat.create(model=..., tools=...) -> chat with append/sample/stream."""
+
+    def __init__(self, default_latency: LatencyModel, latency_by_model: dict = None):
+        self.default_latency = default_latency
+        self.latency_by_model = dict(latency_by_model or {})
+        # Prompt cache: the last prompt seen per (model, conversation id)
+        self._prompts = {}
+        self._prompts_lock = threading.Lock()
+        client = self
+
+        class _ChatFactory:
+            def create(self, model: str, tools=None, conversation_id: str = None, **kwargs):
+                return FakeChat(client, model, tools, conversation_id)
+
+        self.chat = _ChatFactory()
+
+    def cached_tokens(self, chat: FakeChat, prompt: str) -> int:
+        """Like xAI's prompt cache: the prefix shared with the last prompt routed to the same conversation."""
+        key = (chat.model, chat.conversation_id)
+        with self._prompts_lock:
+            previous = self._prompts.get(key, "")
+            self._prompts[key] = prompt
+        return len(os.path.commonprefix([previous, prompt])) // 4
+
+    def latency_for(self, model: str) -> LatencyModel:
+        return self.latency_by_model.get(model, self.default_latency)
+
+    def close(self):
+        pass
+
+
+@contextmanager
+def fake_backends(yahoo: LatencyModel, llm: LatencyModel, llm_by_model: dict = None):
+    """Routes yfinance and query_llm to the fakes for the duration of the block."""
+    import yfinance as yf
+    from agents import utils
+
+    fake_yahoo = FakeYahoo(yahoo)
+    client = FakeXaiClient(llm, llm_by_model)
+    # Patch the factory rather than injecting once, since main() closes the shared client on exit
+    with mock.patch.object(yf, "Ticker", fake_yahoo.Ticker), mock.patch.object(yf, "Tickers", fake_yahoo.Tickers), \
+            mock.patch.object(yf, "download", fake_yahoo.download), \
+            mock.patch.object(utils, "create_client", lambda: client):
+        utils.set_client(None)
+        try:
+            yield fake_yahoo, client
+        finally:
+            utils.set_client(None)
@@ -0,0 +1,362 @@
+"""
+Offline benchmark harness for the analysis pipeline.
+
+Runs the real orchestration (DataScout.gather_all, main.analyze_ticker/run_batch) against the fakes in
+benchmarks.fakes and reports p50/p95 latency, throughput and peak memory per scenario.
+
+    python -m benchmarks.run                      # all scenarios
+    python -m benchmarks.run --scenario batch --tickers 100 --workers 16
+    python -m benchmarks.run --scenario batch --llm-tail-rate 0.05 --hedge   # tail latency with hedging
+    python -m benchmarks.run --scenario batch --editor-mode assemble         # template-built reports
+    python -m benchmarks.run --scenario prewarm   # scout latency with cold vs prewarmed market data
+    python -m benchmarks.run --scenario screen    # universe load, daily update and screen of 2000 symbols
+    python -m benchmarks.run --scenario startup   # exits 1 if `main.py --help` is over its startup budget
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.fakes import LatencyModel, fake_backends
+
+logger = logging.getLogger("Benchmark")
+
+SCENARIOS = ("scout", "prewarm", "single", "batch", "cache", "screen", "startup")
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+# p95 wall time allowed for `main.py --help` in a fresh interpreter (the path cron wrappers and
+# validation scripts hit); the startup scenario fails the benchmark run when it is exceeded
+DEFAULT_STARTUP_BUDGET = 0.5
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(name: str, latencies: list, wall: float, peak_bytes: int, failures: int = 0, **extra) -> dict:
+    return {
+        "scenario": name,
+        "runs": len(latencies),
+        "failures": failures,
+        "p50_seconds": round(percentile(latencies, 50), 3),
+        "p95_seconds": round(percentile(latencies, 95), 3),
+        "mean_seconds": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "wall_seconds": round(wall, 3),
+        "throughput_per_second": round(len(latencies) / wall, 3) if wall > 0 else 0.0,
+        "peak_memory_mb": round(peak_bytes / 1024 / 1024, 1),
+        **extra
+    }
+
+
+class Workspace:
+    """Points every on-disk location used by main.py at a throwaway directory."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def __enter__(self):
+        import main
+        from agents import deadlines, ratelimit, utils
+        from agents.peer_index import configure_peer_index
+        from agents.symbols import configure_symbol_directory
+        from agents.results_store import configure_results_store
+        from agents.market_store import configure_market_store
+
+        self._patches = [
+            mock.patch.object(main, "RESULTS_DIR", self.root / "results"),
+            mock.patch.object(main, "CHECKPOINT_DIR", self.root / "checkpoints"),
+            mock.patch.object(main, "METRICS_PATH", self.root / "results" / "metrics.jsonl"),
+            mock.patch.object(main, "PEER_INDEX_PATH", self.root / "peer_index.json"),
+            mock.patch.object(main, "SYMBOLS_PATH", self.root / "symbols.tsv"),
+            mock.patch.object(main, "MARKET_CACHE_PATH", self.root / "market_cache.sqlite"),
+            mock.patch.object(main, "UNIVERSE_DIR", self.root / "universe"),
+            mock.patch.object(main, "RESULTS_DB_PATH", self.root / "results" / "results.sqlite"),
+            # main.main() reconfigures the process-wide limiters, hedging and client timeout from its CLI
+            # defaults; put the benchmark's settings back for the next scenario
+            mock.patch.dict(ratelimit._limiters),
+            mock.patch.object(deadlines, "_hedging", deadlines.get_hedging()),
+            mock.patch.object(utils, "_client_timeout", utils._client_timeout),
+        ]
+        for p in self._patches:
+            p.start()
+        (self.root / "results").mkdir(parents=True, exist_ok=True)
+        configure_peer_index(self.root / "peer_index.json")
+        configure_symbol_directory(self.root / "symbols.tsv")
+        configure_results_store(self.root / "results" / "results.sqlite")
+        # Every scenario starts with cold market data
+        configure_market_store()
+        return self
+
+    def __exit__(self, *exc):
+        from agents.llm_cache import disable_llm_cache
+        from agents.peer_index import get_peer_index
+
+        get_peer_index().wait_for_refreshes()
+        disable_llm_cache()
+        for p in reversed(self._patches):
+            p.stop()
+
+
+def _measure(func):
+    """Runs func() under tracemalloc and returns (result, wall seconds, peak bytes)."""
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        result = func()
+    finally:
+        wall = time.monotonic() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, wall, peak
+
+
+def scenario_scout(args) -> dict:
+    """DataScout.gather_all for a series of tickers, one after another."""
+    from agents.data_scout import DataScout
+
+    def _run():
+        latencies, failures = [], 0
+        for i in range(args.scout_tickers):
+            started = time.monotonic()
+            data = DataScout(f"SCT{i}").gather_all()
+            latencies.append(time.monotonic() - started)
+            failures += "error" in data["market_data"]
+        return latencies, failures
+
+    (latencies, failures), wall, peak = _measure(_run)
+    return summarize("scout", latencies, wall, peak, failures)
+
+
+def scenario_prewarm(args) -> dict:
+    """
+    Scouts for --scout-tickers names with cold market data, then again in a fresh store (as in a new
+    process) after a prewarm has filled the on-disk market cache for the same watchlist.
+    """
+    import main
+    from agents.data_scout import DataScout, prewarm
+    from agents.market_store import configure_market_store
+
+    tickers = [f"PRW{i}" for i in range(args.scout_tickers)]
+
+    def _scouts():
+        latencies = []
+        for ticker in tickers:
+            started = time.monotonic()
+            DataScout(ticker).gather_all()
+            latencies.append(time.monotonic() - started)
+        return latencies
+
+    # The cold pass also fills the peer index, which the prewarm reads like it would in production
+    configure_market_store()
+    cold, wall, peak = _measure(_scouts)
+    results = {"cold": summarize("prewarm-cold", cold, wall, peak)}
+
+    configure_market_store(path=main.MARKET_CACHE_PATH)
+    summary, prewarm_wall, _ = _measure(lambda: prewarm(tickers, workers=args.workers))
+    configure_market_store(path=main.MARKET_CACHE_PATH)
+    warm, wall, peak = _measure(_scouts)
+    results["warm"] = summarize("prewarm-warm", warm, wall, peak, len(summary["failed"]),
+                                prewarm_seconds=round(prewarm_wall, 3), prewarmed_items=summary["items"])
+    return results
+
+
+def scenario_single(args) -> dict:
+    """The full pipeline for one ticker through main.main(), repeated."""
+    import main
+
+    def _run():
+        latencies = []
+        for i in range(args.repeat):
+            started = time.monotonic()
+            argv = ["main.py", f"ONE{i}", "--yahoo-rps", str(args.yahoo_rps), "--xai-rps", str(args.xai_rps)]
+            if args.hedge:
+                argv.append("--hedge")
+            argv += ["--editor-mode", args.editor_mode]
+            with mock.patch.object(sys, "argv", argv):
+                main.main()
+            latencies.append(time.monotonic() - started)
+        return latencies
+
+    latencies, wall, peak = _measure(_run)
+    return summarize("single", latencies, wall, peak)
+
+
+def scenario_batch(args) -> dict:
+    """A batch of --tickers names on --workers workers through main.run_batch()."""
+    import main
+
+    tickers = [f"BAT{i}" for i in range(args.tickers)]
+    summary, wall, peak = _measure(lambda: main.run_batch(tickers, workers=args.workers, editor_mode=args.editor_mode))
+    latencies = [r["duration_seconds"] for r in _batch_runs(summary)]
+    return summarize("batch", latencies, wall, peak, summary["failed"], workers=summary["workers"],
+                     cached_prompt_share=summary["llm_totals"].get("cached_prompt_share", 0))
+
+
+def _batch_runs(summary: dict) -> list:
+    # run_batch only keeps report paths; the per-ticker durations are in the metrics file
+    import main
+    runs = []
+    with open(main.METRICS_PATH, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["status"] == "succeeded" and record["ticker"] in summary["reports"]:
+                runs.append(record)
+    return runs
+
+
+def scenario_cache(args) -> dict:
+    """The same batch twice with the LLM cache enabled: cold (empty cache) then warm."""
+    import main
+    from agents.llm_cache import configure_llm_cache
+
+    configure_llm_cache(Path(tempfile.mkdtemp(prefix="bench-llm-cache-")) / "llm_cache.sqlite")
+    tickers = [f"CCH{i}" for i in range(args.cache_tickers)]
+    results = {}
+    for phase in ("cold", "warm"):
+        summary, wall, peak = _measure(lambda: main.run_batch(tickers, workers=args.workers))
+        latencies = [r["duration_seconds"] for r in _batch_runs(summary)][-len(tickers):]
+        results[phase] = summarize(f"cache-{phase}", latencies, wall, peak, summary["failed"],
+                                   llm_cache_hits=summary["llm_totals"].get("cache_hits", 0))
+    return results
+
+
+def scenario_screen(args) -> dict:
+    """
+    Loads a universe of --universe-size symbols into the memory-mapped store, runs the next day's
+    incremental update (a fresh store, as in the daily job), then times repeated screens over it.
+    """
+    import main
+    from agents.screener import UniverseStore
+
+    symbols = [f"UNI{i}" for i in range(args.universe_size)]
+    universe = UniverseStore(main.UNIVERSE_DIR)
+    loaded, wall, peak = _measure(lambda: universe.update(symbols, workers=args.workers))
+    results = {"load": summarize("screen-load", [wall], wall, peak, symbols=loaded["symbols"], days=loaded["days"])}
+
+    universe = UniverseStore(main.UNIVERSE_DIR)
+    updated, wall, peak = _measure(lambda: universe.update(workers=args.workers))
+    results["update"] = summarize("screen-update", [wall], wall, peak, rows_written=updated["rows_written"])
+
+    def _run():
+        latencies = []
+        for _ in range(args.screens):
+            started = time.monotonic()
+            universe.screen({"max_pe_vs_sector": 1.0, "max_beta": 1.5}, top=10)
+            latencies.append(time.monotonic() - started)
+        return latencies
+
+    latencies, wall, peak = _measure(_run)
+    results["screen"] = summarize("screen", latencies, wall, peak, disk_mb=universe.stats()["disk_mb"])
+    return results
+
+
+def scenario_startup(args) -> dict:
+    """Wall time of `python main.py --help` in fresh interpreters, checked against --startup-budget."""
+    command = [sys.executable, str(REPO_DIR / "main.py"), "--help"]
+
+    def _run():
+        latencies = []
+        for _ in range(args.startup_runs):
+            started = time.monotonic()
+            subprocess.run(command, cwd=REPO_DIR, check=True, stdout=subprocess.DEVNULL)
+            latencies.append(time.monotonic() - started)
+        return latencies
+
+    latencies, wall, peak = _measure(_run)
+    p95 = percentile(latencies, 95)
+    return summarize("startup", latencies, wall, peak, budget_seconds=args.startup_budget,
+                     over_budget=p95 > args.startup_budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks with fake yfinance and xAI backends")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--tickers", type=int, default=100, help="Batch size for the batch scenario (default: 100)")
+    parser.add_argument("--cache-tickers", type=int, default=20, help="Batch size for the cache scenario (default: 20)")
+    parser.add_argument("--scout-tickers", type=int, default=10, help="Tickers for the scout scenario (default: 10)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions of the single-ticker scenario (default: 3)")
+    parser.add_argument("--universe-size", type=int, default=2000,
+                        help="Symbols in the screen scenario's universe (default: 2000)")
+    parser.add_argument("--screens", type=int, default=20, help="Screens timed in the screen scenario (default: 20)")
+    parser.add_argument("--startup-runs", type=int, default=10, help="Interpreter starts for the startup scenario")
+    parser.add_argument("--startup-budget", type=float, default=DEFAULT_STARTUP_BUDGET,
+                        help=f"p95 seconds allowed for `main.py --help` (default: {DEFAULT_STARTUP_BUDGET})")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--yahoo-latency", type=float, default=0.05, help="Mean seconds per Yahoo request")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Mean seconds per LLM call")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Jitter as a fraction of the mean latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probability that a backend call fails")
+    parser.add_argument("--llm-tail-rate", type=float, default=0.0,
+                        help="Fraction of LLM calls that are --tail-factor times slower (default: 0)")
+    parser.add_argument("--tail-factor", type=float, default=10.0)
+    parser.add_argument("--hedge", action="store_true", help="Enable hedged LLM requests")
+    parser.add_argument("--editor-mode", choices=("llm", "assemble"), default="llm",
+                        help="How the single and batch scenarios build the final report (default: llm)")
+    parser.add_argument("--yahoo-rps", type=float, default=1000,
+                        help="Yahoo rate limit; high by default so orchestration, not the limiter, is measured")
+    parser.add_argument("--xai-rps", type=float, default=1000, help="xAI rate limit (default: 1000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # The pipeline logs every step; keep the benchmark output readable
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    yahoo = LatencyModel(args.yahoo_latency, args.yahoo_latency * args.jitter, args.failure_rate, args.seed)
+    llm = LatencyModel(args.llm_latency, args.llm_latency * args.jitter, args.failure_rate, args.seed + 1,
+                       tail_rate=args.llm_tail_rate, tail_factor=args.tail_factor)
+
+    from agents.ratelimit import configure_limiter
+    configure_limiter("yahoo", requests_per_second=args.yahoo_rps, initial_concurrency=args.workers * 4,
+                      max_concurrency=args.workers * 8)
+    configure_limiter("xai", requests_per_second=args.xai_rps, initial_concurrency=args.workers * 4,
+                      max_concurrency=args.workers * 8)
+    from agents.deadlines import configure_hedging
+    configure_hedging(enabled=args.hedge)
+
+    runners = {"scout": scenario_scout, "prewarm": scenario_prewarm, "single": scenario_single,
+               "batch": scenario_batch, "cache": scenario_cache, "screen": scenario_screen,
+               "startup": scenario_startup}
+    selected = SCENARIOS if args.scenario == "all" else (args.scenario,)
+
+    results = []
+    with fake_backends(yahoo, llm), tempfile.TemporaryDirectory(prefix="bench-") as tmp:
+        for name in selected:
+            with Workspace(Path(tmp) / name):
+                outcome = runners[name](args)
+            results.extend(outcome.values() if name in ("cache", "prewarm", "screen") else [outcome])
+
+    header = f"{'scenario':<12}{'runs':>6}{'fail':>6}{'p50 s':>9}{'p95 s':>9}{'wall s':>9}{'per s':>9}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['scenario']:<12}{r['runs']:>6}{r['failures']:>6}{r['p50_seconds']:>9.3f}{r['p95_seconds']:>9.3f}"
+              f"{r['wall_seconds']:>9.2f}{r['throughput_per_second']:>9.2f}{r['peak_memory_mb']:>9.1f}")
+    print(f"(backend calls: yahoo={yahoo.calls} failed={yahoo.failures}, llm={llm.calls} failed={llm.failures})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    over = [r for r in results if r.get("over_budget")]
+    for r in over:
+        logger.error(f"{r['scenario']}: p95 {r['p95_seconds']:.3f}s is over the {r['budget_seconds']}s budget")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,33 @@
 import os
+import re
 import json
+import time
 import logging
+import threading
 import argparse
 from pathlib import Path
 from datetime import datetime
-import requests_cache
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from dotenv import load_dotenv
-from agents.data_scout import DataScout
-from agents.workers import FundamentalAnalyst, SentimentAnalyst, PortfolioManager, Editor
+# Only light modules are imported here. yfinance/pandas, xai_sdk/grpc and dotenv are
+# loaded when a run needs them, so --help and argument errors return immediately.
+from agents.scheduler import StageGraph, StageError
+from agents.streaming import SectionStreamer
+from agents.checkpoint import CheckpointStore
+from agents.telemetry import RunMetrics, collect_metrics, append_jsonl
+from agents.ratelimit import configure_limiter, DEFAULT_LIMITS
+from agents.utils import close_client, configure_client, DEFAULT_CLIENT_TIMEOUT
+from agents.deadlines import configure_hedging
+from agents.llm_cache import configure_llm_cache, get_llm_cache
+from agents.peer_index import configure_peer_index, get_peer_index
+from agents.symbols import configure_symbol_directory
+from agents.results_store import configure_results_store, get_results_store
+from agents.refresh import DEFAULT_THRESHOLDS, snapshot_basis, plan_refresh, with_price_update
+from agents.market_store import (configure_market_store, get_market_store, CACHE_POLICIES,
+                                 DEFAULT_MAX_BYTES as MARKET_STORE_BYTES)
 
 # --- Configuration ---
-load_dotenv()
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("Orchestrator")
@@ -20,115 +36,738 @@ BASE_DIR = Path(__file__).resolve().parent
 RESULTS_DIR = BASE_DIR / "results"
 CACHE_DIR = BASE_DIR / ".cache"
 
-# Ensure cache dir exists for requests_cache
-CACHE_DIR.mkdir(parents=True, exist_ok=True)
+LLM_CACHE_PATH = CACHE_DIR / "llm_cache.sqlite"
+PEER_INDEX_PATH = CACHE_DIR / "peer_index.json"
+CHECKPOINT_DIR = CACHE_DIR / "checkpoints"
+# Run index with deduplicated metadata payloads (see agents.results_store)
+RESULTS_DB_PATH = RESULTS_DIR / "results.sqlite"
+# One JSON line per run, for rolling up performance across runs and batches
+METRICS_PATH = RESULTS_DIR / "metrics.jsonl"
 
-# Enable caching for yfinance
-requests_cache.install_cache(
-    str(CACHE_DIR / "yfinance_cache"), expire_after=3600)
+# Competitor sets barely move week to week
+DEFAULT_PEER_MAX_AGE_DAYS = 7
+
+# Batch runs are almost entirely network-bound, so threads are enough
+DEFAULT_WORKERS = 4
+
+# Known Yahoo symbols (name, exchange, sector, primary listing) used to screen peer candidates
+SYMBOLS_PATH = CACHE_DIR / "symbols.tsv"
+# Yahoo data with per-item freshness (see agents.market_store), shared by runs and --prewarm
+MARKET_CACHE_PATH = CACHE_DIR / "market_cache.sqlite"
+# Memory-mapped daily closes and quote fields of the screening universe (see agents.screener)
+UNIVERSE_DIR = CACHE_DIR / "universe"
+# Names a --screen hands on to the pipeline
+DEFAULT_SCREEN_TOP = 10
+
+
+class AnalysisError(Exception):
+    """Raised when the pipeline cannot produce a report for a ticker."""
 
 
 def sanitize_filename(name: str) -> str:
-    import re
     return re.sub(r'[^\w\-\.]', '_', name)
 
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Multi-Agent AI Equity Analyst")
-    parser.add_argument(
-        "ticker", nargs="?", help="Stock ticker symbol (e.g., AAPL, SAP.DE, 7203.T, etc.)")
-    args = parser.parse_args()
+def parse_tickers(values: list) -> list:
+    """Normalizes a list of raw ticker strings, splitting on commas/whitespace and deduplicating."""
+    tickers = []
+    seen = set()
+    for value in values:
+        for token in re.split(r'[,\s]+', value):
+            ticker = token.strip().upper()
+            if ticker and ticker not in seen:
+                seen.add(ticker)
+                tickers.append(ticker)
+    return tickers
 
-    # handle interactive mode if no arg provided
-    if args.ticker:
-        ticker = args.ticker.strip().upper()
-    else:
-        ticker = input(
-            "Enter a stock ticker symbol (e.g., AAPL, SAP.DE, 7203.T, etc.): ").strip().upper()
 
-    if not ticker:
-        logger.error("No ticker provided. Exiting.")
-        return
+def load_tickers_file(path: str) -> list:
+    """Reads tickers from a file (one or more per line, '#' starts a comment)."""
+    lines = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            lines.append(line.split("#", 1)[0])
+    return parse_tickers(lines)
+
+
+def parse_stage_deadlines(values: list) -> dict:
+    """Parses '--stage-deadline' values ('SECONDS' for every stage or 'STAGE=SECONDS') into stage -> seconds."""
+    deadlines = {}
+    for value in values or ():
+        stage, _, seconds = value.rpartition("=")
+        deadlines[stage.strip() or "*"] = float(seconds)
+    return deadlines
+
+
+def parse_cache_policies(values: list) -> dict:
+    """Parses '--cache-policy' values ('ITEM=FRESH[:STALE]', in minutes) into item -> (fresh, stale) seconds."""
+    policies = {}
+    for value in values or ():
+        item, _, minutes = value.partition("=")
+        fresh, _, stale = minutes.partition(":")
+        if item not in CACHE_POLICIES:
+            raise ValueError(f"unknown item '{item}'")
+        policies[item] = (float(fresh) * 60, float(stale or 0) * 60)
+        if min(policies[item]) < 0:
+            raise ValueError("periods must be >= 0")
+    return policies
+
+
+EDITOR_MODES = ("llm", "assemble")
+
+# Stage -> where its output is kept in a stored run
+STAGE_OUTPUTS = {
+    "management_tone": "intermediate_outputs.management_tone",
+    "fundamental": "intermediate_outputs.fundamental_analysis",
+    "sentiment": "intermediate_outputs.sentiment_analysis",
+    "pm_verdict": "intermediate_outputs.pm_verdict",
+    "editor": "report",
+}
+
+
+def load_previous_run(ticker: str):
+    """
+    The latest stored run of a ticker, reduced to what a refresh needs: its stage outputs, the input basis
+    they were produced from and when the analysis was made. None without a results store or a previous run.
+    """
+    store = get_results_store()
+    rows = store.latest([ticker]) if store is not None else []
+    if not rows:
+        return None
+    row = rows[0]
+    names = list(STAGE_OUTPUTS.values()) + ["refresh"] + [
+        f"raw_data_snapshot.{part}" for part in ("market_data", "financials", "news", "peer_data")]
+    run = store.load(row["id"], names=names)
+    refresh = run.get("refresh") or {}
+    outputs = {}
+    for stage, name in STAGE_OUTPUTS.items():
+        group, _, key = name.partition(".")
+        outputs[stage] = run.get(group, {}).get(key) if key else run.get(group)
+    return {
+        "run_id": row["id"],
+        "outputs": outputs,
+        "basis": refresh.get("basis") or snapshot_basis(run.get("raw_data_snapshot") or {}),
+        "analysis_timestamp": refresh.get("analysis_timestamp") or row["timestamp"],
+    }
+
+
+def analyze_ticker(ticker: str, stream: bool = False, echo: bool = False, resume: bool = False,
+                   metrics_file: Path = None, stage_deadlines: dict = None, run_deadline: float = None,
+                   json_metadata: bool = False, refresh: bool = False, refresh_thresholds: dict = None,
+                   editor_mode: str = "llm", edit_flagged: bool = False) -> dict:
+    """
+    Runs the full pipeline for one ticker as a stage graph and saves the results.
+    With stream=True every LLM stage is written to disk as tokens arrive (echo=True also prints the final report).
+    Every stage output is checkpointed; resume=True reloads the stages a previous, interrupted run finished.
+    Per-stage and per-LLM-call performance goes into the metadata and one line of the metrics JSONL file.
+    stage_deadlines maps stage name (or '*' for all stages) -> seconds; run_deadline bounds the whole run.
+    Metadata goes into the results store when one is configured, and into a JSON file next to the report
+    without one or with json_metadata=True.
+    With refresh=True the new data is diffed against the inputs of the ticker's last stored run, and only the
+    stages affected by material changes (see agents.refresh) run again; the others reuse their previous output.
+    editor_mode="assemble" builds the final report from the sections with a template (agents.assembler) instead
+    of an Editor LLM pass over the whole document; edit_flagged then sends only sections that look broken to the LLM.
+    Raises on failure so the caller decides how to isolate it.
+    """
+    from agents.data_scout import DataScout
+    from agents.workers import FundamentalAnalyst, SentimentAnalyst, PortfolioManager, Editor
 
     start_time = datetime.now()
     timestamp_str = start_time.strftime("%Y-%m-%d_%H-%M-%S")
 
+    safe_ticker = sanitize_filename(ticker)
+    base_filename = f"{safe_ticker}-{timestamp_str}"
+    # Changed to .md as it is markdown
+    report_path = RESULTS_DIR / f"{base_filename}.md"
+    meta_path = RESULTS_DIR / f"{base_filename}.json"
+
+    streamer = None
+    if stream:
+        streamer = SectionStreamer(RESULTS_DIR / f"{base_filename}.sections",
+                                   echo_stages=("editor",) if echo else ())
+
+    def stage_stream(stage: str, path: Path = None):
+        return streamer.open(stage, path) if streamer else nullcontext()
+
     logger.info(f"Starting analysis for {ticker}...")
 
-    # Ensure results directory exists
-    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    previous = load_previous_run(ticker) if refresh else None
+    if refresh and previous is None:
+        logger.info(f"No stored run of {ticker} to refresh, running the full pipeline.")
+    refresh_plan = {}
+    plan_lock = threading.Lock()
 
-    try:
-        # 1. Data Scout
-        logger.info("--- Step 1: Data Scout ---")
-        scout = DataScout(ticker)
-        raw_data = scout.gather_all()
+    def ensure_plan(scout):
+        # Computed by whichever stage sees the scout output first (the scout itself may come from a checkpoint)
+        with plan_lock:
+            if not refresh_plan:
+                available = {stage for stage, output in previous["outputs"].items() if output}
+                refresh_plan.update(plan_refresh(previous["basis"], snapshot_basis(scout), available,
+                                                 refresh_thresholds))
+                changes = "; ".join(refresh_plan["changes"].values()) or "no material changes"
+                logger.info(f"Refresh of {ticker}: {changes}. Re-running: {', '.join(refresh_plan['rerun']) or 'nothing'}")
+        return refresh_plan
+
+    def reusable(stage: str, func):
+        """Wraps a stage so that in refresh mode it returns its previous output unless the plan re-runs it."""
+        if previous is None:
+            return func
+
+        def _run(scout=None, **kwargs):
+            plan = ensure_plan(scout) if scout is not None else refresh_plan
+            if stage not in plan.get("reuse", ()):
+                return func(scout=scout, **kwargs) if scout is not None else func(**kwargs)
+            logger.info(f"[{ticker}] Reusing {stage} from run {previous['run_id']}")
+            return previous["outputs"][stage]
+        return _run
+
+    fund_analyst = FundamentalAnalyst(ticker)
+    sent_analyst = SentimentAnalyst(ticker)
+    pm = PortfolioManager(ticker)
+    editor = Editor(ticker)
 
+    def scout_stage():
+        logger.info(f"--- Data Scout ({ticker}) ---")
+        raw_data = DataScout(ticker).gather_all()
         if "error" in raw_data['market_data']:
-            logger.error(
-                f"Aborting: Could not retrieve market data for {ticker}. Error: {raw_data['market_data']['error']}")
-            return
+            raise AnalysisError(
+                f"Could not retrieve market data for {ticker}. Error: {raw_data['market_data']['error']}")
+        return raw_data
+
+    def management_tone_stage(scout=None):
+        logger.info(f"--- Management Tone Research ({ticker}) ---")
+        with stage_stream("management_tone") as on_token:
+            return sent_analyst.research_management_tone(on_token=on_token)
+
+    def fundamental_stage(scout):
+        logger.info(f"--- Fundamental Analyst ({ticker}) ---")
+        with stage_stream("fundamental") as on_token:
+            return fund_analyst.run(scout['financials'], scout['market_data'], scout['peer_data'],
+                                    metrics=scout.get('metrics'), on_token=on_token)
+
+    def sentiment_stage(scout, management_tone):
+        logger.info(f"--- Sentiment Analyst ({ticker}) ---")
+        with stage_stream("sentiment") as on_token:
+            return sent_analyst.run(scout['news'], scout['market_data'], management_context=management_tone,
+                                    on_token=on_token)
 
-        # 2. Fundamental Analysis
-        logger.info("--- Step 2: Fundamental Analyst ---")
-        fund_analyst = FundamentalAnalyst(ticker)
-        fund_report = fund_analyst.run(
-            raw_data['financials'], raw_data['market_data'], raw_data['peer_data'])
-
-        # 3. Sentiment Analysis
-        logger.info("--- Step 3: Sentiment Analyst ---")
-        sent_analyst = SentimentAnalyst(ticker)
-        sent_report = sent_analyst.run(
-            raw_data['news'], raw_data['market_data'])
-
-        # 4. Portfolio Manager
-        logger.info("--- Step 4: Portfolio Manager ---")
-        pm = PortfolioManager(ticker)
-        pm_verdict = pm.run(fund_report, sent_report, raw_data['market_data'])
-
-        # 5. Editor
-        logger.info("--- Step 5: Editor ---")
-        editor = Editor(ticker)
+    def pm_stage(scout, fundamental, sentiment):
+        logger.info(f"--- Portfolio Manager ({ticker}) ---")
+        with stage_stream("pm_verdict") as on_token:
+            return pm.run(fundamental, sentiment, scout['market_data'], metrics=scout.get('metrics'),
+                          on_token=on_token)
+
+    def editor_stage(fundamental, sentiment, pm_verdict):
+        logger.info(f"--- Editor ({ticker}) ---")
         sections = {
-            "Financial Deep Dive": fund_report,
-            "Qualitative & Catalyst Analysis": sent_report,
+            "Financial Deep Dive": fundamental,
+            "Qualitative & Catalyst Analysis": sentiment,
             "Executive Summary & Investment Verdict": pm_verdict
         }
-        final_report = editor.run(sections, date_str=start_time.strftime("%B %d, %Y"))
+        # The final report is streamed straight into its destination file
+        with stage_stream("editor", report_path) as on_token:
+            if editor_mode == "assemble":
+                return editor.assemble(sections, date_str=start_time.strftime("%B %d, %Y"),
+                                       edit_flagged=edit_flagged, on_token=on_token)
+            return editor.run(sections, date_str=start_time.strftime("%B %d, %Y"), on_token=on_token)
 
-        # Save Results
-        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
-        safe_ticker = sanitize_filename(ticker)
-        base_filename = f"{safe_ticker}-{timestamp_str}"
-        # Changed to .md as it is markdown
-        report_path = RESULTS_DIR / f"{base_filename}.md"
-        meta_path = RESULTS_DIR / f"{base_filename}.json"
+    # Stages start as soon as their inputs are ready, e.g. the management tone
+    # search overlaps the scout, and the Fundamental/Sentiment analysts run side by side
+    # Root stages fetch live data, so their checkpoints are only valid for the day
+    day = start_time.strftime("%Y-%m-%d")
+    stage_deadlines = stage_deadlines or {}
+    deadline = lambda stage: stage_deadlines.get(stage, stage_deadlines.get("*"))
+    graph = StageGraph(name=ticker, checkpoints=CheckpointStore(CHECKPOINT_DIR), resume=resume)
+    graph.add("scout", scout_stage, salt=day, deadline=deadline("scout"))
+    # In refresh mode the management tone waits for the scout, which decides whether it is needed at all
+    graph.add("management_tone", reusable("management_tone", management_tone_stage), salt=day,
+              inputs=("scout",) if previous else (), deadline=deadline("management_tone"))
+    graph.add("fundamental", reusable("fundamental", fundamental_stage), inputs=("scout",),
+              deadline=deadline("fundamental"))
+    graph.add("sentiment", reusable("sentiment", sentiment_stage), inputs=("scout", "management_tone"),
+              deadline=deadline("sentiment"))
+    graph.add("pm_verdict", reusable("pm_verdict", pm_stage), inputs=("scout", "fundamental", "sentiment"),
+              deadline=deadline("pm_verdict"))
+    # The editor mode is part of the checkpoint key, so switching modes never reloads the other mode's report
+    graph.add("editor", reusable("editor", editor_stage), inputs=("fundamental", "sentiment", "pm_verdict"),
+              salt=f"{day}:{editor_mode}{'+edit' if edit_flagged else ''}", deadline=deadline("editor"))
 
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write(final_report)
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    run_metrics = RunMetrics(ticker)
 
-        # Save Metadata (including intermediate steps for debugging)
-        metadata = {
+    def export_metrics(status: str):
+        append_jsonl(metrics_file or METRICS_PATH, {
             "ticker": ticker,
             "timestamp": timestamp_str,
+            "status": status,
             "duration_seconds": (datetime.now() - start_time).total_seconds(),
-            "data_source": "yfinance",
-            "intermediate_outputs": {
-                "fundamental_analysis": fund_report,
-                "sentiment_analysis": sent_report,
-                "pm_verdict": pm_verdict
-            },
-            "raw_data_snapshot": raw_data
+            "stage_seconds": {name: t["duration"] for name, t in graph.timings.items()},
+            "critical_path": graph.critical_path(),
+            **run_metrics.summary()
+        })
+
+    try:
+        with collect_metrics(run_metrics):
+            outputs = graph.run(deadline=run_deadline)
+    except KeyboardInterrupt:
+        # Stop in-flight generations instead of paying for the rest of them
+        if streamer:
+            streamer.abort.set()
+        raise
+    except StageError as e:
+        export_metrics("failed")
+        # Surface pipeline errors (e.g. missing market data) as-is
+        if isinstance(e.error, AnalysisError):
+            raise e.error
+        logger.warning(f"Finished stages of {ticker} are checkpointed; re-run with --resume to continue.")
+        raise
+
+    raw_data = outputs["scout"]
+    fund_report = outputs["fundamental"]
+    sent_report = outputs["sentiment"]
+    pm_verdict = outputs["pm_verdict"]
+    final_report = outputs["editor"]
+
+    # Record what the outputs are based on, so that a later --refresh can tell what changed
+    refresh_info = {"basis": snapshot_basis(raw_data), "analysis_timestamp": timestamp_str}
+    if previous is not None and refresh_plan:
+        refresh_info = {
+            "based_on_run": previous["run_id"],
+            "changes": refresh_plan["changes"],
+            "rerun": refresh_plan["rerun"],
+            "reused": refresh_plan["reuse"],
+            "basis": refresh_plan["basis"],
+            "analysis_timestamp": timestamp_str if refresh_plan["rerun"] else previous["analysis_timestamp"],
         }
+        if "editor" in refresh_plan["reuse"]:
+            final_report = with_price_update(final_report, raw_data["market_data"], refresh_plan["basis"]["price"],
+                                             start_time.strftime("%B %d, %Y"), refresh_info["analysis_timestamp"])
+
+    # Save Results
+    with open(report_path, "w", encoding="utf-8") as f:
+        f.write(final_report)
+
+    duration = (datetime.now() - start_time).total_seconds()
 
+    # Save Metadata (including intermediate steps for debugging)
+    metadata = {
+        "ticker": ticker,
+        "timestamp": timestamp_str,
+        "duration_seconds": duration,
+        "data_source": "yfinance",
+        "stage_timings": graph.timings,
+        "critical_path": graph.critical_path(),
+        "time_to_first_token": streamer.ttft if streamer else None,
+        "performance": run_metrics.to_dict(),
+        "intermediate_outputs": {
+            "fundamental_analysis": fund_report,
+            "sentiment_analysis": sent_report,
+            "pm_verdict": pm_verdict,
+            "management_tone": outputs["management_tone"]
+        },
+        "refresh": refresh_info,
+        "raw_data_snapshot": raw_data
+    }
+
+    store = get_results_store()
+    run_id = None
+    if store is not None:
+        run_id = store.save_run(ticker, timestamp_str, final_report, metadata, report_path=str(report_path))
+    if store is None or json_metadata:
         with open(meta_path, "w", encoding="utf-8") as f:
             json.dump(metadata, f, indent=2, default=str)
+    else:
+        meta_path = None
+
+    # Results are safely on disk, the checkpoints are no longer needed
+    graph.checkpoints.clear(ticker)
+    export_metrics("succeeded")
+
+    logger.info(f"Analysis Complete! Report saved to: {report_path} "
+                f"(critical path: {' -> '.join(metadata['critical_path'])})")
+
+    return {
+        "ticker": ticker,
+        "report_path": str(report_path),
+        "meta_path": str(meta_path) if meta_path else None,
+        "run_id": run_id,
+        "duration_seconds": duration,
+        "llm": metadata["performance"]["summary"]["llm"]
+    }
+
+
+def rollup_llm_totals(totals: list) -> dict:
+    """Sums the per-run LLM totals (calls, seconds, retries, tokens, cache hits) of a batch."""
+    rollup = {}
+    for run_totals in totals:
+        for key, value in run_totals.items():
+            if key != "cached_prompt_share":
+                rollup[key] = round(rollup.get(key, 0) + value, 3)
+    if rollup.get("prompt_tokens"):
+        rollup["cached_prompt_share"] = round(rollup.get("cached_prompt_text_tokens", 0) / rollup["prompt_tokens"], 3)
+    return rollup
+
+
+def run_batch(tickers: list, workers: int = DEFAULT_WORKERS, **options) -> dict:
+    """
+    Runs the pipeline for many tickers on a bounded thread pool.
+    A failing ticker is recorded and never stops the others. Options are passed on to analyze_ticker.
+    """
+    workers = max(1, min(workers, len(tickers)))
+    logger.info(f"Starting batch of {len(tickers)} tickers with {workers} workers...")
+
+    started = time.monotonic()
+    start_time = datetime.now()
+    completed = {}
+    failures = {}
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ticker") as pool:
+        futures = {pool.submit(analyze_ticker, ticker, **options): ticker for ticker in tickers}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                completed[ticker] = future.result()
+            except Exception as e:
+                logger.error(f"[{ticker}] Pipeline failed: {e}", exc_info=True)
+                failures[ticker] = f"{type(e).__name__}: {e}"
+            done = len(completed) + len(failures)
+            logger.info(f"Batch progress: {done}/{len(tickers)} ({len(failures)} failed)")
+
+    elapsed = time.monotonic() - started
+    durations = sorted(r["duration_seconds"] for r in completed.values())
+    summary = {
+        "started_at": start_time.strftime("%Y-%m-%d_%H-%M-%S"),
+        "workers": workers,
+        "total": len(tickers),
+        "succeeded": len(completed),
+        "failed": len(failures),
+        "wall_seconds": elapsed,
+        "tickers_per_minute": (len(completed) / elapsed * 60) if elapsed > 0 else 0.0,
+        "mean_ticker_seconds": (sum(durations) / len(durations)) if durations else None,
+        "max_ticker_seconds": durations[-1] if durations else None,
+        "llm_totals": rollup_llm_totals([r["llm"] for r in completed.values()]),
+        "market_store": get_market_store().stats(),
+        "failures": failures,
+        "reports": {t: r["report_path"] for t, r in completed.items()}
+    }
+
+    RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+    summary_path = RESULTS_DIR / f"batch-{summary['started_at']}.json"
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, default=str)
+
+    logger.info(
+        f"Batch complete: {summary['succeeded']}/{summary['total']} succeeded in {elapsed:.1f}s "
+        f"({summary['tickers_per_minute']:.2f} tickers/min). Summary saved to: {summary_path}")
+    for ticker, error in failures.items():
+        logger.warning(f"  FAILED {ticker}: {error}")
+
+    return summary
+
+
+def format_latest(rows: list) -> str:
+    """Plain-text table of the latest verdict per ticker (rows from ResultsStore.latest())."""
+    lines = [f"{'Ticker':<10}{'Date':<21}{'Rating':<13}{'Price':>11}{'Target':>11}{'Upside':>9}"]
+    for row in rows:
+        price, target = row["price"], row["target_price"]
+        upside = f"{(target / price - 1) * 100:+.1f}%" if price and target else "n/a"
+        lines.append(f"{row['ticker']:<10}{row['timestamp']:<21}{row['rating'] or 'n/a':<13}"
+                     f"{price if price is not None else 'n/a':>11}{target if target is not None else 'n/a':>11}{upside:>9}")
+    return "\n".join(lines)
+
+
+def import_results(store, directory: Path) -> int:
+    """Moves the per-run JSON metadata files of earlier versions into the results store index."""
+    imported = 0
+    for meta_path in sorted(directory.glob("*.json")):
+        if meta_path.name.startswith(("batch-", "screen-")):
+            continue
+        try:
+            store.import_file(str(meta_path))
+            imported += 1
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Skipped {meta_path.name}: {e}")
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Multi-Agent AI Equity Analyst")
+    parser.add_argument(
+        "tickers", nargs="*", metavar="ticker",
+        help="Stock ticker symbol(s) (e.g., AAPL, SAP.DE, 7203.T, etc.). More than one runs in batch mode.")
+    parser.add_argument(
+        "--tickers-file", help="File with tickers to analyze in batch mode (one or more per line, '#' for comments)")
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"Number of tickers analyzed concurrently in batch mode (default: {DEFAULT_WORKERS})")
+    parser.add_argument(
+        "--llm-cache", action="store_true",
+        help=f"Reuse LLM responses for identical prompts from an on-disk cache ({LLM_CACHE_PATH.name})")
+    parser.add_argument(
+        "--llm-cache-bypass", action="store_true",
+        help="With --llm-cache: ignore cached responses but store the fresh ones")
+    parser.add_argument(
+        "--llm-cache-max-mb", type=int, default=256,
+        help="With --llm-cache: size cap before least recently used responses are evicted (default: 256)")
+    parser.add_argument(
+        "--peer-max-age-days", type=float, default=DEFAULT_PEER_MAX_AGE_DAYS,
+        help=f"Age after which indexed peer sets are refreshed in the background (default: {DEFAULT_PEER_MAX_AGE_DAYS})")
+    parser.add_argument(
+        "--market-cache-mb", type=int, default=MARKET_STORE_BYTES // (1024 * 1024),
+        help="Memory cap of the in-process Yahoo data shared by all tickers of a run "
+             f"(default: {MARKET_STORE_BYTES // (1024 * 1024)})")
+    parser.add_argument(
+        "--cache-policy", action="append", metavar="ITEM=FRESH[:STALE]",
+        help="Minutes a Yahoo item stays fresh, then further minutes it may be served stale while it is "
+             f"refetched (repeatable; items: {', '.join(CACHE_POLICIES)}). E.g. info=120:60 keeps quotes "
+             "prewarmed hours before a run")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Stream LLM output to disk as it is generated (and the final report to stdout for a single ticker)")
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Reload stages finished by an interrupted run of the same ticker instead of re-running them")
+    parser.add_argument(
+        "--metrics-file", type=Path, default=METRICS_PATH,
+        help=f"JSONL file that receives one performance record per run (default: results/{METRICS_PATH.name})")
+    parser.add_argument(
+        "--yahoo-rps", type=float, default=DEFAULT_LIMITS["yahoo"]["requests_per_second"],
+        help="Requests per second to Yahoo Finance, shared by all workers")
+    parser.add_argument(
+        "--xai-rps", type=float, default=DEFAULT_LIMITS["xai"]["requests_per_second"],
+        help="Requests per second to xAI, shared by all workers")
+    parser.add_argument(
+        "--xai-tpm", type=float, default=DEFAULT_LIMITS["xai"]["tokens_per_minute"],
+        help="Tokens per minute to xAI, shared by all workers")
+    parser.add_argument(
+        "--stage-deadline", action="append", metavar="[STAGE=]SECONDS",
+        help="Cancel a stage running longer than this; without STAGE it applies to every stage (repeatable)")
+    parser.add_argument(
+        "--run-deadline", type=float, metavar="SECONDS",
+        help="Cancel a ticker's pipeline running longer than this")
+    parser.add_argument(
+        "--xai-timeout", type=float, default=DEFAULT_CLIENT_TIMEOUT,
+        help=f"Timeout of a single xAI request in seconds (default: {DEFAULT_CLIENT_TIMEOUT})")
+    parser.add_argument(
+        "--hedge", action="store_true",
+        help="Send a duplicate LLM request when one is slower than the usual p95 of its model and stage")
+    parser.add_argument(
+        "--hedge-min-samples", type=int, default=20,
+        help="With --hedge: calls observed per model and stage before hedging starts (default: 20)")
+    parser.add_argument(
+        "--prewarm", action="store_true",
+        help=f"Fetch the Yahoo data of the given tickers and their indexed peers into .cache/{MARKET_CACHE_PATH.name} "
+             "ahead of an analysis run, then exit. Quotes are only served for 15 minutes after a prewarm "
+             "(see --cache-policy)")
+    parser.add_argument(
+        "--update-universe", action="store_true",
+        help=f"Add the given tickers to the screening universe (.cache/{UNIVERSE_DIR.name}/) and load the latest "
+             "daily closes and quote fields of every symbol in it, then exit (run daily)")
+    parser.add_argument(
+        "--screen", action="store_true",
+        help="Rank the screening universe (or the given tickers of it) and analyze the top --screen-top names")
+    parser.add_argument(
+        "--screen-top", type=int, default=DEFAULT_SCREEN_TOP,
+        help=f"With --screen: number of names passed on to the pipeline (default: {DEFAULT_SCREEN_TOP})")
+    parser.add_argument(
+        "--screen-max-pe-vs-sector", type=float, metavar="RATIO",
+        help="With --screen: keep names whose P/E is at most this multiple of their sector's median P/E")
+    parser.add_argument(
+        "--screen-min-momentum-pct", type=float, metavar="PCT",
+        help="With --screen: keep names whose 6-month price change is at least this")
+    parser.add_argument(
+        "--screen-max-beta", type=float,
+        help="With --screen: keep names with at most this beta")
+    parser.add_argument(
+        "--latest", action="store_true",
+        help="Print the latest rating and target price of every stored ticker (or of the given tickers) and exit")
+    parser.add_argument(
+        "--import-results", action="store_true",
+        help="Index the JSON metadata files of earlier runs in results/ into the results store and exit")
+    parser.add_argument(
+        "--import-symbols", type=Path, metavar="CSV",
+        help="Load exchange listings (columns: symbol, name and optionally exchange, country, sector, industry, "
+             f"primary) into the symbol directory used to screen peer candidates (.cache/{SYMBOLS_PATH.name}) and exit")
+    parser.add_argument(
+        "--json-metadata", action="store_true",
+        help=f"Also write each run's metadata as a JSON file next to the report (it always goes into "
+             f"results/{RESULTS_DB_PATH.name})")
+    parser.add_argument(
+        "--editor-mode", choices=EDITOR_MODES, default="llm",
+        help="How the final report is put together: 'llm' has the Editor model rewrite the whole document, "
+             "'assemble' builds it from the sections with a template in milliseconds (default: llm)")
+    parser.add_argument(
+        "--edit-flagged", action="store_true",
+        help="With --editor-mode assemble: send sections that look broken (truncated, malformed tables, ...) "
+             "through a light LLM edit first")
+    parser.add_argument(
+        "--refresh", action="store_true",
+        help="Re-run only the stages whose inputs changed materially since the ticker's last stored run; "
+             "if nothing did, the previous report is reused with the current price")
+    parser.add_argument(
+        "--refresh-price-pct", type=float, default=DEFAULT_THRESHOLDS["price_pct"],
+        help=f"With --refresh: price move that re-runs the verdict (default: {DEFAULT_THRESHOLDS['price_pct']})")
+    parser.add_argument(
+        "--refresh-multiple-pct", type=float, default=DEFAULT_THRESHOLDS["multiple_pct"],
+        help="With --refresh: change of P/E, forward P/E or PEG that re-runs the fundamental analysis "
+             f"(default: {DEFAULT_THRESHOLDS['multiple_pct']})")
+    parser.add_argument(
+        "--refresh-new-headlines", type=int, default=DEFAULT_THRESHOLDS["new_headlines"],
+        help="With --refresh: new headlines that re-run the sentiment analysis "
+             f"(default: {DEFAULT_THRESHOLDS['new_headlines']})")
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="Run as a long-lived service that takes analysis jobs over a local HTTP API (see service.py)")
+    parser.add_argument("--host", default="127.0.0.1", help="With --serve: address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="With --serve: port to listen on (default: 8765)")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.screen_top < 1:
+        parser.error("--screen-top must be at least 1")
+    for flag in ("yahoo_rps", "xai_rps", "xai_tpm"):
+        if getattr(args, flag) <= 0:
+            parser.error(f"--{flag.replace('_', '-')} must be > 0")
+    try:
+        stage_deadlines = parse_stage_deadlines(args.stage_deadline)
+    except ValueError:
+        parser.error("--stage-deadline takes SECONDS or STAGE=SECONDS")
+    try:
+        cache_policies = parse_cache_policies(args.cache_policy)
+    except ValueError as e:
+        parser.error(f"--cache-policy takes ITEM=FRESH[:STALE] in minutes ({e})")
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    configure_limiter("yahoo", requests_per_second=args.yahoo_rps)
+    configure_limiter("xai", requests_per_second=args.xai_rps, tokens_per_minute=args.xai_tpm)
+    configure_peer_index(PEER_INDEX_PATH, max_age=args.peer_max_age_days * 24 * 3600)
+    symbols = configure_symbol_directory(SYMBOLS_PATH)
+    configure_market_store(max_bytes=args.market_cache_mb * 1024 * 1024, policies=cache_policies,
+                           path=MARKET_CACHE_PATH)
+    configure_client(timeout=args.xai_timeout)
+    configure_hedging(enabled=args.hedge, min_samples=args.hedge_min_samples)
+
+    if args.llm_cache:
+        configure_llm_cache(LLM_CACHE_PATH, max_bytes=args.llm_cache_max_mb * 1024 * 1024,
+                            bypass=args.llm_cache_bypass)
+
+    store = configure_results_store(RESULTS_DB_PATH)
+
+    tickers = parse_tickers(args.tickers)
+    if args.tickers_file:
+        tickers = parse_tickers(tickers + load_tickers_file(args.tickers_file))
+
+    run_options = {
+        "resume": args.resume,
+        "metrics_file": args.metrics_file,
+        "stage_deadlines": stage_deadlines,
+        "run_deadline": args.run_deadline,
+        "json_metadata": args.json_metadata,
+        "editor_mode": args.editor_mode,
+        "edit_flagged": args.edit_flagged,
+        "refresh": args.refresh,
+        "refresh_thresholds": {"price_pct": args.refresh_price_pct, "multiple_pct": args.refresh_multiple_pct,
+                               "new_headlines": args.refresh_new_headlines},
+    }
+
+    if args.import_symbols:
+        imported = symbols.import_csv(args.import_symbols)
+        symbols.flush()
+        logger.info(f"Imported {imported} symbols into {SYMBOLS_PATH} ({len(symbols)} known)")
+        return
+
+    if args.import_results:
+        imported = import_results(store, RESULTS_DIR)
+        logger.info(f"Indexed {imported} runs in {RESULTS_DB_PATH}: {store.stats()}")
+        return
+
+    if args.latest:
+        print(format_latest(store.latest(tickers)))
+        return
 
-        logger.info(f"Analysis Complete! Report saved to: {report_path}")
+    if args.prewarm:
+        if not tickers:
+            parser.error("--prewarm needs tickers or --tickers-file")
+        from agents.data_scout import prewarm, MAX_FETCH_WORKERS
+        summary = prewarm(tickers, workers=args.workers * MAX_FETCH_WORKERS)
+        logger.info(f"Prewarmed {summary['items']} items for {summary['symbols']} symbols in {summary['seconds']}s "
+                    f"({len(summary['failed'])} failed): {summary['market_store']}")
+        return
+
+    if args.update_universe:
+        from agents.screener import configure_universe
+        from agents.data_scout import MAX_FETCH_WORKERS
+        universe = configure_universe(UNIVERSE_DIR)
+        if not tickers and not len(universe):
+            parser.error("--update-universe needs tickers or --tickers-file to start the universe")
+        universe.update(tickers, workers=args.workers * MAX_FETCH_WORKERS)
+        logger.info(f"Screening universe: {universe.stats()}")
+        return
+
+    if args.screen:
+        from agents.screener import configure_universe, format_shortlist
+        universe = configure_universe(UNIVERSE_DIR)
+        if not len(universe):
+            parser.error("--screen needs a universe; load one with --update-universe first")
+        criteria = {
+            "max_pe_vs_sector": args.screen_max_pe_vs_sector,
+            "min_momentum": args.screen_min_momentum_pct / 100 if args.screen_min_momentum_pct is not None else None,
+            "max_beta": args.screen_max_beta,
+        }
+        shortlist = universe.screen(criteria, top=args.screen_top, symbols=tickers or None)
+        print(format_shortlist(shortlist))
+        RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        screen_path = RESULTS_DIR / f"screen-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json"
+        with open(screen_path, "w", encoding="utf-8") as f:
+            json.dump({"universe": universe.stats(), "criteria": criteria, "shortlist": shortlist}, f, indent=2)
+        logger.info(f"Shortlist of {len(shortlist)} saved to: {screen_path}")
+        if not shortlist:
+            logger.warning("No ticker passed the screen. Exiting.")
+            return
+        tickers = [row["symbol"] for row in shortlist]
+
+    if args.serve:
+        from service import serve
+        try:
+            # Jobs share this process' client, caches, peer index and limiters
+            serve(analyze_ticker, host=args.host, port=args.port, workers=args.workers,
+                  options=run_options)
+        finally:
+            get_peer_index().wait_for_refreshes()
+            close_client()
+        return
+
+    # handle interactive mode if no arg provided
+    if not tickers and not args.tickers_file:
+        tickers = parse_tickers([input(
+            "Enter a stock ticker symbol (e.g., AAPL, SAP.DE, 7203.T, etc.): ")])
+
+    if not tickers:
+        logger.error("No ticker provided. Exiting.")
+        return
+
+    try:
+        if len(tickers) > 1 or args.tickers_file:
+            run_batch(tickers, workers=args.workers, stream=args.stream, **run_options)
+            return
 
-    except Exception as e:
-        logger.error(f"Critical error in orchestration: {e}", exc_info=True)
+        try:
+            analyze_ticker(tickers[0], stream=args.stream, echo=args.stream, **run_options)
+        except AnalysisError as e:
+            logger.error(f"Aborting: {e}")
+        except Exception as e:
+            logger.error(f"Critical error in orchestration: {e}", exc_info=True)
+    finally:
+        # Let background peer refreshes land in the index before the client goes away
+        get_peer_index().wait_for_refreshes()
+        close_client()
+        if get_llm_cache() is not None:
+            logger.info(f"LLM cache stats: {get_llm_cache().stats()}")
+        logger.info(f"Market data store stats: {get_market_store().stats()}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,266 @@
+"""
+Long-running analysis service: a local HTTP API in front of a priority job queue and a shared worker pool.
+Started with `main.py --serve`. The xAI client, the LLM cache, the peer index, the rate limiters and the
+results store are process-wide, so they stay warm from one job to the next.
+
+    POST   /jobs             {"ticker": "AAPL", "priority": 5}  or  {"tickers": [...], "priority": 0}
+    GET    /jobs             all known jobs (?status=queued|running|succeeded|failed|cancelled)
+    GET    /jobs/<id>        status and, once finished, the result or error of one job
+    GET    /jobs/<id>/report the finished report as Markdown
+    DELETE /jobs/<id>        cancels a job that has not started yet
+    GET    /latest           latest verdict per ticker from the results store (?tickers=AAPL,MSFT)
+    GET    /health           queue depth, worker count and uptime
+"""
+import re
+import json
+import time
+import uuid
+import queue
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from agents.results_store import get_results_store
+
+logger = logging.getLogger("Service")
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Finished jobs kept for status queries; the results themselves live in the results store
+MAX_FINISHED_JOBS = 1000
+
+ACTIVE = ("queued", "running")
+
+
+class AnalysisService:
+    """
+    Runs analysis jobs on a fixed pool of worker threads, highest priority first (FIFO within a priority).
+    Submitting a ticker that is already queued or running returns the existing job.
+    run_job(ticker, **options) performs one analysis and returns a JSON-serializable result.
+    """
+
+    def __init__(self, run_job, workers: int = 4, options: dict = None):
+        self.run_job = run_job
+        self.workers = workers
+        self.options = dict(options or {})
+        self.started_at = time.time()
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._jobs = OrderedDict()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"service-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Analysis service started with {self.workers} workers.")
+
+    def stop(self, timeout: float = None):
+        """Stops taking jobs from the queue and waits for the running ones to finish."""
+        self._stopping.set()
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._order), None))
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, ticker: str, priority: int = 0) -> dict:
+        with self._lock:
+            existing = self._active.get(ticker)
+            if existing is not None:
+                return self._view(self._jobs[existing])
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "ticker": ticker,
+                "priority": priority,
+                "status": "queued",
+                "submitted_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            self._active[ticker] = job["id"]
+        # PriorityQueue pops the smallest entry first
+        self._queue.put((-priority, next(self._order), job["id"]))
+        logger.info(f"Queued {ticker} as job {job['id']} (priority {priority}).")
+        return self._view(job)
+
+    def cancel(self, job_id: str):
+        """Cancels a queued job. Returns the job, or None if it doesn't exist."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] == "queued":
+                job.update(status="cancelled", finished_at=time.time())
+                self._active.pop(job["ticker"], None)
+            return self._view(job) if job else None
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def list(self, status: str = None) -> list:
+        with self._lock:
+            return [self._view(j) for j in self._jobs.values() if status is None or j["status"] == status]
+
+    def health(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"workers": self.workers, "jobs": counts, "uptime_seconds": round(time.time() - self.started_at, 1)}
+
+    @staticmethod
+    def _view(job: dict) -> dict:
+        return dict(job)
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None or job["status"] != "queued":
+                    continue
+                job.update(status="running", started_at=time.time())
+            logger.info(f"Running job {job_id} ({job['ticker']}).")
+            try:
+                result = self.run_job(job["ticker"], **self.options)
+                update = {"status": "succeeded", "result": result}
+            except Exception as e:
+                logger.error(f"Job {job_id} ({job['ticker']}) failed: {e}", exc_info=True)
+                update = {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+            with self._lock:
+                job.update(finished_at=time.time(), **update)
+                self._active.pop(job["ticker"], None)
+                self._trim()
+
+    def _trim(self):
+        finished = [i for i, j in self._jobs.items() if j["status"] not in ACTIVE]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+def warm_up():
+    """Imports the data and agent layers and opens the xAI client before the first job arrives."""
+    started = time.monotonic()
+    import agents.data_scout  # noqa: F401 (yfinance, pandas)
+    import agents.workers  # noqa: F401 (xai_sdk)
+    from agents.utils import get_client
+    try:
+        get_client()
+    except ValueError as e:
+        logger.warning(f"xAI client not created: {e}")
+    logger.info(f"Warmed up in {time.monotonic() - started:.2f}s.")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        data = (json.dumps(body, default=str) if content_type == "application/json" else body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str):
+        self._send(status, {"error": message})
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        return parts, parse_qs(url.query)
+
+    def do_GET(self):
+        parts, query = self._route()
+        if parts == ["health"]:
+            return self._send(200, self.service.health())
+        if parts == ["jobs"]:
+            return self._send(200, self.service.list(query.get("status", [None])[0]))
+        if parts == ["latest"]:
+            store = get_results_store()
+            if store is None:
+                return self._error(404, "No results store configured")
+            tickers = [t.strip().upper() for v in query.get("tickers", []) for t in v.split(",") if t.strip()]
+            return self._send(200, store.latest(tickers))
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._error(404, f"Unknown job {parts[1]}")
+            if len(parts) == 2:
+                return self._send(200, job)
+            if parts[2] == "report":
+                if job["status"] != "succeeded":
+                    return self._error(409, f"Job is {job['status']}")
+                try:
+                    with open(job["result"]["report_path"], "r", encoding="utf-8") as f:
+                        report = f.read()
+                except OSError as e:
+                    return self._error(410, f"Report is no longer available: {e}")
+                return self._send(200, report, content_type="text/markdown")
+        self._error(404, "Not found")
+
+    def do_POST(self):
+        parts, _ = self._route()
+        if parts != ["jobs"]:
+            return self._error(404, "Not found")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            tickers = payload.get("tickers") or [payload.get("ticker")]
+            if isinstance(tickers, str):
+                # "AAPL,MSFT" or "AAPL MSFT", split like the command line (main.parse_tickers)
+                tickers = re.split(r"[,\s]+", tickers)
+            if not isinstance(tickers, list):
+                raise ValueError("'tickers' must be a list or a comma-separated string")
+            tickers = [str(t).strip().upper() for t in tickers if t and str(t).strip()]
+            priority = int(payload.get("priority", 0))
+        except (ValueError, AttributeError) as e:
+            return self._error(400, f"Invalid request: {e}")
+        if not tickers:
+            return self._error(400, "Provide 'ticker' or 'tickers'")
+        jobs = [self.service.submit(t, priority) for t in tickers]
+        self._send(202, jobs if "tickers" in payload else jobs[0])
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._error(404, "Not found")
+        job = self.service.cancel(parts[1])
+        if job is None:
+            return self._error(404, f"Unknown job {parts[1]}")
+        if job["status"] != "cancelled":
+            return self._error(409, f"Job is {job['status']}")
+        self._send(200, job)
+
+
+def serve(run_job, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, workers: int = 4, options: dict = None):
+    """Runs the service until interrupted. options are passed to run_job with every ticker."""
+    warm_up()
+    service = AnalysisService(run_job, workers=workers, options=options)
+    service.start()
+    handler = type("Handler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"Listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down; waiting for running jobs...")
+    finally:
+        server.server_close()
+        service.stop()
@@ -0,0 +1,30 @@
+import unittest
+
+from agents.market_store import MarketStore
+from agents.telemetry import RunMetrics, collect_metrics
+
+
+class MarketStoreTelemetryTest(unittest.TestCase):
+    def test_cold_get_records_a_miss_and_warm_get_a_hit(self):
+        store = MarketStore()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            return {"currentPrice": 100.0}
+
+        cold, warm = RunMetrics("cold"), RunMetrics("warm")
+        with collect_metrics(cold):
+            store.get("AAPL", "info", fetch)
+        with collect_metrics(warm):
+            store.get("AAPL", "info", fetch)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([f["cache"] for f in cold.fetches], ["miss"])
+        self.assertEqual([f["cache"] for f in warm.fetches], ["hit"])
+        self.assertEqual(cold.summary()["fetches"]["yahoo"]["cache_misses"], 1)
+        self.assertEqual(warm.summary()["fetches"]["yahoo"]["cache_hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()